@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # modules that only register signal receivers
+        from . import dispatch, events, inventory, menu, metrics, rollups, search, stats, unread  # noqa: F401
+        from .replicas import check_shared_cache
+        check_shared_cache()
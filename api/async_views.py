@@ -0,0 +1,226 @@
+import math
+from abc import ABC, abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .conditional import add_validators, afingerprint, not_modified, validators
+from .unread import aunread_count
+
+RENDERER = JSONRenderer()
+
+
+class AsyncReadView(ABC):
+    """
+    A native async GET in front of one of the router's viewset views.
+
+    DRF views are sync, so under ASGI every request to one is handed to a
+    worker thread for its whole length. These views serve the hottest reads
+    on the event loop instead and only the queries go through Django's async
+    ORM, while the token check, the viewset's permission classes, its
+    get_queryset() scoping and its serializer are the same as the sync path.
+    Anything else on the URL (other methods, query parameters the view
+    doesn't know, the browsable API) goes to the viewset's own view, as
+    does everything when settings.ASYNC_READ_VIEWS is False.
+    """
+    native_params = ()  # query parameters the native path understands
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    @classmethod
+    def as_view(cls, fallback):
+        """`fallback` is the router's view for the same URL, e.g. the callback of 'merchant-list'."""
+        async_fallback = sync_to_async(fallback)
+
+        async def view(request, *args, **kwargs):
+            self = cls(fallback)
+            if not self.serves(request):
+                return await async_fallback(request, *args, **kwargs)
+            return await self.dispatch(request, *args, **kwargs)
+        return csrf_exempt(view)
+
+    def serves(self, request):
+        if not getattr(settings, 'ASYNC_READ_VIEWS', True):
+            return False
+        accept = request.headers.get('Accept', '*/*')
+        return (request.method == 'GET' and set(request.GET) <= set(self.native_params)
+                and 'text/html' not in accept
+                and any(media in accept for media in ('application/json', 'application/*', '*/*')))
+
+    def viewset(self, request, args, kwargs):
+        """The viewset instance DRF would have handled the request with, set up the way its as_view() does."""
+        view = self.fallback.cls(**self.fallback.initkwargs)
+        view.action_map = self.fallback.actions
+        for method, action in view.action_map.items():
+            setattr(view, method, getattr(view, action))
+        if hasattr(view, 'get') and not hasattr(view, 'head'):
+            view.head = view.get
+        view.request, view.args, view.kwargs = request, args, kwargs
+        view.action = view.action_map.get(request.method.lower())
+        view.format_kwarg = None
+        view.headers = view.default_response_headers
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        view = self.viewset(request, args, kwargs)
+        # the DRF Request the viewset's filters, permissions and serializers expect; it authenticates lazily
+        view.request = drf_request = view.initialize_request(request, *args, **kwargs)
+        if not self.forced(request) and not all(hasattr(authenticator, 'aauthenticate')
+                                                for authenticator in drf_request.authenticators):
+            return await sync_to_async(self.fallback)(request, *args, **kwargs)
+        try:
+            await self.authenticate(drf_request)
+            self.check_permissions(drf_request, view)
+            response = await self.respond(drf_request, view, **kwargs)
+        except exceptions.APIException as exc:
+            response = self.error_response(drf_request, view, exc)
+        headers = dict(view.headers)
+        vary = headers.pop('Vary', None)
+        for name, value in headers.items():
+            response[name] = value
+        if vary is not None:
+            patch_vary_headers(response, [vary])
+        return response
+
+    @abstractmethod
+    async def respond(self, request, view, **kwargs):
+        """The response to an authenticated and permitted GET; `request` is the DRF Request."""
+
+    async def authenticate(self, request):
+        """
+        Set request.user and request.auth the way DRF's lazy authentication
+        would, but awaiting the token check. DRF's setters put the user on the
+        Django request too, for the metrics and replica routing.
+        """
+        if self.forced(request._request):
+            request._authenticate()  # DRF's own, with ForcedAuthentication, which needs no I/O
+            return
+        request.user, request.auth = AnonymousUser(), None
+        for authenticator in request.authenticators:
+            authenticated = await authenticator.aauthenticate(request._request)
+            if authenticated is not None:
+                request.user, request.auth = authenticated
+                return
+
+    def forced(self, request):
+        """Whether the test client forced the credentials, which DRF's Request honours over the authenticators."""
+        return getattr(request, '_force_auth_user', None) is not None or getattr(request, '_force_auth_token', None) is not None
+
+    def check_permissions(self, request, view):
+        for permission in view.get_permissions():
+            if not permission.has_permission(request, view):
+                self.permission_denied(request, permission)
+
+    def check_object_permissions(self, request, view, obj):
+        for permission in view.get_permissions():
+            if not permission.has_object_permission(request, view, obj):
+                self.permission_denied(request, permission)
+
+    def permission_denied(self, request, permission):
+        if not request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        raise exceptions.PermissionDenied(getattr(permission, 'message', None), getattr(permission, 'code', None))
+
+    def error_response(self, request, view, exc):
+        """The response DRF's exception handler gives `exc`."""
+        auth_header = None
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            auth_header = view.get_authenticate_header(request)
+            if auth_header is None:
+                exc.status_code = 403
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = self.render(request, view, data, exc.status_code)
+        if auth_header is not None:
+            response['WWW-Authenticate'] = auth_header
+        return response
+
+    def render(self, request, view, data, status=200):
+        """`data` as JSON, in the Response the viewset would have returned, rendered here rather than by the view."""
+        response = Response(data, status=status)
+        response.accepted_renderer, response.accepted_media_type = RENDERER, RENDERER.media_type
+        response.renderer_context = {'view': view, 'request': request, 'response': response}
+        return response.render()
+
+
+class AsyncCatalogList(AsyncReadView):
+    """
+    A ConditionalGetMixin viewset's list, through its filter backends as
+    conditional_list() reads it: a 304 for a matching If-None-Match, else
+    PageNumberPagination's page and envelope, counted by the fingerprint
+    query itself.
+    """
+    native_params = ('page',)
+
+    async def respond(self, request, view, **kwargs):
+        queryset = view.filter_queryset(view.get_queryset())
+        rows, latest = await afingerprint(queryset, view.conditional_fields)
+        etag, last_modified = validators(request, RENDERER.media_type, rows, latest)
+        response = not_modified(request, etag, None)  # lists only answer If-None-Match
+        if response is None:
+            response = self.render(request, view, await self.page(request, view, queryset, rows))
+        return add_validators(response, etag, last_modified)
+
+    async def page(self, request, view, queryset, count):
+        paginator = view.paginator
+        if paginator is None:
+            return view.get_serializer([obj async for obj in queryset], many=True).data
+        param, size = paginator.page_query_param, paginator.page_size
+        pages = max(math.ceil(count / size), 1)
+        requested = request.GET.get(param) or 1
+        # the checks, and messages, of Django's Paginator.validate_number()
+        try:
+            number = pages if requested in paginator.last_page_strings else int(requested)
+        except (TypeError, ValueError):
+            self.invalid_page(paginator, requested, 'That page number is not an integer')
+        if number < 1:
+            self.invalid_page(paginator, requested, 'That page number is less than 1')
+        if number > pages:
+            self.invalid_page(paginator, requested, 'That page contains no results')
+
+        rows = [obj async for obj in queryset[(number - 1) * size:number * size]]
+        url = request.build_absolute_uri()
+        if number == 1:
+            previous = None
+        elif number == 2:
+            previous = remove_query_param(url, param)
+        else:
+            previous = replace_query_param(url, param, number - 1)
+        return {
+            'count': count,
+            'next': replace_query_param(url, param, number + 1) if number < pages else None,
+            'previous': previous,
+            'results': view.get_serializer(rows, many=True).data,
+        }
+
+    def invalid_page(self, paginator, requested, message):
+        raise exceptions.NotFound(paginator.invalid_page_message.format(page_number=requested, message=message))
+
+
+class AsyncDetail(AsyncReadView):
+    """A viewset's retrieve: one aget() of its filtered get_queryset(), prefetches and all, as get_object() does."""
+
+    async def respond(self, request, view, **kwargs):
+        queryset = view.filter_queryset(view.get_queryset())
+        lookup = view.lookup_url_kwarg or view.lookup_field
+        try:
+            obj = await queryset.aget(**{view.lookup_field: kwargs[lookup]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise exceptions.NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+        self.check_object_permissions(request, view, obj)
+        return self.render(request, view, view.get_serializer(obj).data)
+
+
+class AsyncUnreadCount(AsyncReadView):
+    """NotificationViewSet.unread_count, from the cache or the counter row."""
+
+    async def respond(self, request, view, **kwargs):
+        return self.render(request, view, {'unread_count': await aunread_count(request.user.pk)})
@@ -0,0 +1,94 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User, TokenUser, token_version_key
+
+TOKEN_VERSION_CLAIM = 'ver'
+MISSING = -1  # cached for users that are gone or inactive
+
+
+def add_claims(token, user):
+    """Sign what permissions and get_queryset need into the token."""
+    token['role'] = user.role
+    token['status'] = user.status
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+    return token
+
+
+def current_token_version(user_id):
+    """
+    The user's token_version, cached for AUTH_VERSION_CACHE_TIMEOUT seconds; None if inactive or deleted.
+
+    Read from the primary, so a revocation a replica hasn't seen yet isn't cached away.
+    """
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = (User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id, is_active=True)
+                   .values_list('token_version', flat=True).first())
+        version = MISSING if version is None else version
+        cache.set(key, version, getattr(settings, 'AUTH_VERSION_CACHE_TIMEOUT', 60))
+    return None if version == MISSING else version
+
+
+async def acurrent_token_version(user_id):
+    """
+    current_token_version() for async views; only a cache miss leaves the event loop.
+
+    The cache is called through its sync API: Django's cache backends have no
+    async I/O yet (their a*() methods run the sync call in a worker thread),
+    and the hop to that thread costs more than a hit.
+    """
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = await (User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id, is_active=True)
+                         .values_list('token_version', flat=True).afirst())
+        version = MISSING if version is None else version
+        cache.set(key, version, getattr(settings, 'AUTH_VERSION_CACHE_TIMEOUT', 60))
+    return None if version == MISSING else version
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request User lookup.
+
+    The user is rebuilt from the token's signed id, role and status claims
+    (a TokenUser), and the token is only checked against the user's cached
+    token_version, which changes whenever role, status or is_active do.
+    Tokens issued before these claims existed fall back to loading the row.
+    """
+
+    def get_user(self, validated_token):
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        return self.claims_user(validated_token, current_token_version(user_id))
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views, on a plain Django request: (user, token) or None, or the same errors."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            return await sync_to_async(super().get_user)(validated_token), validated_token
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        return self.claims_user(validated_token, await acurrent_token_version(user_id)), validated_token
+
+    def claims_user(self, validated_token, version):
+        if version is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if version != validated_token[TOKEN_VERSION_CLAIM]:
+            raise AuthenticationFailed(_('Token is no longer valid for this user'), code='token_revoked')
+        return TokenUser.from_claims(validated_token[api_settings.USER_ID_CLAIM], validated_token['role'],
+                                     validated_token['status'], version)
@@ -0,0 +1,90 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def fingerprint_aggregates(fields):
+    return {'rows': Count('pk'), **{f'latest_{field}': Max(field) for field in fields}}
+
+
+def fingerprint(queryset, fields=('updated_at',)):
+    """
+    (row count, [latest value of each of `fields`]) of a queryset, in one aggregate query.
+
+    An edit moves a latest timestamp, a new row moves the timestamp and the
+    count, and a deleted row moves the count, so any change to the rows a
+    listing selects changes its fingerprint without loading one of them.
+    """
+    values = queryset.aggregate(**fingerprint_aggregates(fields))
+    return values['rows'], [values[f'latest_{field}'] for field in fields]
+
+
+async def afingerprint(queryset, fields=('updated_at',)):
+    values = await queryset.aaggregate(**fingerprint_aggregates(fields))
+    return values['rows'], [values[f'latest_{field}'] for field in fields]
+
+
+def make_etag(request, media_type, rows, latest):
+    """A strong ETag over the fingerprint and everything else the representation depends on."""
+    key = repr((request.get_full_path(), request.user.pk, media_type,
+                rows, [value.isoformat() if value is not None else None for value in latest]))
+    return f'"{hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def validators(request, media_type, rows, latest):
+    """(ETag, Last-Modified timestamp or None) of a representation."""
+    present = [value for value in latest if value is not None]
+    last_modified = int(max(present).timestamp()) if present else None  # HTTP dates are whole seconds
+    return make_etag(request, media_type, rows, latest), last_modified
+
+
+def not_modified(request, etag, last_modified):
+    """The 304 (or 412) the request's own validators call for, or None to respond in full."""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def add_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag and Last-Modified validators on a viewset's list and retrieve.
+
+    A list is validated against fingerprint() of its filtered queryset and
+    an object against its own `conditional_fields`, so a client polling
+    with If-None-Match gets a 304 before any page is fetched or serialized.
+    Responses are `private, no-cache`: clients keep them but revalidate
+    each time, and shared caches don't mix up users.
+    """
+    # timestamps that move whenever the representation can change; annotations are fine
+    conditional_fields = ('updated_at',)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional(request, 1, [getattr(instance, field) for field in self.conditional_fields],
+                                lambda: Response(self.get_serializer(instance).data))
+
+    def conditional_list(self, request, respond):
+        rows, latest = fingerprint(self.filter_queryset(self.get_queryset()), self.conditional_fields)
+        # the newest timestamp can't tell that a row was deleted, so lists
+        # only answer If-None-Match; Last-Modified is still sent
+        return self.conditional(request, rows, latest, respond, modified_since=False)
+
+    def conditional(self, request, rows, latest, respond, modified_since=True):
+        """`respond()`, unless the request's validators show the client already has it."""
+        etag, last_modified = validators(request, request.accepted_renderer.media_type, rows, latest)
+        response = not_modified(request, etag, last_modified if modified_since else None) or respond()
+        return add_validators(response, etag, last_modified)
@@ -0,0 +1,238 @@
+import math
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import CourierLocation, Merchant, Notification, Order
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.195
+# a courier carrying an order in any other status is busy
+FINISHED_STATUSES = ('delivered', 'cancelled')
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class CourierGrid:
+    """
+    In-memory spatial index of the couriers free to take an order.
+
+    Positions are bucketed into square cells of `cell_degrees`, so a ping
+    is a couple of dict/set operations whatever the fleet size. nearest()
+    searches rings of cells outwards from the pickup point and stops once no
+    unvisited ring can hold anyone closer than the best match so far.
+    Longitudes are not wrapped at the antimeridian.
+    """
+
+    def __init__(self, cell_degrees=0.01):
+        self.cell_degrees = cell_degrees
+        self._cells = defaultdict(set)
+        self._positions = {}  # courier id -> (latitude, longitude, cell)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, courier_id):
+        return courier_id in self._positions
+
+    def cell(self, latitude, longitude):
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def update(self, courier_id, latitude, longitude, only_if_present=False):
+        """Add or move a courier. With only_if_present, couriers not in the index (busy ones) stay out."""
+        cell = self.cell(latitude, longitude)
+        with self._lock:
+            previous = self._positions.get(courier_id)
+            if previous is None and only_if_present:
+                return
+            if previous is not None and previous[2] != cell:
+                self._discard(courier_id, previous[2])
+            self._positions[courier_id] = (latitude, longitude, cell)
+            self._cells[cell].add(courier_id)
+
+    def remove(self, courier_id):
+        with self._lock:
+            previous = self._positions.pop(courier_id, None)
+            if previous is not None:
+                self._discard(courier_id, previous[2])
+
+    def _discard(self, courier_id, cell):
+        members = self._cells[cell]
+        members.discard(courier_id)
+        if not members:
+            del self._cells[cell]
+
+    def nearest(self, latitude, longitude, max_km, exclude=()):
+        """(distance_km, courier_id) of the closest courier within max_km, or None."""
+        row, col = self.cell(latitude, longitude)
+        # the shortest side of a cell here: east-west sides shrink towards the poles
+        cell_km = self.cell_degrees * KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)
+        best = None
+        with self._lock:
+            for ring in range(int(max_km / cell_km) + 2):
+                # everything in this ring is at least ring - 1 whole cells away
+                if best is not None and best[0] <= (ring - 1) * cell_km:
+                    break
+                for cell in self._ring(row, col, ring):
+                    for courier_id in self._cells.get(cell, ()):
+                        if courier_id in exclude:
+                            continue
+                        courier_latitude, courier_longitude, _ = self._positions[courier_id]
+                        distance = distance_km(latitude, longitude, courier_latitude, courier_longitude)
+                        if distance <= max_km and (best is None or distance < best[0]):
+                            best = (distance, courier_id)
+        return best
+
+    @staticmethod
+    def _ring(row, col, ring):
+        if ring == 0:
+            yield row, col
+            return
+        for offset in range(-ring, ring + 1):
+            yield row - ring, col + offset
+            yield row + ring, col + offset
+        for offset in range(-ring + 1, ring):
+            yield row + offset, col - ring
+            yield row + offset, col + ring
+
+
+def active_deliveries(courier_id):
+    """The orders a courier is carrying; `courier_id` may be an OuterRef."""
+    return Order.objects.filter(courier_id=courier_id).exclude(status__in=FINISHED_STATUSES)
+
+
+def free_couriers():
+    """CourierLocation rows of the couriers on duty and not carrying an order."""
+    return CourierLocation.objects.filter(on_duty=True).exclude(Exists(active_deliveries(OuterRef('pk'))))
+
+
+_grid = None
+_grid_lock = threading.Lock()
+
+
+def get_grid():
+    """This process's index, loaded from free_couriers() on first use."""
+    global _grid
+    if _grid is None:
+        with _grid_lock:
+            if _grid is None:
+                grid = CourierGrid(getattr(settings, 'DISPATCH_CELL_DEGREES', 0.01))
+                for courier_id, latitude, longitude in (free_couriers()
+                                                        .values_list('courier_id', 'latitude', 'longitude')
+                                                        .iterator()):
+                    grid.update(courier_id, latitude, longitude)
+                _grid = grid
+    return _grid
+
+
+def max_distance_km():
+    return getattr(settings, 'DISPATCH_MAX_DISTANCE_KM', 15)
+
+
+def record_ping(courier_id, latitude, longitude, on_duty=None):
+    """
+    Store a courier's position and move them in the index.
+
+    `on_duty` switches them on or off duty; when it's left out their row
+    keeps its flag. Whether they are free is read back every time, so a busy
+    courier keeps moving without becoming assignable, and one whose order
+    ended on another process (whose release only reached its own index)
+    rejoins this one with their next ping.
+    """
+    fields = {'latitude': latitude, 'longitude': longitude, 'updated_at': timezone.now()}
+    if on_duty is not None:
+        fields['on_duty'] = on_duty
+    if not CourierLocation.objects.filter(pk=courier_id).update(**fields):
+        CourierLocation.objects.create(courier_id=courier_id, **fields)
+    free = on_duty is not False and free_couriers().filter(pk=courier_id).exists()
+
+    def update_index():
+        grid = get_grid()
+        if free:
+            grid.update(courier_id, latitude, longitude)
+        else:
+            grid.remove(courier_id)
+    transaction.on_commit(update_index)
+
+
+def assign_courier(order_id, latitude, longitude, max_km=None, attempts=5):
+    """
+    Give an unassigned order the nearest free courier to (latitude, longitude).
+
+    The index only proposes candidates: each one is claimed under a lock on
+    their CourierLocation row and only if they are still on duty with no
+    active order, so two processes can never hand the same courier two
+    orders. Returns the courier id, or None when nobody is in range.
+    """
+    grid = get_grid()
+    max_km = max_km or max_distance_km()
+    tried = set()
+    for _ in range(attempts):
+        found = grid.nearest(latitude, longitude, max_km, exclude=tried)
+        if found is None:
+            return None
+        courier_id = found[1]
+        tried.add(courier_id)
+        with transaction.atomic():
+            # the lock queues rival claims, so the busy check below sees their orders
+            on_duty = CourierLocation.objects.select_for_update().filter(pk=courier_id, on_duty=True).exists()
+            if not on_duty or active_deliveries(courier_id).exists():
+                grid.remove(courier_id)  # taken by another process, or went off duty
+                continue
+            if not Order.objects.filter(pk=order_id, courier__isnull=True).update(courier_id=courier_id):
+                transaction.set_rollback(True)  # assigned by hand in the meantime
+                return None
+            Notification.objects.create(recipient_id=courier_id, message=f"You have been assigned order #{order_id}.")
+        grid.remove(courier_id)
+        return courier_id
+    return None
+
+
+def dispatch_order(order_id, merchant_id, location=None):
+    """assign_courier() from the merchant's pickup point; merchants without coordinates are skipped."""
+    if location is None:
+        location = Merchant.objects.filter(pk=merchant_id).values_list('latitude', 'longitude').first()
+    if location is None or None in location:
+        return None
+    return assign_courier(order_id, *location)
+
+
+def release_courier(courier_id, using=None):
+    """
+    Put a courier back in the index once an order of theirs is over.
+
+    Only if they are still on duty and carry no other order; whether they
+    are busy follows from their orders, so there is nothing to write.
+    """
+    def update_index():
+        location = free_couriers().using(using).filter(pk=courier_id).values_list('latitude', 'longitude').first()
+        if location is not None:
+            get_grid().update(courier_id, *location)
+    transaction.on_commit(update_index, using=using)
+
+
+@receiver(post_save, sender=Order)
+def dispatch_on_status_change(sender, instance, created, raw=False, using=None, **kwargs):
+    change = getattr(instance, '_status_change', None)
+    if created or raw or change is None:
+        return
+    if instance.status == 'preparing' and instance.courier_id is None:
+        # the merchant is usually select_related by the view changing the status
+        merchant = instance.merchant if Order.merchant.is_cached(instance) else None
+        location = (merchant.latitude, merchant.longitude) if merchant is not None else None
+        order_id, merchant_id = instance.pk, instance.merchant_id
+        transaction.on_commit(lambda: dispatch_order(order_id, merchant_id, location), using=using)
+    elif instance.status in ('delivered', 'cancelled') and instance.courier_id:
+        release_courier(instance.courier_id, using)
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Order, Notification
+from .signals import notifications_created
+
+
+class InProcessBroker:
+    """
+    Pub/sub between the request threads that change data and the SSE streams
+    open in this process.
+
+    Every subscriber gets a bounded asyncio.Queue on its own event loop;
+    publish() may be called from any thread. A slow client drops its oldest
+    events instead of growing without limit. Swap it for a shared broker
+    (Redis, ...) with the EVENT_BROKER setting; a replacement only needs the
+    same publish() / subscribe() / subscriber_count() methods.
+    """
+    max_queued = 100
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                pass  # the subscriber's loop is gone, it unsubscribes on its way out
+
+    @staticmethod
+    def _offer(queue, event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def subscribe(self, *channels):
+        """`async with broker.subscribe(channel) as queue:` receives the channels' events on `queue`."""
+        return _Subscription(self, channels)
+
+    def _add(self, channels, entry):
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(entry)
+
+    def _remove(self, channels, entry):
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].discard(entry)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({entry for entries in self._subscribers.values() for entry in entries})
+
+
+class _Subscription:
+    # A plain class rather than an @asynccontextmanager generator: when a
+    # client disconnects, the stream generator holding it may be finalized by
+    # the garbage collector, and a nested generator can be closed first.
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.entry = None
+
+    async def __aenter__(self):
+        self.entry = (asyncio.get_running_loop(), asyncio.Queue(self.broker.max_queued))
+        self.broker._add(self.channels, self.entry)
+        return self.entry[1]
+
+    async def __aexit__(self, *exc_info):
+        self.broker._remove(self.channels, self.entry)
+        return False
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'EVENT_BROKER', 'api.events.InProcessBroker'))()
+    return _broker
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def publish_after_commit(user_ids, event, using=None):
+    """Publish to every user once the transaction commits, so clients never see rolled back changes."""
+    channels = [user_channel(user_id) for user_id in dict.fromkeys(user_ids) if user_id]
+
+    def publish():
+        broker = get_broker()
+        for channel in channels:
+            broker.publish(channel, event)
+    transaction.on_commit(publish, using=using)
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def notification_event(notification):
+    return {
+        'type': 'notification',
+        'id': notification.pk,
+        'message': notification.message,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+@receiver(post_save, sender=Order)
+def publish_order_status(sender, instance, created, raw=False, using=None, **kwargs):
+    change = getattr(instance, '_status_change', None)
+    if created or raw or change is None:
+        return
+    previous_status, vendor_id = change
+    publish_after_commit([instance.customer_id, instance.courier_id, vendor_id], {
+        'type': 'order_status',
+        'order': instance.pk,
+        'previous_status': previous_status,
+        'status': instance.status,
+    }, using=using)
+
+
+@receiver(post_save, sender=Notification)
+def publish_notification(sender, instance, created, raw=False, using=None, **kwargs):
+    if created and not raw:
+        publish_after_commit([instance.recipient_id], notification_event(instance), using=using)
+
+
+@receiver(notifications_created)
+def publish_bulk_notifications(sender, notifications, using=None, **kwargs):
+    for notification in notifications:
+        publish_after_commit([notification.recipient_id], notification_event(notification), using=using)
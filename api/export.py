@@ -0,0 +1,138 @@
+import csv
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+class Echo:
+    """A file-like object csv.writer can write to that just hands each line back."""
+    def write(self, value):
+        return value
+
+
+def cell(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def after(ordering, last):
+    """Q for the rows past `last`, the `ordering` values of the previous batch's final row."""
+    fields = list(zip(ordering, last))
+    field, value = fields[-1]
+    condition = Q(**{f'{field}__gt': value})
+    for field, value in reversed(fields[:-1]):
+        condition = Q(**{f'{field}__gt': value}) | Q(**{field: value}) & condition
+    return condition
+
+
+class KeysetBatches:
+    """
+    `size`-row batches of `queryset`, as values_list() rows of `paths`, in `ordering`.
+
+    Each batch is its own LIMITed query starting past the last row of the one
+    before, so no more than `size` rows are ever held, on the server or in the
+    client: MySQL's client library buffers a whole result set, server-side
+    cursors or not. `ordering` must be ascending fields that together are
+    unique, e.g. ('created_at', 'id'); the values of those not exported are
+    fetched after `paths` and dropped from the rows handed out.
+    """
+
+    def __init__(self, queryset, paths, ordering, size):
+        extra = [field for field in ordering if field not in paths]
+        self.queryset = queryset.order_by(*ordering).values_list(*paths, *extra)
+        self.width = len(paths)
+        self.keys = [paths.index(field) if field in paths else self.width + extra.index(field) for field in ordering]
+        self.ordering, self.size = ordering, size
+
+    def query(self, last):
+        queryset = self.queryset if last is None else self.queryset.filter(after(self.ordering, last))
+        return queryset[:self.size]
+
+    def advance(self, rows):
+        """The `last` the batch after `rows` starts from, or None when `rows` was the final one."""
+        if len(rows) < self.size:
+            return None
+        return [rows[-1][key] for key in self.keys]
+
+    def __iter__(self):
+        last = None
+        while True:
+            rows = list(self.query(last))
+            if rows:
+                yield [row[:self.width] for row in rows]
+            last = self.advance(rows)
+            if last is None:
+                return
+
+    async def __aiter__(self):
+        last = None
+        while True:
+            rows = [row async for row in self.query(last)]
+            if rows:
+                yield [row[:self.width] for row in rows]
+            last = self.advance(rows)
+            if last is None:
+                return
+
+
+def renderer(names, output):
+    """(header line, function rendering one row) of `output`."""
+    if output == 'csv':
+        writer = csv.writer(Echo())
+
+        def render(row):
+            return writer.writerow([cell(value) for value in row])
+        return writer.writerow(names), render
+    encoder = DjangoJSONEncoder()
+
+    def render(row):
+        return encoder.encode({name: cell(value) for name, value in zip(names, row)}) + '\n'
+    return '', render
+
+
+def export_lines(queryset, columns, ordering, output='csv', size=None):
+    """
+    Yield `queryset` as CSV or NDJSON, one chunk per `size` rows.
+
+    `columns` maps the exported column names to values_list() paths. Rows
+    are read in KeysetBatches along `ordering` and each batch is rendered
+    and handed to the response before the next is read, so memory stays
+    flat however many rows there are.
+    """
+    header, render = renderer(list(columns), output)
+    if header:
+        yield header
+    for rows in KeysetBatches(queryset, list(columns.values()), ordering, size or chunk_size()):
+        yield ''.join(render(row) for row in rows)
+
+
+async def aexport_lines(queryset, columns, ordering, output='csv', size=None):
+    """export_lines() for ASGI, which would read a sync iterator to the end before sending any of it."""
+    header, render = renderer(list(columns), output)
+    if header:
+        yield header
+    async for rows in KeysetBatches(queryset, list(columns.values()), ordering, size or chunk_size()):
+        yield ''.join(render(row) for row in rows)
+
+
+def export_response(request, queryset, columns, ordering, output, name, size=None):
+    """A StreamingHttpResponse downloading the export as `<name>-<today>.<output>`, async under ASGI."""
+    lines = aexport_lines if isinstance(getattr(request, '_request', request), ASGIRequest) else export_lines
+    response = StreamingHttpResponse(lines(queryset, columns, ordering, output, size), content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="{name}-{timezone.localdate():%Y%m%d}.{output}"'
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,223 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Order, Product, ProductStockShard, StockReservation
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id, quantity):
+        super().__init__(f'Not enough stock of product {product_id} for {quantity}')
+        self.product_id = product_id
+        self.quantity = quantity
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+
+
+class LostRace(Exception):
+    """A conditional UPDATE matched no row: another buyer got to the stock first."""
+
+
+def take_stock(product_id, quantity, attempts=None):
+    """
+    Take `quantity` off a product without reading it first.
+
+    Each take is a single `UPDATE ... SET stock = stock - n WHERE stock >= n`,
+    so concurrent buyers can never oversell and nobody holds a lock across a
+    read-modify-write. Sharded products are served from a random shard that
+    can cover the quantity, else from several shards at once; a take that
+    loses a race re-reads the shards and tries again, up to `attempts` times.
+    Returns [(shard, quantity taken from it)], shard None for the product row.
+    """
+    attempts = attempts or getattr(settings, 'STOCK_TAKE_ATTEMPTS', 3)
+    for _ in range(attempts):
+        stock = dict(ProductStockShard.objects.filter(product_id=product_id).values_list('shard', 'stock'))
+        if not stock:
+            if Product.objects.filter(pk=product_id, stock__gte=quantity) \
+                    .update(stock=F('stock') - quantity, updated_at=timezone.now()):
+                return [(None, quantity)]
+            raise OutOfStock(product_id, quantity)
+        if sum(stock.values()) < quantity:
+            raise OutOfStock(product_id, quantity)
+
+        whole = [shard for shard, left in stock.items() if left >= quantity]
+        random.shuffle(whole)
+        for shard in whole:
+            if take_from_shard(product_id, shard, quantity):
+                return [(shard, quantity)]
+        if whole:
+            continue  # each one that could was emptied under us; see what is left
+        try:
+            return split_take(product_id, quantity, stock)
+        except LostRace:
+            continue
+    raise OutOfStock(product_id, quantity)
+
+
+def take_from_shard(product_id, shard, quantity):
+    return ProductStockShard.objects.filter(product_id=product_id, shard=shard, stock__gte=quantity) \
+        .update(stock=F('stock') - quantity)
+
+
+def split_take(product_id, quantity, stock):
+    """
+    Take `quantity` from several shards, all or none, going by the `stock` last read.
+
+    Shards are taken in shard order so two split takes of a product lock
+    them in the same order and can't deadlock.
+    """
+    pieces = []
+    with transaction.atomic():
+        for shard in sorted(stock):
+            piece = min(stock[shard], quantity - sum(taken for _, taken in pieces))
+            if piece <= 0:
+                continue
+            if not take_from_shard(product_id, shard, piece):
+                raise LostRace
+            pieces.append((shard, piece))
+    return pieces
+
+
+def return_stock(product_id, quantity, shard=None):
+    # a shard unshard_stock() has folded away already went back to Product.stock
+    if shard is None or not ProductStockShard.objects.filter(product_id=product_id, shard=shard) \
+            .update(stock=F('stock') + quantity):
+        Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity, updated_at=timezone.now())
+
+
+def reserve(product_id, quantity, order=None):
+    """Hold stock for a checkout; it goes back to the shelf unless committed before it expires."""
+    return reserve_order(order, [(product_id, quantity)])
+
+
+def reserve_order(order, lines):
+    """
+    Reserve every (product_id, quantity) line of an order, all or nothing.
+
+    Lines are taken in product id order so two carts sharing products always
+    lock them in the same order and can't deadlock. A line taken from several
+    shards gets a reservation per shard.
+    """
+    expires_at = timezone.now() + reservation_ttl()
+    reservations = []
+    with transaction.atomic():
+        for product_id, quantity in sorted(lines):
+            for shard, taken in take_stock(product_id, quantity):
+                reservations.append(StockReservation(
+                    product_id=product_id, order=order, quantity=taken, shard=shard, expires_at=expires_at))
+        StockReservation.objects.bulk_create(reservations)
+    return reservations
+
+
+def release(reservations, statuses=('held',)):
+    """Return the stock of the given reservations. Returns how many were released."""
+    released = 0
+    for reservation in reservations:
+        with transaction.atomic():
+            # flipping the status first makes a second release of the same row a no-op
+            if StockReservation.objects.filter(pk=reservation.pk, status__in=statuses).update(status='released'):
+                return_stock(reservation.product_id, reservation.quantity, reservation.shard)
+                released += 1
+    return released
+
+
+def release_order(order_id):
+    """The order was cancelled: put everything it took back, held or already sold."""
+    return release(StockReservation.objects.filter(order_id=order_id, status__in=('held', 'committed')),
+                   statuses=('held', 'committed'))
+
+
+def release_expired(batch_size=500, now=None):
+    """
+    Settle held reservations past their expiry. Returns (released, cancelled orders).
+
+    Holds whose order moved past 'pending' were sold and become 'committed';
+    this happens here rather than on every status change so confirming an order
+    costs no extra query. Holds of orders still pending are abandoned checkouts:
+    the order is cancelled and its stock returned, see cancel_abandoned().
+    """
+    now = now or timezone.now()
+    released = cancelled = 0
+    while True:
+        batch = list(StockReservation.objects
+                     .filter(status='held', expires_at__lte=now)
+                     .values('pk', 'product_id', 'quantity', 'shard', 'order_id', 'order__status')
+                     .order_by('expires_at', 'id')[:batch_size])
+        if not batch:
+            return released, cancelled
+
+        sold = [row['pk'] for row in batch if row['order__status'] not in (None, 'pending')]
+        StockReservation.objects.filter(pk__in=sold, status='held').update(status='committed')
+
+        # holds without an order have nobody to confirm them
+        released += release([StockReservation(pk=row['pk'], product_id=row['product_id'],
+                                               quantity=row['quantity'], shard=row['shard'])
+                             for row in batch if row['order_id'] is None])
+        order_ids = {row['order_id'] for row in batch if row['order_id'] and row['order__status'] == 'pending'}
+        for order_id in sorted(order_ids):
+            returned = cancel_abandoned(order_id)
+            if returned is not None:
+                released += returned
+                cancelled += 1
+
+
+def cancel_abandoned(order_id):
+    """
+    Cancel an order still pending and return its held stock; None if it was confirmed meanwhile.
+
+    The order row is locked while it is checked and cancelled, so a vendor
+    confirming it either lands first, and its holds stay to be committed on
+    the next pass, or waits for the cancellation; stock never goes back for
+    an order that was sold.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(pk=order_id, status='pending').first()
+        if order is None:
+            return None
+        returned = release(StockReservation.objects.filter(order_id=order_id, status='held'))
+        order.status = 'cancelled'
+        order.save(update_fields=['status'])
+    return returned
+
+
+def shard_stock(product_id, shards):
+    """Spread a product's stock over `shards` counters; its Product.stock becomes 0."""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+        existing = ProductStockShard.objects.select_for_update().filter(product_id=product_id)
+        total = product.stock + (existing.aggregate(total=Sum('stock'))['total'] or 0)
+        existing.delete()
+        ProductStockShard.objects.bulk_create(
+            ProductStockShard(product_id=product_id, shard=i, stock=total // shards + (i < total % shards))
+            for i in range(shards)
+        )
+        Product.objects.filter(pk=product_id).update(stock=0, updated_at=timezone.now())
+
+
+def unshard_stock(product_id):
+    """Fold a product's shards back into Product.stock."""
+    with transaction.atomic():
+        shards = ProductStockShard.objects.select_for_update().filter(product_id=product_id)
+        total = shards.aggregate(total=Sum('stock'))['total'] or 0
+        shards.delete()
+        Product.objects.filter(pk=product_id).update(stock=F('stock') + total, updated_at=timezone.now())
+
+
+def available_stock(product_id):
+    sharded = ProductStockShard.objects.filter(product_id=product_id).aggregate(total=Sum('stock'))['total'] or 0
+    return Product.objects.filter(pk=product_id).values_list('stock', flat=True).get() + sharded
+
+
+@receiver(post_save, sender=Order)
+def release_cancelled_order(sender, instance, created, raw=False, **kwargs):
+    change = getattr(instance, '_status_change', None)
+    if not created and not raw and change is not None and instance.status == 'cancelled':
+        release_order(instance.pk)
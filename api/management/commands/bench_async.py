@@ -0,0 +1,103 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from api.models import Order, Product
+from api.serializers import EmailTokenObtainPairSerializer
+
+API_ROOT = '/api/v1/'
+# (name, path); {order} is filled in with an order of the customer benchmarked as
+CASES = [
+    ('merchant list', 'merchants/'),
+    ('product list', 'products/'),
+    ('order detail', 'orders/{order}/'),
+    ('unread count', 'notifications/unread_count/'),
+]
+MODES = {'sync': False, 'native': True}  # -> settings.ASYNC_READ_VIEWS
+
+
+class Command(BaseCommand):
+    help = ('Fire concurrent GETs at the natively async read endpoints through the ASGI application '
+            'in this process, once served by the DRF viewsets (ASYNC_READ_VIEWS off) and once '
+            'natively, and compare throughput and p50/p95/p99 latency. Run it against seeded data '
+            '(see seed_data) in a file or server database; nothing is written.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='timed requests per endpoint and mode')
+        parser.add_argument('--concurrency', type=int, default=50, help='requests in flight at once')
+        parser.add_argument('--endpoint', action='append', default=[], help='only endpoints containing this text')
+
+    def handle(self, *args, **options):
+        order = Order.objects.filter(customer__is_active=True).order_by('-id').select_related('customer').first()
+        if order is None or not Product.objects.exists():
+            raise CommandError('No orders or products to benchmark with; run seed_data first')
+        token = str(EmailTokenObtainPairSerializer.get_token(order.customer).access_token)
+        cases = [(name, path.format(order=order.pk)) for name, path in CASES
+                 if not options['endpoint'] or any(text in name for text in options['endpoint'])]
+        self.stdout.write(f"{options['requests']} requests per endpoint, {options['concurrency']} in flight, "
+                          f'as customer {order.customer_id}')
+
+        for name, path in cases:
+            results = {}
+            for mode, native in MODES.items():
+                with override_settings(ASYNC_READ_VIEWS=native):
+                    results[mode] = asyncio.run(self.run(path, token, options['requests'], options['concurrency']))
+            self.report(name, results)
+
+    async def run(self, path, token, requests, concurrency):
+        """Latencies (ms) and wall-clock seconds of `requests` GETs of `path`, `concurrency` at a time."""
+        from fooddeliveryapp.asgi import application
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': API_ROOT + path, 'raw_path': (API_ROOT + path).encode(),
+            'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            'headers': [(b'host', b'localhost'), (b'accept', b'application/json'),
+                        (b'authorization', f'Bearer {token}'.encode())],
+        }
+        statuses = set()
+
+        async def get():
+            request_sent = False
+
+            async def receive():
+                nonlocal request_sent
+                if not request_sent:
+                    request_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await asyncio.Event().wait()  # never disconnects
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.add(message['status'])
+
+            start = time.perf_counter()
+            await application(dict(scope), receive, send)
+            return (time.perf_counter() - start) * 1000
+
+        limit = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with limit:
+                return await get()
+
+        await asyncio.gather(*(get() for _ in range(min(concurrency, requests))))  # warm up threads and connections
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(limited() for _ in range(requests)))
+        wall = time.perf_counter() - started
+        if statuses != {200}:
+            raise CommandError(f'{path} answered {sorted(statuses)}; expected only 200s')
+        return {'timings': sorted(timings), 'wall': wall}
+
+    def report(self, name, results):
+        line = f'{name:<14}'
+        for mode, result in results.items():
+            timings = result['timings']
+            p95, p99 = (statistics.quantiles(timings, n=100)[i] for i in (94, 98))
+            line += (f"  {mode} {len(timings) / result['wall']:7.1f} req/s"
+                     f"  p50 {statistics.median(timings):7.2f}  p95 {p95:7.2f}  p99 {p99:7.2f} ms")
+        sync, native = (len(results[mode]['timings']) / results[mode]['wall'] for mode in MODES)
+        self.stdout.write(f'{line}  x{native / sync:.2f}')
@@ -0,0 +1,65 @@
+import statistics
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from api.authentication import ClaimsJWTAuthentication
+from api.models import User, Merchant, Order, token_version_key
+from api.serializers import EmailTokenObtainPairSerializer
+from api.unread import cache_key as unread_cache_key
+from api.views import NotificationViewSet, OrderViewSet
+
+
+class Command(BaseCommand):
+    help = ('Compare per-request latency and queries of JWTAuthentication, which loads the '
+            'User row, with the claims-based fast path. Everything is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=20)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        with transaction.atomic():
+            tag = uuid.uuid4().hex
+            vendor = User.objects.create_user(email=f'bench-{tag}-vendor@example.com', name='Vendor', phone='0', role='vendor')
+            customer = User.objects.create_user(email=f'bench-{tag}-customer@example.com', name='Customer', phone='0')
+            merchant = Merchant.objects.create(user=vendor, name='Bench', city='Bench')
+            Order.objects.bulk_create(Order(customer=customer, merchant=merchant) for _ in range(options['orders']))
+            token = str(EmailTokenObtainPairSerializer.get_token(vendor).access_token)
+            factory = APIRequestFactory()
+
+            endpoints = [
+                ('unread badge', NotificationViewSet, {'get': 'unread_count'}, '/api/v1/notifications/unread_count/'),
+                ('order list', OrderViewSet, {'get': 'list'}, '/api/v1/orders/'),
+            ]
+            for label, viewset, actions, url in endpoints:
+                for auth in (JWTAuthentication, ClaimsJWTAuthentication):
+                    view = viewset.as_view(actions, authentication_classes=[auth])
+
+                    def fetch():
+                        request = factory.get(url, HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {token}')
+                        start = time.perf_counter()
+                        response = view(request)
+                        response.render()
+                        elapsed = time.perf_counter() - start
+                        assert response.status_code == 200, response.content
+                        return elapsed
+
+                    fetch()  # warm up the caches
+                    with CaptureQueriesContext(connection) as queries:
+                        fetch()
+                    timings = [fetch() for _ in range(repeat)]
+                    self.stdout.write(f'{label:<13} {auth.__name__:<24} {len(queries):2d} queries'
+                                      f'   median {statistics.median(timings) * 1000:7.3f} ms'
+                                      f'   p95 {sorted(timings)[int(len(timings) * 0.95)] * 1000:7.3f} ms')
+
+            cache.delete_many([token_version_key(vendor.pk), unread_cache_key(vendor.pk)])
+            transaction.set_rollback(True)
@@ -0,0 +1,77 @@
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import User, Merchant, Category, Product
+from api.views import OrderViewSet, OrderItemViewSet
+
+
+class Command(BaseCommand):
+    help = ('Place the same carts through POST /orders/ + one POST /order-items/ per line and '
+            'through POST /orders/checkout/, and compare latency and queries per order. '
+            'Everything is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--lines', type=int, default=5, help='cart lines per order')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        create_order = OrderViewSet.as_view({'post': 'create'})
+        create_item = OrderItemViewSet.as_view({'post': 'create'})
+        checkout = OrderViewSet.as_view({'post': 'checkout'}, **OrderViewSet.checkout.kwargs)
+
+        def post(view, path, user, data):
+            request = factory.post(path, data, format='json', HTTP_HOST='localhost')
+            force_authenticate(request, user=user)
+            response = view(request)
+            assert response.status_code == 201, response.data
+            return response
+
+        with transaction.atomic():
+            tag = uuid.uuid4().hex
+            admin = User.objects.create_user(email=f'admin-{tag}@example.com', name='Admin', phone='0', role='admin')
+            customer = User.objects.create_user(email=f'customer-{tag}@example.com', name='Customer', phone='0')
+            merchant = Merchant.objects.create(user=admin, name='Bench Kitchen', city='Bench')
+            category = Category.objects.create(merchant=merchant, name='Mains')
+            products = [Product.objects.create(category=category, name=f'Dish {i}', price=7.25, stock=10 ** 6)
+                        for i in range(options['lines'])]
+
+            def multi_request():
+                order = post(create_order, '/api/v1/orders/', admin,
+                             {'customer': customer.pk, 'merchant': merchant.pk}).data
+                for product in products:
+                    post(create_item, '/api/v1/order-items/', admin,
+                         {'order': order['id'], 'product': product.pk, 'quantity': 2, 'price': str(product.price)})
+                return 1 + len(products)
+
+            def single_request():
+                post(checkout, '/api/v1/orders/checkout/', customer, {
+                    'merchant': merchant.pk,
+                    'items': [{'product': p.pk, 'quantity': 2, 'price': str(p.price)} for p in products],
+                })
+                return 1
+
+            for label, place_order in (('orders + order-items', multi_request), ('checkout', single_request)):
+                timings, requests = [], 0
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for _ in range(options['orders']):
+                        start = time.perf_counter()
+                        requests += place_order()
+                        timings.append(time.perf_counter() - start)
+                    elapsed = time.perf_counter() - started
+                timings.sort()
+                self.stdout.write(
+                    f'{label:<22} {options["orders"] / elapsed:8.1f} orders/s'
+                    f'   p50 {statistics.median(timings) * 1000:7.2f} ms'
+                    f'   p95 {timings[int(len(timings) * 0.95) - 1] * 1000:7.2f} ms'
+                    f'   requests/order {requests / options["orders"]:4.1f}'
+                    f'   queries/order {len(queries) / options["orders"]:5.1f}')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,116 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.models import User, Product
+from api.serializers import EmailTokenObtainPairSerializer
+
+API_ROOT = '/api/v1/'
+# (name, path, params); detail paths are filled in with the first id the list returns
+CASES = [
+    ('merchant list', 'merchants/', {}),
+    ('merchant detail', 'merchants/{pk}/', {}),
+    ('merchants priced', 'merchants/', {'lat': 25.2, 'lng': 55.27, 'ordering': 'eta'}),
+    ('category list', 'categories/', {}),
+    ('category detail', 'categories/{pk}/', {}),
+    ('product list', 'products/', {}),
+    ('product detail', 'products/{pk}/', {}),
+    ('products search', 'products/', {'search': 'chicken'}),
+]
+
+
+class Command(BaseCommand):
+    help = ('Poll the catalog endpoints the way a client refreshing a menu does: each is fetched '
+            '--repeat times unconditionally and --repeat times revalidating its last ETag with '
+            'If-None-Match, and the median latency and CPU time, queries and bytes per poll are '
+            'compared. --change-every edits a product every N polls so some revalidations miss. '
+            'Run it against seeded data (see seed_data).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=100, help='polls per endpoint and mode')
+        parser.add_argument('--role', default='admin')
+        parser.add_argument('--change-every', type=int, default=0, help='edit a product every N polls; 0 never')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(role=options['role'], is_active=True).order_by('pk').first()
+        if user is None:
+            raise CommandError(f"No active {options['role']} to benchmark as; run seed_data first")
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {EmailTokenObtainPairSerializer.get_token(user).access_token}')
+
+        totals = {mode: {'cpu_ms': 0.0, 'bytes': 0} for mode in ('plain', 'conditional')}
+        # the edits are rolled back; requests come from the test client, whatever hosts the deployment allows
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            product = Product.objects.order_by('pk').first()
+            for name, path, params in self.cases(client):
+                results = {mode: self.poll(client, path, params, options['repeat'], options['change_every'], product,
+                                           conditional=mode == 'conditional')
+                           for mode in totals}
+                for mode, result in results.items():
+                    totals[mode]['cpu_ms'] += result['cpu_ms']
+                    totals[mode]['bytes'] += result['bytes']
+                self.report(name, results)
+            transaction.set_rollback(True)
+
+        plain, conditional = totals['plain'], totals['conditional']
+        self.stdout.write(self.style.SUCCESS(
+            f"Revalidating saved {self.saved(plain['bytes'], conditional['bytes']):.1f}% of the bytes "
+            f"and {self.saved(plain['cpu_ms'], conditional['cpu_ms']):.1f}% of the CPU time"))
+
+    def cases(self, client):
+        first_pk = {}
+        for name, path, params in CASES:
+            if '{pk}' not in path:
+                yield name, path, params
+                continue
+            list_path = path.replace('{pk}/', '')
+            if list_path not in first_pk:
+                response = client.get(API_ROOT + list_path)
+                rows = response.data.get('results', []) if response.status_code == 200 else []
+                first_pk[list_path] = rows[0]['id'] if rows else None
+            if first_pk[list_path] is not None:
+                yield name, path.format(pk=first_pk[list_path]), params
+
+    def poll(self, client, path, params, repeat, change_every, product, conditional):
+        """Per-poll totals of `repeat` GETs of one endpoint; conditional polls send the last ETag seen."""
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        etag = client.get(API_ROOT + path, params).get('ETag')  # warm up, and what the client starts with
+        timings, cpu, sent, not_modified = [], 0.0, 0, 0
+        for i in range(repeat):
+            if change_every and product is not None and i % change_every == change_every - 1:
+                product.save(update_fields=['updated_at'])
+            headers = {'HTTP_IF_NONE_MATCH': etag} if conditional and etag else {}
+            with connection.execute_wrapper(count):
+                start, start_cpu = time.perf_counter(), time.process_time()
+                response = client.get(API_ROOT + path, params, **headers)
+                cpu += time.process_time() - start_cpu
+                timings.append((time.perf_counter() - start) * 1000)
+            sent += len(response.content)
+            if response.status_code == 304:
+                not_modified += 1
+            etag = response.get('ETag', etag)
+        return {
+            'p50_ms': statistics.median(timings), 'cpu_ms': cpu * 1000, 'bytes': sent,
+            'queries': len(queries) / repeat, 'not_modified': not_modified, 'repeat': repeat,
+        }
+
+    def report(self, name, results):
+        line = f'{name:<18}'
+        for mode, result in results.items():
+            line += (f"  {mode} p50 {result['p50_ms']:7.2f} ms  cpu {result['cpu_ms'] / result['repeat']:6.2f} ms"
+                     f"  {result['bytes'] / result['repeat']:8.0f} B  {result['queries']:4.1f} q")
+        line += f"  304s {results['conditional']['not_modified']}/{results['conditional']['repeat']}"
+        self.stdout.write(line)
+
+    def saved(self, before, after):
+        return (before - after) / before * 100 if before else 0.0
@@ -0,0 +1,105 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import dispatch
+from api.models import User, Merchant, Order, CourierLocation
+
+# roughly Dubai
+LATITUDES = (24.95, 25.35)
+LONGITUDES = (55.05, 55.45)
+
+
+class Command(BaseCommand):
+    help = ('Simulate a courier fleet against the dispatch grid in-process: location pings, '
+            'nearest-courier assignments and a linear-scan baseline, then optionally the '
+            'database-backed assign_courier(). Everything is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--couriers', type=int, default=10000)
+        parser.add_argument('--pings', type=int, default=200000)
+        parser.add_argument('--assignments', type=int, default=5000)
+        parser.add_argument('--db-assignments', type=int, default=300, help='0 skips the database phase')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        def point():
+            return rng.uniform(*LATITUDES), rng.uniform(*LONGITUDES)
+
+        couriers = options['couriers']
+        grid = dispatch.CourierGrid()
+        positions = {courier_id: point() for courier_id in range(couriers)}
+        for courier_id, (latitude, longitude) in positions.items():
+            grid.update(courier_id, latitude, longitude)
+
+        # pings: couriers drift up to ~200 m between reports
+        moves = [(rng.randrange(couriers), rng.uniform(-0.002, 0.002), rng.uniform(-0.002, 0.002))
+                 for _ in range(options['pings'])]
+        start = time.perf_counter()
+        for courier_id, d_latitude, d_longitude in moves:
+            latitude, longitude = positions[courier_id]
+            positions[courier_id] = (latitude + d_latitude, longitude + d_longitude)
+            grid.update(courier_id, latitude + d_latitude, longitude + d_longitude, only_if_present=True)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'pings:       {len(moves) / elapsed:12,.0f} /s')
+
+        # assignments: take the nearest courier, and put them back (delivered) after a while
+        pickups = [point() for _ in range(options['assignments'])]
+        busy = []
+        start = time.perf_counter()
+        for latitude, longitude in pickups:
+            found = grid.nearest(latitude, longitude, dispatch.max_distance_km())
+            if found is not None:
+                grid.remove(found[1])
+                busy.append(found[1])
+            if len(busy) > couriers // 10:
+                returning = busy.pop(0)
+                grid.update(returning, *positions[returning])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'assignments: {len(pickups) / elapsed:12,.0f} /s  (grid, {len(grid)} couriers free at the end)')
+
+        sample = pickups[:200]
+        start = time.perf_counter()
+        for latitude, longitude in sample:
+            min(positions.items(), key=lambda item: dispatch.distance_km(latitude, longitude, *item[1]))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'assignments: {len(sample) / elapsed:12,.0f} /s  (linear scan baseline)')
+
+        if options['db_assignments']:
+            self.database_phase(rng, point, options)
+
+    def database_phase(self, rng, point, options):
+        couriers, assignments = options['couriers'], options['db_assignments']
+        with transaction.atomic():
+            tag = uuid.uuid4().hex[:8]
+            User.objects.bulk_create(
+                User(email=f'bench-{tag}-{i}@example.com', name='Courier', phone='0', role='courier')
+                for i in range(couriers))
+            courier_ids = list(User.objects.filter(email__startswith=f'bench-{tag}-').values_list('pk', flat=True))
+            CourierLocation.objects.bulk_create(
+                (CourierLocation(courier_id=courier_id, latitude=latitude, longitude=longitude)
+                 for courier_id, (latitude, longitude) in zip(courier_ids, (point() for _ in courier_ids))),
+                batch_size=2000)
+            customer = User.objects.create_user(email=f'bench-{tag}-customer@example.com', name='Customer', phone='0')
+            vendor = User.objects.create_user(email=f'bench-{tag}-vendor@example.com', name='Vendor', phone='0', role='vendor')
+            merchant = Merchant.objects.create(user=vendor, name='Bench', city='Dubai')
+            orders = Order.objects.bulk_create(Order(customer=customer, merchant=merchant) for _ in range(assignments))
+
+            previous, dispatch._grid = dispatch._grid, None
+            try:
+                start = time.perf_counter()
+                dispatch.get_grid()
+                self.stdout.write(f'index load:  {(time.perf_counter() - start) * 1000:12,.1f} ms for {couriers} couriers')
+
+                start = time.perf_counter()
+                assigned = sum(dispatch.assign_courier(order.pk, *point()) is not None for order in orders)
+                elapsed = time.perf_counter() - start
+            finally:
+                dispatch._grid = previous
+            self.stdout.write(f'assignments: {assignments / elapsed:12,.0f} /s  (with database claims, {assigned} assigned)')
+            transaction.set_rollback(True)
@@ -0,0 +1,184 @@
+import json
+import logging
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import User, Order
+from api.serializers import EmailTokenObtainPairSerializer
+from api.urls import router
+
+ROLES = ['admin', 'vendor', 'customer', 'courier']
+API_ROOT = '/api/v1/'
+# GET endpoints outside the router, and router endpoints worth measuring with parameters
+EXTRA_CASES = [
+    ('merchants priced', 'merchants/', {'lat': 25.2, 'lng': 55.27, 'ordering': 'eta'}),
+    ('products search', 'products/', {'search': 'chicken'}),
+    ('dashboard sales', 'dashboard/sales/', {}),
+    ('dashboard top products', 'dashboard/top-products/', {}),
+]
+# actions that stream whole tables; opt in with --include-exports
+EXPORT_ACTIONS = {'export'}
+
+
+class Command(BaseCommand):
+    help = ('Drive every GET endpoint of the API router in-process as one user of each role, '
+            'reporting p50/p95/p99 latency, queries and allocated memory per request. Run it '
+            'against seeded data (see seed_data); --output writes the results as JSON and '
+            '--compare prints the change against an earlier run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50, help='timed requests per endpoint and role')
+        parser.add_argument('--roles', default=','.join(ROLES))
+        parser.add_argument('--endpoint', action='append', default=[], help='only endpoints containing this text')
+        parser.add_argument('--include-exports', action='store_true')
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        roles = [role.strip() for role in options['roles'].split(',') if role.strip()]
+        users = self.pick_users(roles)
+        baseline = self.load(options['compare']) if options['compare'] else {}
+
+        results = []
+        # expected 403s for roles an endpoint isn't meant for would log a warning per request
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        # the endpoints only read, but anything a cache miss writes is rolled back too;
+        # requests come from the test client, whatever hosts the deployment allows
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for role, user in users.items():
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {EmailTokenObtainPairSerializer.get_token(user).access_token}')
+                for name, path, params in self.cases(client, options['include_exports']):
+                    if options['endpoint'] and not any(text in name for text in options['endpoint']):
+                        continue
+                    result = self.measure(client, path, params, options['repeat'])
+                    result.update(endpoint=name, role=role)
+                    results.append(result)
+                    self.report(result, baseline.get((name, role)))
+            transaction.set_rollback(True)
+        request_logger.setLevel(level)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'meta': self.meta(options), 'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    def pick_users(self, roles):
+        """One user per role, preferring ones the latest orders involve so their lists aren't empty."""
+        latest = (Order.objects.filter(courier__isnull=False).order_by('-id')
+                  .values('merchant__user_id', 'customer_id', 'courier_id').first()) or {}
+        preferred = {'vendor': latest.get('merchant__user_id'), 'customer': latest.get('customer_id'),
+                     'courier': latest.get('courier_id')}
+        users = {}
+        for role in roles:
+            if role not in ROLES:
+                raise CommandError(f'Unknown role {role!r}')
+            candidates = User.objects.filter(role=role, is_active=True)
+            user = candidates.filter(pk=preferred.get(role)).first() or candidates.order_by('pk').first()
+            if user is None:
+                raise CommandError(f'No active {role} to benchmark as; run seed_data first')
+            users[role] = user
+        return users
+
+    def cases(self, client, include_exports):
+        """(name, path, params) for the router's list, detail and GET action routes, then EXTRA_CASES."""
+        for prefix, viewset, basename in router.registry:
+            list_path = f'{prefix}/'
+            yield f'{basename} list', list_path, {}
+            detail_pk = self.first_pk(client, list_path)
+            if detail_pk is not None:
+                yield f'{basename} detail', f'{prefix}/{detail_pk}/', {}
+            for action in viewset.get_extra_actions():
+                if 'get' not in action.mapping or (action.__name__ in EXPORT_ACTIONS and not include_exports):
+                    continue
+                if action.detail:
+                    if detail_pk is None:
+                        continue
+                    yield f'{basename} {action.url_path}', f'{prefix}/{detail_pk}/{action.url_path}/', {}
+                else:
+                    yield f'{basename} {action.url_path}', f'{prefix}/{action.url_path}/', {}
+        yield from EXTRA_CASES
+
+    def first_pk(self, client, path):
+        response = client.get(API_ROOT + path)
+        if response.status_code != 200:
+            return None
+        rows = response.data.get('results', response.data) if isinstance(response.data, dict) else response.data
+        return rows[0]['id'] if rows else None
+
+    def fetch(self, client, path, params):
+        response = client.get(API_ROOT + path, params)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def measure(self, client, path, params, repeat):
+        response = self.fetch(client, path, params)  # warm up caches and imports
+        # counted with a wrapper: request_started empties connection.queries,
+        # which CaptureQueriesContext relies on
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+        with connection.execute_wrapper(count):
+            self.fetch(client, path, params)
+
+        tracemalloc.start()
+        try:
+            self.fetch(client, path, params)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            self.fetch(client, path, params)
+            timings.append((time.perf_counter() - start) * 1000)
+        p = statistics.quantiles(timings, n=100, method='inclusive') if len(timings) > 1 else timings * 99
+        return {
+            'path': API_ROOT + path, 'params': params, 'status': response.status_code,
+            'p50_ms': round(p[49], 3), 'p95_ms': round(p[94], 3), 'p99_ms': round(p[98], 3),
+            'queries': len(queries), 'peak_alloc_kib': round(peak / 1024, 1),
+        }
+
+    def report(self, result, before=None):
+        line = (f"{result['endpoint']:<34} {result['role']:<9} {result['status']:>3}"
+                f"  p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  p99 {result['p99_ms']:8.2f} ms"
+                f"  {result['queries']:3d} q  {result['peak_alloc_kib']:9.1f} KiB")
+        if before:
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+            line += f"  p50 {change:+6.1f}%  q {result['queries'] - before['queries']:+d}"
+        self.stdout.write(line)
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                results = json.load(f)['results']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f'Cannot read results from {path}: {exc}')
+        return {(result['endpoint'], result['role']): result for result in results}
+
+    def meta(self, options):
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'repeat': options['repeat'],
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'rows': {model._meta.model_name: model.objects.count() for model in (User, Order)},
+        }
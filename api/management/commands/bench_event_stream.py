@@ -0,0 +1,91 @@
+import asyncio
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.events import get_broker, user_channel
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = ('Open thousands of idle /api/v1/events/ streams against the ASGI application in '
+            'this process, then measure memory per connection and the latency of fanning an '
+            'event out to all of them. The seeded users are deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=500, help='connections are spread over this many users')
+        parser.add_argument('--events', type=int, default=5, help='fan-out rounds to time')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        users = User.objects.bulk_create(
+            User(email=f'stream-{tag}-{i}@example.com', name='Stream', phone='0') for i in range(options['users']))
+        users = list(User.objects.filter(email__startswith=f'stream-{tag}-'))
+        try:
+            asyncio.run(self.run(users, options))
+        finally:
+            User.objects.filter(email__startswith=f'stream-{tag}-').delete()
+
+    async def run(self, users, options):
+        from fooddeliveryapp.asgi import application
+
+        tokens = {user.pk: str(AccessToken.for_user(user)) for user in users}
+        broker = get_broker()
+        disconnect = asyncio.Event()
+        received = {}  # connection -> number of event frames received
+
+        def connection(index, user_id):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': '/api/v1/events/', 'raw_path': b'/api/v1/events/',
+                'query_string': f'token={tokens[user_id]}'.encode(), 'root_path': '',
+                'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            request_sent = False
+
+            async def receive():
+                nonlocal request_sent
+                if not request_sent:
+                    request_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.body' and message.get('body', b'').startswith(b'event:'):
+                    received[index] = received.get(index, 0) + 1
+
+            return application(scope, receive, send)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        user_ids = list(tokens)
+        tasks = [asyncio.create_task(connection(i, user_ids[i % len(user_ids)])) for i in range(options['connections'])]
+        while broker.subscriber_count() < options['connections']:
+            await asyncio.sleep(0.05)
+        connected = time.perf_counter() - started
+        per_connection = (tracemalloc.get_traced_memory()[0] - before) / options['connections']
+        tracemalloc.stop()
+        self.stdout.write(f"{options['connections']} streams open in {connected:.2f}s, "
+                          f"~{per_connection / 1024:.1f} KiB Python heap per idle stream")
+
+        latencies = []
+        for round_number in range(1, options['events'] + 1):
+            start = time.perf_counter()
+            for user_id in user_ids:
+                broker.publish(user_channel(user_id), {'type': 'order_status', 'order': round_number, 'status': 'confirmed'})
+            while sum(1 for count in received.values() if count >= round_number) < options['connections']:
+                await asyncio.sleep(0)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        self.stdout.write(f'fan-out to every stream: best {latencies[0] * 1000:.1f} ms, '
+                          f'median {latencies[len(latencies) // 2] * 1000:.1f} ms, worst {latencies[-1] * 1000:.1f} ms')
+
+        disconnect.set()
+        await asyncio.wait(tasks, timeout=30)
+        self.stdout.write(f'subscribers left after disconnect: {broker.subscriber_count()}')
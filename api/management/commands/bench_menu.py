@@ -0,0 +1,77 @@
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.menu import bump_version, menu_cache_stats, reset_menu_cache_stats
+from api.models import User, Merchant, Category, Product
+from api.views import MerchantViewSet, CategoryViewSet, ProductViewSet
+
+
+class Command(BaseCommand):
+    help = ('Compare building a menu from the paginated /categories/ and /products/ endpoints '
+            'with one cached /merchants/{id}/menu/ read. Seeded rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument('--products', type=int, default=25, help='products per category')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            vendor = User.objects.create_user(email=f'bench-{uuid.uuid4().hex}@example.com', name='Bench',
+                                              phone='0', role='vendor')
+            merchant = Merchant.objects.create(user=vendor, name='Bench Kitchen', city='Bench', status='approved')
+            categories = Category.objects.bulk_create(
+                Category(merchant=merchant, name=f'Category {i}') for i in range(options['categories']))
+            Product.objects.bulk_create(
+                Product(category=category, name=f'Dish {i}', price=9.5)
+                for category in categories for i in range(options['products']))
+
+            factory = APIRequestFactory()
+
+            def get(view, path, **kwargs):
+                request = factory.get(path, HTTP_HOST='localhost')
+                force_authenticate(request, user=vendor)
+                response = view(request, **kwargs)
+                response.render()
+                return response
+
+            def list_endpoints():
+                for viewset, path in ((CategoryViewSet, '/api/v1/categories/'), (ProductViewSet, '/api/v1/products/')):
+                    view = viewset.as_view({'get': 'list'})
+                    url = path
+                    while url:
+                        response = get(view, url)
+                        url = response.data['next']
+
+            menu_view = MerchantViewSet.as_view({'get': 'menu'})
+
+            def menu_cold():
+                bump_version(merchant.pk)
+                get(menu_view, f'/api/v1/merchants/{merchant.pk}/menu/', pk=str(merchant.pk))
+
+            def menu_warm():
+                get(menu_view, f'/api/v1/merchants/{merchant.pk}/menu/', pk=str(merchant.pk))
+
+            reset_menu_cache_stats()
+            for label, func in (('list endpoints', list_endpoints), ('menu, cold cache', menu_cold),
+                                ('menu, warm cache', menu_warm)):
+                func()  # warm up
+                timings = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        func()
+                        timings.append(time.perf_counter() - start)
+                self.stdout.write(f'{label:<18} median {statistics.median(timings) * 1000:8.2f} ms'
+                                  f'   queries/read {len(queries) / options["repeat"]:6.1f}')
+
+            stats = menu_cache_stats()
+            self.stdout.write(f"menu cache: {stats['hits']} hits, {stats['misses']} misses, "
+                              f"hit ratio {stats['hit_ratio']:.2%}")
+            transaction.set_rollback(True)
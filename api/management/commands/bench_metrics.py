@@ -0,0 +1,70 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.models import User
+from api.serializers import EmailTokenObtainPairSerializer
+from api.urls import router
+
+MIDDLEWARE = 'api.metrics.MetricsMiddleware'
+
+
+class Command(BaseCommand):
+    help = ('Measure what MetricsMiddleware adds to the latency of every router list endpoint: '
+            'requests alternate between a stack with and one without it. Run it against seeded '
+            'data (see seed_data); exits with an error above --max-overhead percent.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--role', default='admin')
+        parser.add_argument('--max-overhead', type=float, default=3.0, help='percent, over all endpoints')
+
+    def handle(self, *args, **options):
+        if MIDDLEWARE not in settings.MIDDLEWARE:
+            raise CommandError(f'{MIDDLEWARE} is not in MIDDLEWARE')
+        user = User.objects.filter(role=options['role'], is_active=True).order_by('pk').first()
+        if user is None:
+            raise CommandError(f"No active {options['role']} to benchmark as; run seed_data first")
+        token = f'Bearer {EmailTokenObtainPairSerializer.get_token(user).access_token}'
+        paths = [f'/api/v1/{prefix}/' for prefix, _, _ in router.registry]
+
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            clients = {}
+            for label, middleware in [('with', settings.MIDDLEWARE),
+                                      ('without', [name for name in settings.MIDDLEWARE if name != MIDDLEWARE])]:
+                # the test client builds its middleware chain on the first request
+                with override_settings(MIDDLEWARE=middleware):
+                    client = clients[label] = APIClient()
+                    client.credentials(HTTP_AUTHORIZATION=token)
+                    for path in paths:
+                        client.get(path)
+
+            timings = {(path, label): [] for path in paths for label in clients}
+            for i in range(options['repeat']):
+                # alternate which stack goes first, so warm caches favour neither
+                order = ['with', 'without'] if i % 2 else ['without', 'with']
+                for path in paths:
+                    for label in order:
+                        start = time.perf_counter()
+                        clients[label].get(path)
+                        timings[path, label].append(time.perf_counter() - start)
+            transaction.set_rollback(True)
+
+        totals = {'with': 0.0, 'without': 0.0}
+        for path in paths:
+            medians = {label: statistics.median(timings[path, label]) for label in clients}
+            for label, median in medians.items():
+                totals[label] += median
+            overhead = (medians['with'] - medians['without']) / medians['without'] * 100
+            self.stdout.write(f"{path:<32} without {medians['without'] * 1000:8.3f} ms"
+                              f"   with {medians['with'] * 1000:8.3f} ms   {overhead:+6.2f}%")
+        overhead = (totals['with'] - totals['without']) / totals['without'] * 100
+        summary = f'Overall overhead {overhead:+.2f}% (limit {options["max_overhead"]}%)'
+        if overhead > options['max_overhead']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,68 @@
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import User, Notification
+from api.pagination import KeysetPagination
+from api.views import NotificationViewSet
+
+
+class Command(BaseCommand):
+    help = ('Compare page-number and keyset pagination latency at page 1 and a deep page '
+            'on a seeded notification feed. Everything is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=5000, help='deep page to measure')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=7)
+
+    def handle(self, *args, **options):
+        page, page_size, repeat = options['page'], options['page_size'], options['repeat']
+        if not 1 <= page_size <= KeysetPagination.max_page_size:
+            raise CommandError(f'--page-size must be between 1 and {KeysetPagination.max_page_size}')
+        rows = page * page_size
+
+        with transaction.atomic():
+            user = User.objects.create_user(email=f'bench-{uuid.uuid4().hex}@example.com', name='Bench', phone='0')
+            self.stdout.write(f'Seeding {rows} notifications...')
+            Notification.objects.bulk_create(
+                (Notification(recipient=user, message=f'Notification {i}') for i in range(rows)),
+                batch_size=5000,
+            )
+
+            # the last row of page - 1 is where keyset pagination resumes for the deep page
+            anchor = (Notification.objects.filter(recipient=user)
+                      .order_by('-created_at', '-id')[(page - 1) * page_size - 1])
+            deep_cursor = KeysetPagination.encode_cursor(anchor, 'created_at')
+
+            view = NotificationViewSet.as_view({'get': 'list'})
+            factory = APIRequestFactory()
+
+            def fetch(params):
+                request = factory.get('/api/v1/notifications/', dict(params, page_size=page_size), HTTP_HOST='localhost')
+                force_authenticate(request, user=user)
+                start = time.perf_counter()
+                response = view(request)
+                response.render()
+                elapsed = time.perf_counter() - start
+                assert response.status_code == 200, response.content
+                assert len(response.data['results']) == page_size, 'both modes must serve the same page size'
+                return elapsed
+
+            cases = [
+                ('page-number, page 1', {'page': 1}),
+                (f'page-number, page {page}', {'page': page}),
+                ('keyset, page 1', {'pagination': 'cursor'}),
+                (f'keyset, page {page}', {'cursor': deep_cursor}),
+            ]
+            for label, params in cases:
+                fetch(params)  # warm up
+                timings = [fetch(params) for _ in range(repeat)]
+                self.stdout.write(f'{label:<28} median {statistics.median(timings) * 1000:8.2f} ms'
+                                  f'   max {max(timings) * 1000:8.2f} ms')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,77 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+from unittest import mock
+
+from api import pricing
+from api.models import User, Merchant
+from api.views import MerchantViewSet
+
+
+class Command(BaseCommand):
+    help = ('Price every merchant of a city for one customer: the NumPy engine against the '
+            'per-row fallback, then the whole ?lat=&lng= merchant listing. Everything is '
+            'rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merchants', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=7)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        count, repeat = options['merchants'], options['repeat']
+        latitudes = [rng.uniform(24.95, 25.35) for _ in range(count)]
+        longitudes = [rng.uniform(55.05, 55.45) for _ in range(count)]
+        prep = [rng.randint(5, 45) for _ in range(count)]
+
+        def timed(func):
+            func()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            return statistics.median(timings) * 1000
+
+        if pricing.np is not None:
+            arrays = [pricing.np.asarray(values, dtype=float) for values in (latitudes, longitudes, prep)]
+            self.stdout.write(f'quote {count} merchants, NumPy:    {timed(lambda: pricing.quote(25.2, 55.27, *arrays)):8.2f} ms')
+        with mock.patch.object(pricing, 'np', None):
+            self.stdout.write(f'quote {count} merchants, per row:  {timed(lambda: pricing.quote(25.2, 55.27, latitudes, longitudes, prep)):8.2f} ms')
+
+        with transaction.atomic():
+            tag = uuid.uuid4().hex
+            vendor = User.objects.create_user(email=f'bench-{tag}-vendor@example.com', name='Vendor', phone='0', role='vendor')
+            customer = User.objects.create_user(email=f'bench-{tag}-customer@example.com', name='Customer', phone='0')
+            city = f'Bench {tag[:8]}'
+            Merchant.objects.bulk_create(
+                (Merchant(user=vendor, name=f'Merchant {i}', city=city, status='approved',
+                          latitude=latitudes[i], longitude=longitudes[i], prep_time_avg=prep[i])
+                 for i in range(count)),
+                batch_size=5000,
+            )
+            view = MerchantViewSet.as_view({'get': 'list'})
+            factory = APIRequestFactory()
+
+            def fetch(params):
+                def run():
+                    request = factory.get('/api/v1/merchants/', dict(params, city=city), HTTP_HOST='localhost')
+                    force_authenticate(request, user=customer)
+                    response = view(request)
+                    response.render()
+                    assert response.status_code == 200, response.content
+                return run
+
+            for label, params in [
+                ('listing, unpriced', {}),
+                ('listing by delivery_fee', {'lat': 25.2, 'lng': 55.27, 'ordering': 'delivery_fee'}),
+                ('listing by eta, max 30 min', {'lat': 25.2, 'lng': 55.27, 'ordering': 'eta', 'max_eta': 30}),
+            ]:
+                self.stdout.write(f'{label:<32} {timed(fetch(params)):8.2f} ms')
+            transaction.set_rollback(True)
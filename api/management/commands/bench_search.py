@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework import filters
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import User, Merchant, Category, Product, SearchIndexEntry
+from api.search import InvertedIndexSearchFilter, index_entries
+from api.views import ProductViewSet
+
+ADJECTIVES = ['spicy', 'crispy', 'grilled', 'smoked', 'fresh', 'garlic', 'sweet', 'sour', 'creamy',
+              'roasted', 'tandoori', 'teriyaki', 'vegan', 'classic', 'double', 'mini', 'family', 'hot']
+DISHES = ['burger', 'pizza', 'shawarma', 'falafel', 'noodles', 'ramen', 'salad', 'wrap', 'curry',
+          'biryani', 'taco', 'burrito', 'sushi', 'dumplings', 'kebab', 'pasta', 'soup', 'sandwich']
+EXTRAS = ['cheese', 'chicken', 'beef', 'lamb', 'tofu', 'mushroom', 'avocado', 'egg', 'rice', 'fries']
+QUERIES = ['spicy chicken', 'burger', 'vegan ramen', 'garlic', 'tandoori lamb wrap', 'sush']
+
+
+class LikeSearchProductViewSet(ProductViewSet):
+    """ProductViewSet as it was before the inverted index."""
+    filter_backends = [filters.SearchFilter]
+    search_fields = ['name', 'description']
+
+
+class IndexedSearchProductViewSet(ProductViewSet):
+    filter_backends = [InvertedIndexSearchFilter]
+
+
+class Command(BaseCommand):
+    help = ('Compare SearchFilter (LIKE %term%) with the inverted index on a seeded product '
+            'table. Seeded rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(7)
+        with transaction.atomic():
+            user = User.objects.create_user(email=f'bench-{uuid.uuid4().hex}@example.com', name='Bench',
+                                            phone='0', role='admin')
+            merchant = Merchant.objects.create(user=user, name='Bench Kitchen', city='Bench')
+            category = Category.objects.create(merchant=merchant, name='Everything')
+
+            self.stdout.write(f"Seeding {options['products']} products and their index...")
+            remaining = options['products']
+            while remaining:
+                size = min(remaining, options['batch_size'])
+                remaining -= size
+                products = Product.objects.bulk_create(
+                    Product(category=category, price=rng.randint(3, 40),
+                            name=f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}',
+                            description=f'{rng.choice(ADJECTIVES)} {rng.choice(EXTRAS)} with {rng.choice(EXTRAS)}')
+                    for _ in range(size))
+                # bulk_create skips the signals, so index the batch directly
+                SearchIndexEntry.objects.bulk_create(
+                    [entry for product in products for entry in index_entries(product)],
+                    batch_size=options['batch_size'])
+
+            factory = APIRequestFactory()
+
+            def run(viewset, query):
+                view = viewset.as_view({'get': 'list'})
+                request = factory.get('/api/v1/products/', {'search': query}, HTTP_HOST='localhost')
+                force_authenticate(request, user=user)
+                start = time.perf_counter()
+                response = view(request)
+                response.render()
+                return time.perf_counter() - start, response.data['count']
+
+            for query in QUERIES:
+                for label, viewset in (('SearchFilter', LikeSearchProductViewSet),
+                                       ('inverted index', IndexedSearchProductViewSet)):
+                    runs = [run(viewset, query) for _ in range(options['repeat'])]
+                    timings = [elapsed for elapsed, _ in runs]
+                    self.stdout.write(f'{query!r:<22} {label:<15} median {statistics.median(timings) * 1000:9.2f} ms'
+                                      f'   matches {runs[0][1]}')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,87 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from api import inventory
+from api.models import User, Merchant, Category, Product
+
+
+class Command(BaseCommand):
+    help = ('Have N concurrent buyers (threads, one connection each) buy one unit at a time '
+            'of a single product until it sells out, and report throughput and oversell. '
+            'Needs a database that allows concurrent writers (MySQL/PostgreSQL); the '
+            'seeded rows are deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=50)
+        parser.add_argument('--stock', type=int, default=2000)
+        parser.add_argument('--shards', type=int, default=8, help='shard count for the sharded mode')
+        parser.add_argument('--mode', action='append', choices=['naive', 'conditional', 'sharded'],
+                            help='defaults to all three')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in (':memory:', ''):
+            raise CommandError('An in-memory SQLite database cannot be shared between threads')
+
+        owner = User.objects.create_user(email=f'bench-{uuid.uuid4().hex}@example.com', name='Bench', phone='0',
+                                         role='vendor')
+        try:
+            merchant = Merchant.objects.create(user=owner, name='Flash Sale', city='Bench')
+            category = Category.objects.create(merchant=merchant, name='Deals')
+            for mode in options['mode'] or ['naive', 'conditional', 'sharded']:
+                product = Product.objects.create(category=category, name=f'Hot item ({mode})', price=1,
+                                                 stock=options['stock'])
+                if mode == 'sharded':
+                    inventory.shard_stock(product.pk, options['shards'])
+                self.run_mode(mode, product.pk, options)
+        finally:
+            owner.delete()
+
+    def run_mode(self, mode, product_id, options):
+        sold = [0] * options['buyers']
+        errors = [0] * options['buyers']
+        start_gate = threading.Barrier(options['buyers'])
+
+        def naive_buy():
+            # read-modify-write, the way the code would look without conditional updates
+            with transaction.atomic():
+                product = Product.objects.get(pk=product_id)
+                if product.stock < 1:
+                    raise inventory.OutOfStock(product_id, 1)
+                product.stock -= 1
+                product.save(update_fields=['stock'])
+
+        def buyer(index):
+            try:
+                start_gate.wait()
+                while True:
+                    try:
+                        if mode == 'naive':
+                            naive_buy()
+                        else:
+                            inventory.reserve(product_id, 1)
+                        sold[index] += 1
+                    except inventory.OutOfStock:
+                        if mode != 'sharded' or inventory.available_stock(product_id) == 0:
+                            return
+                    except OperationalError:
+                        errors[index] += 1  # lock wait timeout / deadlock, try again
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer, args=(i,)) for i in range(options['buyers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total_sold = sum(sold)
+        left = inventory.available_stock(product_id)
+        self.stdout.write(
+            f'{mode:<12} {total_sold / elapsed:9.1f} buys/s   sold {total_sold:6d}   left {left:5d}'
+            f'   oversold {max(0, total_sold - options["stock"]):5d}   retried errors {sum(errors)}')
@@ -0,0 +1,61 @@
+import statistics
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import User, Notification, UnreadNotificationCounter
+from api.unread import cache_key, count_unread, unread_count
+
+
+class Command(BaseCommand):
+    help = ('Compare the COUNT(*) unread badge with the denormalized counter, read from the '
+            'database and from the cache, on users with many notifications. Everything is '
+            'rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--notifications', type=int, default=20000, help='per user, half of them unread')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        per_user, repeat = options['notifications'], options['repeat']
+
+        with transaction.atomic():
+            tag = uuid.uuid4().hex
+            users = [User.objects.create_user(email=f'bench-{tag}-{i}@example.com', name='Bench', phone='0')
+                     for i in range(options['users'])]
+            self.stdout.write(f'Seeding {per_user * len(users)} notifications...')
+            for user in users:
+                Notification.objects.bulk_create(
+                    (Notification(recipient=user, message=f'Notification {i}', is_read=i % 2 == 0) for i in range(per_user)),
+                    batch_size=5000,
+                )
+            # bulk_create doesn't send post_save, so set the counters the seeding skipped
+            UnreadNotificationCounter.objects.filter(user__in=users).update(unread=per_user // 2)
+
+            def uncached(user_id):
+                cache.delete(cache_key(user_id))
+                return unread_count(user_id)
+
+            cases = [
+                ('COUNT(*)', count_unread),
+                ('counter row', uncached),
+                ('counter, cached', unread_count),
+            ]
+            for label, read in cases:
+                for user in users:
+                    assert read(user.pk) == per_user // 2
+                timings = []
+                for _ in range(repeat):
+                    for user in users:
+                        start = time.perf_counter()
+                        read(user.pk)
+                        timings.append(time.perf_counter() - start)
+                self.stdout.write(f'{label:<18} median {statistics.median(timings) * 1000:8.3f} ms'
+                                  f'   max {max(timings) * 1000:8.3f} ms')
+
+            cache.delete_many([cache_key(user.pk) for user in users])
+            transaction.set_rollback(True)
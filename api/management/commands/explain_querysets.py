@@ -0,0 +1,115 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory
+
+from api.models import User
+from api.views import (MerchantViewSet, CategoryViewSet, ProductViewSet, OrderViewSet,
+                       OrderItemViewSet, OrderStatusHistoryViewSet, NotificationViewSet)
+
+ROLES = ['admin', 'vendor', 'customer', 'courier']
+
+# (viewset, roles, query params, accepted findings) for the list requests the apps make.
+# Accepted findings are deliberate: the rows they sort are bounded by one user's data.
+CASES = [
+    (MerchantViewSet, ROLES, {}, set()),
+    (MerchantViewSet, ['customer'], {'city': 'Dubai'}, set()),
+    (CategoryViewSet, ['admin', 'vendor'], {}, set()),
+    (ProductViewSet, ['admin', 'vendor'], {}, set()),
+    # SQLite can't index a bare boolean predicate (MySQL compares `= 1` and uses
+    # product_available_cat_idx); the unsorted first page stops after PAGE_SIZE rows anyway
+    (ProductViewSet, ['customer', 'courier'], {}, {'full scan'}),
+    (ProductViewSet, ['customer'], {'is_available': 'true', 'category__merchant__city': 'Dubai'}, set()),
+    (OrderViewSet, ['admin', 'customer', 'courier'], {}, set()),
+    # a vendor's orders span all of their merchants, so they are merged and sorted
+    (OrderViewSet, ['vendor'], {}, {'filesort'}),
+    # item lists are sorted across the user's own orders
+    (OrderItemViewSet, ['admin'], {}, set()),
+    (OrderItemViewSet, ['vendor', 'customer'], {}, {'filesort'}),
+    (OrderStatusHistoryViewSet, ['admin'], {}, set()),
+    (NotificationViewSet, ['customer'], {}, set()),
+    (NotificationViewSet, ['customer'], {'is_read': 'false'}, set()),
+]
+
+# Plan fragments that mean "read the whole table" or "sort outside an index", per backend
+FULL_SCAN = {
+    'mysql': [re.compile(r'\|\s*ALL\s*\|'), re.compile(r'\btype:\s*ALL\b')],
+    'sqlite': [re.compile(r'\bSCAN (?!.*\bUSING (COVERING )?INDEX\b)(?!.*\bINTEGER PRIMARY KEY\b)\S+')],
+    'postgresql': [re.compile(r'Seq Scan')],
+}
+FILESORT = {
+    'mysql': [re.compile(r'Using filesort')],
+    'sqlite': [re.compile(r'USE TEMP B-TREE FOR (ORDER BY|RIGHT PART OF ORDER BY)')],
+    'postgresql': [re.compile(r'^\s*(->\s*)?Sort\b', re.M)],
+}
+
+
+def build_view(viewset, role, params):
+    """Instantiate a viewset the way the router would for GET list as a user of `role`."""
+    request = APIRequestFactory().get('/', params)
+    # an unsaved id is enough: the querysets only compare against it
+    request.user = User(pk=0, role=role, email=f'{role}@explain.local')
+    view = viewset()
+    view.action_map = {'get': 'list'}
+    view.action = 'list'
+    view.args, view.kwargs, view.format_kwarg = (), {}, None
+    view.request = Request(request)
+    view.request.user = request.user
+    view.headers = {}
+    return view
+
+
+def explain(viewset, role, params):
+    """Return (plan, filtered) for the first page of the viewset's list query."""
+    view = build_view(viewset, role, params)
+    queryset = view.filter_queryset(view.get_queryset())
+    page_size = getattr(view.paginator, 'page_size', None) or api_settings.PAGE_SIZE or 20
+    return str(queryset[:page_size].explain()), bool(queryset.query.where)
+
+
+def problems(plan, vendor, filtered):
+    found = []
+    # an unfiltered, unsorted first page stops after PAGE_SIZE rows, so a scan is fine there
+    if filtered and any(pattern.search(plan) for pattern in FULL_SCAN.get(vendor, [])):
+        found.append('full scan')
+    if any(pattern.search(plan) for pattern in FILESORT.get(vendor, [])):
+        found.append('filesort')
+    return found
+
+
+class Command(BaseCommand):
+    help = ('Run EXPLAIN on the role-specific list queryset of every viewset and flag full '
+            'table scans and filesorts. Exits non-zero when something is flagged, so it can '
+            'gate CI. Run it against a database with realistic volumes; on near-empty tables '
+            'the optimizer may prefer a scan regardless of indexes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='print every plan, not only flagged ones')
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in FULL_SCAN:
+            raise CommandError(f'No plan checks for the {vendor} backend')
+
+        flagged = []
+        for viewset, roles, params, accepted in CASES:
+            for role in roles:
+                plan, filtered = explain(viewset, role, params)
+                found = problems(plan, vendor, filtered)
+                query = '&'.join(f'{k}={v}' for k, v in params.items())
+                title = f"{viewset.__name__}:{role}{'?' + query if query else ''}"
+                if not found:
+                    self.stdout.write(self.style.SUCCESS(f'ok       {title}'))
+                elif set(found) <= accepted:
+                    self.stdout.write(self.style.WARNING(f'accepted {title}: {", ".join(found)}'))
+                else:
+                    self.stdout.write(self.style.ERROR(f'FLAGGED  {title}: {", ".join(found)}'))
+                    flagged.append(title)
+                if found or options['verbose_plans']:
+                    self.stdout.write(plan + '\n')
+
+        if flagged:
+            raise CommandError(f'{len(flagged)} queryset(s) scan or sort outside an index: {", ".join(flagged)}')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.retention import purge_notifications
+
+
+class Command(BaseCommand):
+    help = ('Delete notifications older than NOTIFICATION_TTL_READ / NOTIFICATION_TTL_UNREAD '
+            'in bounded primary key chunks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None, help='defaults to NOTIFICATION_DELETE_CHUNK_SIZE')
+        parser.add_argument('--pause', type=float, default=0.05, help='seconds to sleep between chunks')
+
+    def handle(self, *args, **options):
+        stats = purge_notifications(size=options['chunk_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {stats['deleted']} notifications in {stats['chunks']} chunks "
+            f"({stats['rows_per_second']:.0f} rows/s, longest chunk transaction "
+            f"{stats['max_lock_seconds'] * 1000:.1f} ms)"
+        ))
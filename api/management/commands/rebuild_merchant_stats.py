@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute every merchant\'s preparation time and rating aggregates from order history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        written = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {written} merchants'))
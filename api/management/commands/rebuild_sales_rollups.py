@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Backfill the daily merchant and product sales rollups from the order history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        merchant_rows, product_rows = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {merchant_rows} merchant and {product_rows} product daily rows'))
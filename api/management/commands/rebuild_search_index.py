@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Merchant, Product
+from api.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the product and merchant search index from scratch, e.g. after rows '
+            'were loaded with bulk_create or update(), which skip the indexing signals.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for model in (Merchant, Product):
+            with transaction.atomic():
+                count = rebuild_index(model, chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Indexed {count} {model._meta.verbose_name_plural}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.unread import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recount unread notifications and repair per-user counters that drifted or are missing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        repaired, created = reconcile(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} counters, created {created}'))
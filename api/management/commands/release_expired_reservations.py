@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return the stock of expired checkout reservations and cancel their abandoned orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        released, cancelled = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} reservations, cancelled {cancelled} orders'))
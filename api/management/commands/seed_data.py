@@ -0,0 +1,181 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import (User, Merchant, Category, Product, Order, OrderItem, OrderStatusHistory,
+                        Notification)
+
+# how far through the pipeline orders get, by weight
+OUTCOMES = [('delivered', 70), ('cancelled', 8), ('pending', 4), ('confirmed', 4),
+            ('preparing', 6), ('out_for_delivery', 8)]
+PIPELINE = ['pending', 'confirmed', 'preparing', 'out_for_delivery', 'delivered']
+# minutes after the order was placed that each status is reached
+STEP_MINUTES = {'confirmed': 2, 'preparing': 5, 'out_for_delivery': 25, 'delivered': 45, 'cancelled': 10}
+CITIES = [('Dubai', 25.20, 55.27), ('Abu Dhabi', 24.45, 54.38), ('Sharjah', 25.34, 55.41)]
+WORDS = ['spicy', 'grilled', 'classic', 'fresh', 'crispy', 'vegan', 'double', 'family', 'chicken',
+         'beef', 'falafel', 'shawarma', 'burger', 'salad', 'rice', 'noodles', 'pizza', 'juice', 'cake']
+
+
+class Command(BaseCommand):
+    help = ('Bulk-load synthetic users, merchants, menus, orders, items, status history and '
+            'notifications at a configurable scale, then rebuild the tables the skipped '
+            'signals would have kept (search index, unread counters, merchant stats, sales rollups).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--vendors', type=int, default=50)
+        parser.add_argument('--couriers', type=int, default=100)
+        parser.add_argument('--admins', type=int, default=2)
+        parser.add_argument('--merchants-per-vendor', type=int, default=2)
+        parser.add_argument('--categories-per-merchant', type=int, default=4)
+        parser.add_argument('--products-per-category', type=int, default=8)
+        parser.add_argument('--days', type=int, default=90, help='spread orders over this many past days')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0, help='random seed, so runs are repeatable')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.run = uuid.uuid4().hex[:8]  # keeps emails unique across seeding runs
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            users = {role: self.seed_users(role, options[f'{role}s'])
+                     for role in ('admin', 'vendor', 'courier', 'customer')}
+            merchants = self.seed_merchants(users['vendor'], options['merchants_per_vendor'])
+            menus = self.seed_menus(merchants, options['categories_per_merchant'], options['products_per_category'])
+        self.log(f'{sum(map(len, users.values()))} users, {len(merchants)} merchants, '
+                 f'{sum(map(len, menus.values()))} products', started)
+
+        self.seed_orders(options['orders'], options['days'], users, merchants, menus)
+        self.log(f"{options['orders']} orders with items, status history and notifications", started)
+
+        for command in ('rebuild_search_index', 'reconcile_unread_counters',
+                        'rebuild_merchant_stats', 'rebuild_sales_rollups'):
+            call_command(command, stdout=self.stdout)
+        self.log('done', started)
+
+    def log(self, message, started):
+        self.stdout.write(f'[{time.perf_counter() - started:7.1f}s] {message}')
+
+    def bulk_insert(self, model, objects):
+        """bulk_create() that also fills in primary keys on backends that don't return them (MySQL)."""
+        last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        objects = model.objects.bulk_create(objects, batch_size=self.batch_size)
+        if objects and objects[0].pk is None:
+            new_pks = model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)
+            for obj, pk in zip(objects, new_pks):
+                obj.pk = pk
+        return objects
+
+    def words(self, count):
+        return ' '.join(self.random.choice(WORDS) for _ in range(count))
+
+    def seed_users(self, role, count):
+        # hashing is the slow part of create_user(), and every seeded user can share one hash
+        password = make_password('seed-password')
+        users = self.bulk_insert(User, (
+            User(email=f'{role}{i}-{self.run}@seed.example', name=f'{role.title()} {i}', phone=f'+9715{i:08d}',
+                 role=role, status='Active', password=password, is_staff=role == 'admin')
+            for i in range(count)))
+        return [user.pk for user in users]
+
+    def seed_merchants(self, vendor_ids, per_vendor):
+        merchants = []
+        for vendor_id in vendor_ids:
+            for _ in range(per_vendor):
+                city, latitude, longitude = self.random.choice(CITIES)
+                merchants.append(Merchant(
+                    user_id=vendor_id, name=self.words(2).title(), city=city,
+                    merchant_type=self.random.choice(['restaurant', 'grocery']),
+                    status=self.random.choices(['approved', 'active', 'pending'], [80, 10, 10])[0],
+                    is_open=self.random.random() < 0.8,
+                    latitude=latitude + self.random.uniform(-0.1, 0.1),
+                    longitude=longitude + self.random.uniform(-0.1, 0.1),
+                    prep_time_avg=self.random.randint(10, 40),
+                ))
+        return [(merchant.pk, merchant.user_id) for merchant in self.bulk_insert(Merchant, merchants)]
+
+    def seed_menus(self, merchants, categories_per_merchant, products_per_category):
+        """Returns {merchant id: [(product id, price), ...]}."""
+        categories = self.bulk_insert(Category, (
+            Category(merchant_id=merchant_id, name=self.words(1).title())
+            for merchant_id, _ in merchants for _ in range(categories_per_merchant)))
+        products = self.bulk_insert(Product, (
+            Product(category_id=category.pk, name=self.words(2).title(), description=self.words(8),
+                    price=Decimal(self.random.randrange(300, 6000)) / 100, stock=100000,
+                    is_available=self.random.random() < 0.9)
+            for category in categories for _ in range(products_per_category)))
+        merchant_of = {category.pk: category.merchant_id for category in categories}
+        menus = {merchant_id: [] for merchant_id, _ in merchants}
+        for product in products:
+            menus[merchant_of[product.category_id]].append((product.pk, product.price))
+        return menus
+
+    def seed_orders(self, count, days, users, merchants, menus):
+        """
+        Orders go in batch by batch, each batch in its own transaction, so memory
+        stays bounded at any scale. bulk_create() stamps auto_now_add fields with
+        the current time, so each batch is moved to its place in the date range
+        afterwards with one UPDATE per table.
+        """
+        now = timezone.now()
+        outcomes, weights = zip(*OUTCOMES)
+        fee = Decimal(str(getattr(settings, 'DELIVERY_FEE', '2.00')))
+        batches = (count + self.batch_size - 1) // self.batch_size
+        for batch in range(batches):
+            size = min(self.batch_size, count - batch * self.batch_size)
+            # oldest batches first, so ids and created_at grow together as in production
+            placed_at = now - timedelta(days=days) + timedelta(days=days) * batch / batches
+            with transaction.atomic():
+                orders, lines = [], []
+                for _ in range(size):
+                    merchant_id, vendor_id = self.random.choice(merchants)
+                    picked = self.random.sample(menus[merchant_id], min(self.random.randint(1, 4), len(menus[merchant_id])))
+                    items = [(product_id, price, self.random.randint(1, 3)) for product_id, price in picked]
+                    subtotal = sum((price * quantity for _, price, quantity in items), Decimal('0'))
+                    outcome = self.random.choices(outcomes, weights)[0]
+                    orders.append(Order(
+                        customer_id=self.random.choice(users['customer']), merchant_id=merchant_id,
+                        courier_id=(self.random.choice(users['courier'])
+                                    if users['courier'] and outcome in ('preparing', 'out_for_delivery', 'delivered') else None),
+                        status=outcome, subtotal=subtotal, fee=fee, total=subtotal + fee,
+                        rating=self.random.randint(1, 5) if outcome == 'delivered' and self.random.random() < 0.3 else None,
+                    ))
+                    lines.append((vendor_id, items))
+                orders = self.bulk_insert(Order, orders)
+
+                self.bulk_insert(OrderItem, (
+                    OrderItem(order_id=order.pk, product_id=product_id, price=price, quantity=quantity,
+                              total_price=price * quantity)
+                    for order, (_, items) in zip(orders, lines) for product_id, price, quantity in items))
+                history, notifications = [], []
+                for order, (vendor_id, _) in zip(orders, lines):
+                    steps = ['pending', 'cancelled'] if order.status == 'cancelled' else PIPELINE[:PIPELINE.index(order.status) + 1]
+                    for previous, new in zip(steps, steps[1:]):
+                        history.append(OrderStatusHistory(order_id=order.pk, previous_status=previous, new_status=new,
+                                                          changed_by_id=vendor_id))
+                        notifications.append(Notification(
+                            recipient_id=order.customer_id, is_read=self.random.random() < 0.8,
+                            message=f"Your order #{order.pk} status changed from '{previous}' to '{new}'."))
+                self.bulk_insert(OrderStatusHistory, history)
+                notifications = self.bulk_insert(Notification, notifications)
+
+                # pk ranges rather than id lists, which would outgrow SQLite's parameter limit
+                ids = (orders[0].pk, orders[-1].pk)
+                Order.objects.filter(pk__range=ids).update(created_at=placed_at)
+                for new_status, minutes in STEP_MINUTES.items():
+                    OrderStatusHistory.objects.filter(order_id__gte=ids[0], order_id__lte=ids[1], new_status=new_status).update(
+                        changed_at=placed_at + timedelta(minutes=minutes))
+                if notifications:
+                    Notification.objects.filter(pk__range=(notifications[0].pk, notifications[-1].pk)).update(created_at=placed_at)
@@ -0,0 +1,149 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Prefetch
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Merchant, Category, Product
+
+MENU_CACHE_TIMEOUT = getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 60 * 24)
+STATS_HITS = 'menu:stats:hits'
+STATS_MISSES = 'menu:stats:misses'
+
+
+def version_key(merchant_id):
+    return f'menu:version:{merchant_id}'
+
+
+def document_key(merchant_id, version):
+    return f'menu:{merchant_id}:{version}'
+
+
+def current_version(merchant_id):
+    """
+    The version token a merchant's menu is cached under.
+
+    Tokens are random rather than a counter, so a version key that got evicted
+    can never come back pointing at an old document.
+    """
+    key = version_key(merchant_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(merchant_id):
+    cache.set(version_key(merchant_id), uuid.uuid4().hex, None)
+
+
+def build_menu(merchant_id):
+    """
+    Build the denormalized menu document: merchant -> categories -> available products.
+
+    Read from the primary: a replica that hasn't caught up with an edit would
+    be cached under the version the edit bumped, for MENU_CACHE_TIMEOUT.
+    """
+    merchant = (Merchant.objects.using(DEFAULT_DB_ALIAS)
+                .prefetch_related(Prefetch(
+                    'category_set',
+                    queryset=Category.objects.using(DEFAULT_DB_ALIAS).order_by('name', 'id').prefetch_related(Prefetch(
+                        'product_set',
+                        queryset=Product.objects.using(DEFAULT_DB_ALIAS).filter(is_available=True).order_by('name', 'id'),
+                    )),
+                ))
+                .filter(pk=merchant_id).first())
+    if merchant is None:
+        return None
+    return {
+        'merchant': {
+            'id': merchant.id,
+            'user': merchant.user_id,
+            'name': merchant.name,
+            'merchant_type': merchant.merchant_type,
+            'city': merchant.city,
+            'is_open': merchant.is_open,
+            'status': merchant.status,
+        },
+        'categories': [
+            {
+                'id': category.id,
+                'name': category.name,
+                'description': category.description,
+                'products': [
+                    {
+                        'id': product.id,
+                        'name': product.name,
+                        'description': product.description,
+                        'price': str(product.price),
+                        'unit': product.unit,
+                    }
+                    for product in category.product_set.all()
+                ],
+            }
+            for category in merchant.category_set.all()
+        ],
+    }
+
+
+def get_menu(merchant_id):
+    """Return the cached menu document, building it on a miss. None if the merchant doesn't exist."""
+    key = document_key(merchant_id, current_version(merchant_id))
+    menu = cache.get(key)
+    if menu is not None:
+        _count(STATS_HITS)
+        return menu
+    _count(STATS_MISSES)
+    menu = build_menu(merchant_id)
+    if menu is not None:
+        cache.set(key, menu, MENU_CACHE_TIMEOUT)
+    return menu
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def menu_cache_stats():
+    hits = cache.get(STATS_HITS, 0)
+    misses = cache.get(STATS_MISSES, 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
+
+
+def reset_menu_cache_stats():
+    cache.delete_many([STATS_HITS, STATS_MISSES])
+
+
+def invalidate_menu(merchant_id):
+    # Bump only once the change is committed, otherwise a concurrent read could
+    # cache the old rows under the new version
+    transaction.on_commit(lambda: bump_version(merchant_id))
+
+
+@receiver([post_save, post_delete], sender=Merchant)
+def merchant_changed(sender, instance, **kwargs):
+    invalidate_menu(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    invalidate_menu(instance.merchant_id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    if Product.category.is_cached(instance):
+        merchant_id = instance.category.merchant_id
+    else:
+        merchant_id = Category.objects.filter(pk=instance.category_id).values_list('merchant_id', flat=True).first()
+    if merchant_id is not None:
+        invalidate_menu(merchant_id)
@@ -0,0 +1,250 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject
+
+# upper bounds, in seconds, of the request latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointStats:
+    __slots__ = ('requests', 'seconds', 'buckets', 'queries', 'query_seconds', 'response_bytes')
+
+    def __init__(self, bucket_count):
+        self.requests = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (bucket_count + 1)  # per bucket, not cumulative; the last is +Inf
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    """
+    In-process aggregates of every request, keyed by (route, method, role).
+
+    observe() is a lock, a dict lookup and a handful of additions, so it can
+    sit on every request; the work of building cumulative buckets and text is
+    left to render(), which only runs when /metrics is scraped. Each worker
+    process keeps its own registry, so scrape every worker (or sum them).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bucket_bounds = tuple(sorted(buckets))
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds, queries=0, query_seconds=0.0, response_bytes=0):
+        bucket = bisect_left(self.bucket_bounds, seconds)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats(len(self.bucket_bounds))
+            stats.requests += 1
+            stats.seconds += seconds
+            stats.buckets[bucket] += 1
+            stats.queries += queries
+            stats.query_seconds += query_seconds
+            stats.response_bytes += response_bytes
+
+    def add_response_bytes(self, key, response_bytes):
+        """Streamed bodies are only measured once they have been sent."""
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is not None:
+                stats.response_bytes += response_bytes
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (stats.requests, stats.seconds, list(stats.buckets), stats.queries,
+                          stats.query_seconds, stats.response_bytes)
+                    for key, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def render(self):
+        """The aggregates in the Prometheus text exposition format (version 0.0.4)."""
+        snapshot = sorted(self.snapshot().items())
+        lines = [
+            '# HELP api_request_duration_seconds Time from the first middleware to the response, by route, method and role.',
+            '# TYPE api_request_duration_seconds histogram',
+        ]
+        for key, (requests, seconds, buckets, _, _, _) in snapshot:
+            labels = format_labels(key)
+            cumulative = 0
+            for bound, count in zip(self.bucket_bounds, buckets):
+                cumulative += count
+                lines.append(f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} {requests}')
+            lines.append(f'api_request_duration_seconds_sum{{{labels}}} {seconds!r}')
+            lines.append(f'api_request_duration_seconds_count{{{labels}}} {requests}')
+        for name, position, kind, help_text in [
+            ('api_db_queries_total', 3, 'counter', 'SQL queries run while handling requests.'),
+            ('api_db_query_duration_seconds_total', 4, 'counter', 'Time spent executing those queries.'),
+            ('api_response_bytes_total', 5, 'counter', 'Response body bytes sent.'),
+        ]:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key, values in snapshot:
+                lines.append(f'{name}{{{format_labels(key)}}} {values[position]!r}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(key):
+    route, method, role = key
+    return f'route="{escape(route)}",method="{escape(method)}",role="{escape(role)}"'
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry(getattr(settings, 'METRICS_LATENCY_BUCKETS', DEFAULT_BUCKETS))
+    return _registry
+
+
+def request_role(request):
+    """
+    The role of whoever the view authenticated, without authenticating anyone itself.
+
+    DRF stores the user it authenticated on the Django request; until then
+    request.user is AuthenticationMiddleware's lazy session lookup, which is
+    left unevaluated.
+    """
+    user = request.__dict__.get('user')
+    if user is None or isinstance(user, SimpleLazyObject):
+        return 'anonymous'
+    return getattr(user, 'role', None) or 'anonymous'
+
+
+class QueryTimer:
+    """Counts the queries of one request and the time spent in them."""
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+# the QueryTimer of the request being handled, set by MetricsMiddleware
+current_timer = ContextVar('metrics_query_timer', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    execute_wrapper of every connection, timing queries for whichever request runs them.
+
+    Connections belong to threads, and under ASGI a request's queries run in
+    a worker thread rather than where the middleware runs; the context
+    variable follows the request there, a wrapper entered by the middleware
+    would not.
+    """
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, SQL queries and response size per resolved route (the URL
+    name, e.g. 'order-list'), HTTP method and role into get_registry().
+
+    Goes first in MIDDLEWARE so the latency covers the whole stack, and runs
+    sync or async to match it. For streamed responses latency ends when the
+    response is returned and the queries the body runs while it is sent are
+    not counted; its size is added once sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.registry = get_registry()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.observe(request, response, time.perf_counter() - start, timer)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.observe(request, response, time.perf_counter() - start, timer)
+
+    def observe(self, request, response, seconds, timer):
+        match = request.resolver_match
+        key = (match.view_name if match is not None else 'unmatched', request.method, request_role(request))
+        if response.streaming:
+            response_bytes = 0
+            if response.is_async:
+                response.streaming_content = self.acount_streamed(response.streaming_content, key)
+            else:
+                response.streaming_content = self.count_streamed(response.streaming_content, key)
+        else:
+            response_bytes = len(response.content)
+        self.registry.observe(key, seconds, timer.queries, timer.seconds, response_bytes)
+        return response
+
+    def count_streamed(self, chunks, key):
+        sent = 0
+        try:
+            for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            self.registry.add_response_bytes(key, sent)
+
+    async def acount_streamed(self, chunks, key):
+        sent = 0
+        try:
+            async for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            self.registry.add_response_bytes(key, sent)
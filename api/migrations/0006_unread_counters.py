@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def seed_counters(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    UnreadNotificationCounter = apps.get_model('api', 'UnreadNotificationCounter')
+    users = User.objects.annotate(unread=Count('notifications', filter=Q(notifications__is_read=False)))
+    UnreadNotificationCounter.objects.bulk_create(
+        (UnreadNotificationCounter(user_id=user_id, unread=unread) for user_id, unread in users.values_list('id', 'unread').iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadNotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_courier_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchant',
+            name='prep_time_avg',
+            field=models.PositiveIntegerField(default=20),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_merchant_prep_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MerchantStats',
+            fields=[
+                ('merchant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.merchant')),
+                ('prep_count', models.PositiveIntegerField(default=0)),
+                ('prep_seconds_sum', models.FloatField(default=0)),
+                ('prep_seconds_ema', models.FloatField(blank=True, null=True)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='rating',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_merchant_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MerchantDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='api.merchant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='merchant_sales_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('merchant', 'day'), name='merchant_sales_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_daily_sales', to='api.merchant')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['merchant', 'day'], name='product_sales_merchant_day_idx'), models.Index(fields=['day'], name='product_sales_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='product_sales_day_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:01
+
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+
+def busy_couriers_are_on_duty(apps, schema_editor):
+    # is_available was also cleared while a courier carried an order
+    CourierLocation = apps.get_model('api', 'CourierLocation')
+    Order = apps.get_model('api', 'Order')
+    active = Order.objects.filter(courier_id=OuterRef('pk')).exclude(status__in=('delivered', 'cancelled'))
+    CourierLocation.objects.filter(Exists(active), on_duty=False).update(on_duty=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='courierlocation',
+            old_name='is_available',
+            new_name='on_duty',
+        ),
+        migrations.RunPython(busy_couriers_are_on_duty, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, router, transaction
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver 
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
+from .signals import notifications_created
 
 
 class CustomUserManager(BaseUserManager):
@@ -37,16 +41,83 @@ class User(AbstractBaseUser, PermissionsMixin):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)  
+    # Signed into access tokens; bumped when a claim changes so older tokens stop working
+    token_version = models.PositiveIntegerField(default=0)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name', 'phone']
+    CLAIM_FIELDS = ('role', 'status', 'is_active')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_claims = tuple(instance.__dict__.get(name) for name in cls.CLAIM_FIELDS)
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_claims', None)
+        claims = tuple(self.__dict__.get(name) for name in self.CLAIM_FIELDS)
+        revoke = loaded is not None and loaded != claims
+        if revoke:
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        super().save(*args, **kwargs)
+        self._loaded_claims = claims
+        if revoke:
+            using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+            transaction.on_commit(lambda: forget_token_version(self.pk), using=using)
 
     def __str__(self):
         return self.email
 
 
+class TokenUser(User):
+    """
+    A User built from the signed claims of an access token (see api/authentication.py).
+
+    id, role, status and is_active come from the token. Touching any other
+    field loads the rest of the row at once, through a short-lived cache,
+    instead of one query per deferred field; the password hash is left out
+    of the cache and only read if it is touched.
+    """
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, user_id, role, status, token_version, db='default'):
+        claims = {'id': user_id, 'role': role, 'status': status, 'is_active': True, 'token_version': token_version}
+        names = [field.attname for field in cls._meta.concrete_fields if field.attname in claims]
+        return cls.from_db(db, names, [claims[name] for name in names])
+
+    # never put in the shared cache; loaded from the database on their own when touched
+    uncached_fields = frozenset({'password'})
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if (fields is None or from_queryset is not None or not deferred.issuperset(fields)
+                or self.uncached_fields.intersection(fields)):
+            return super().refresh_from_db(using, fields, from_queryset)
+        cached = [field.attname for field in User._meta.concrete_fields if field.attname not in self.uncached_fields]
+        key = f'auth:user-fields:{self.pk}:{self.token_version}'
+        row = cache.get(key)
+        if row is None:
+            row = User.objects.using(using or self._state.db).values(*cached).get(pk=self.pk)
+            cache.set(key, row, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 30))
+        for name in deferred.intersection(cached):
+            setattr(self, name, row[name])
+
+
+def token_version_key(user_id):
+    return f'auth:version:{user_id}'
+
+
+def forget_token_version(user_id):
+    cache.delete(token_version_key(user_id))
+
+
 class Merchant(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='merchants')
     name = models.CharField(max_length=255)
@@ -55,15 +126,56 @@ class Merchant(models.Model):
     city = models.CharField(max_length=100)
     is_open = models.BooleanField(default=True)
     status = models.CharField(max_length=50, default='active')
+    # pickup point couriers are dispatched to (see api/dispatch.py)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    prep_time_avg = models.PositiveIntegerField(default=20)  # minutes; the estimate until MerchantStats learns one
+    # catalog rows carry updated_at for the conditional GETs of api/conditional.py
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # customers only browse open, approved merchants, usually by city
+            models.Index(fields=['status', 'is_open'], name='merchant_status_open_idx'),
+            models.Index(fields=['city', 'status'], name='merchant_city_status_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class MerchantStats(models.Model):
+    """
+    Running aggregates of a merchant's orders, kept in step by api/stats.py.
+
+    Kept beside Merchant rather than on it so a vendor saving their merchant
+    can never write back stale aggregates.
+    """
+    merchant = models.OneToOneField(Merchant, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    # confirmed -> out_for_delivery
+    prep_count = models.PositiveIntegerField(default=0)
+    prep_seconds_sum = models.FloatField(default=0)
+    prep_seconds_ema = models.FloatField(null=True, blank=True)
+    # customer ratings, 1-5
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating = models.FloatField(null=True, blank=True)  # rating_sum / rating_count, stored for ordering
+    # set by apply_to_stats() too, whose F() updates bypass auto_now
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def prep_seconds_mean(self):
+        return self.prep_seconds_sum / self.prep_count if self.prep_count else None
+
+    def __str__(self):
+        return f"{self.merchant_id}: {self.rating_count} ratings, {self.prep_count} preparations"
+
+
 class Category(models.Model):
     merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -77,6 +189,13 @@ class Product(models.Model):
     unit = models.CharField(max_length=20, default='pcs')
     stock = models.IntegerField(default=0)
     is_available = models.BooleanField(default=True)
+    # set by api/inventory.py too, whose F() updates bypass auto_now
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_available', 'category'], name='product_available_cat_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -99,6 +218,33 @@ class Order(models.Model):
     fee = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
+    rating = models.PositiveSmallIntegerField(null=True, blank=True)  # 1-5, given by the customer once delivered
+
+    class Meta:
+        # every role's order list is filtered on one FK and sorted newest first
+        indexes = [
+            models.Index(fields=['customer', '-created_at', '-id'], name='order_customer_created_idx'),
+            models.Index(fields=['courier', '-created_at', '-id'], name='order_courier_created_idx'),
+            models.Index(fields=['merchant', '-created_at', '-id'], name='order_merchant_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the status as loaded so a later save() doesn't have to re-read it
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        # Join the caller's transaction so the status history and notifications
+        # written by the post_save receiver commit together with the order row
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+        # post_save receivers read _status_change; it only describes this save
+        self._status_change = None
+        self._loaded_status = self.status
 
     def __str__(self):
         return f"Order #{self.id} ({self.customer.name})"
@@ -124,6 +270,12 @@ class OrderStatusHistory(models.Model):
     changed_by = models.ForeignKey('User', on_delete=models.SET_NULL, null=True, blank=True)
     changed_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'changed_at', 'id'], name='history_order_changed_idx'),
+            models.Index(fields=['-changed_at', '-id'], name='history_changed_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.order.id}: {self.previous_status} → {self.new_status}"
 
@@ -134,57 +286,235 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notif_recipient_created_idx'),
+            models.Index(fields=['recipient', 'is_read', '-created_at', '-id'], name='notif_recipient_unread_idx'),
+        ]
+
     def __str__(self):
         return f"To {self.recipient.name}: {self.message[:40]}"
 
 
-    @receiver(pre_save, sender=Order)
-    def notify_order_status_change(sender, instance, **kwargs):
-        if not instance.pk:
-            return  # ignore brand new orders
-        try:
-            previous = Order.objects.get(pk=instance.pk)
-        except Order.DoesNotExist:
-            return
+class UnreadNotificationCounter(models.Model):
+    """Denormalized count of a user's unread notifications, kept in step by api/unread.py."""
+    user = models.OneToOneField('User', on_delete=models.CASCADE, primary_key=True, related_name='unread_counter')
+    unread = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
 
-    # Only act if the status actually changed
-        if previous.status != instance.status:
-            message = f"Your order #{instance.id} status changed from '{previous.status}' to '{instance.status}'."
 
-        # Notify the customer
-        Notification.objects.create(
-            recipient=instance.customer,
-            message=message
-        )
+class CourierLocation(models.Model):
+    """A courier's last reported position and whether they are on duty; busy ones have an active order (see api/dispatch.py)."""
+    courier = models.OneToOneField('User', on_delete=models.CASCADE, primary_key=True, related_name='location')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    on_duty = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.courier_id} at ({self.latitude}, {self.longitude})"
+
+
+class MerchantDailySales(models.Model):
+    """
+    One merchant's finished orders for one day (the day they were placed), kept in step by api/rollups.py.
+
+    Revenue, orders and items count delivered orders only; cancelled ones
+    only add to `cancelled`.
+    """
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['merchant', 'day'], name='merchant_sales_day_uniq'),
+        ]
+        indexes = [
+            # the admin dashboard sums every merchant over a range of days
+            models.Index(fields=['day'], name='merchant_sales_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.merchant_id} on {self.day}: {self.orders} orders, {self.revenue}"
+
+
+class ProductDailySales(models.Model):
+    """One product's share of MerchantDailySales: orders are the delivered orders that contained it."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='product_daily_sales')
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='product_sales_day_uniq'),
+        ]
+        indexes = [
+            # a vendor's top products are read per merchant over a range of days
+            models.Index(fields=['merchant', 'day'], name='product_sales_merchant_day_idx'),
+            models.Index(fields=['day'], name='product_sales_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.quantity} sold"
 
-        # Notify the courier (if assigned)
-        if instance.courier:
-            Notification.objects.create(
-                recipient=instance.courier,
-                message=f"Order #{instance.id} updated to '{instance.status}'."
-            )
-
-        # Notify the vendor (merchant owner)
-        if instance.merchant.user:
-            Notification.objects.create(
-                recipient=instance.merchant.user,
-                message=f"Order #{instance.id} status is now '{instance.status}'."
-            )
-
-    @receiver(pre_save, sender=Order)
-    def log_order_status_change(sender, instance, **kwargs):
-        """Track and log when order status changes."""
-        if not instance.pk:
-            return  # New order, no previous status yet
-        try:
-            previous = Order.objects.get(pk=instance.pk)
-        except Order.DoesNotExist:
+
+class OutgoingEmail(models.Model):
+    """Transactional outbox: mail is queued with the row that triggers it and sent by a worker."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.TextField()  # comma separated
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+
+class SearchIndexEntry(models.Model):
+    """One token of a searchable object (see api/search.py), weighted by field and frequency."""
+    kind = models.CharField(max_length=20)  # product, merchant
+    object_id = models.BigIntegerField()
+    token = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # token lookups (exact and prefix) and per-object reindexing
+            models.Index(fields=['kind', 'token', 'object_id'], name='search_kind_token_idx'),
+            models.Index(fields=['object_id', 'kind'], name='search_object_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}: {self.token} ({self.weight})"
+
+
+class ProductStockShard(models.Model):
+    """
+    A slice of a hot product's stock (see api/inventory.py).
+
+    Concurrent reservations spread over the shards instead of all queueing on
+    the lock of the single Product row.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shards')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='unique_product_stock_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}/{self.shard}: {self.stock}"
+
+
+class StockReservation(models.Model):
+    """Stock taken off a product for a checkout, returned if the order isn't confirmed in time."""
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)  # set when taken from a ProductStockShard
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_exp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} ({self.status})"
+
+
+@receiver(pre_save, sender=Order)
+def capture_previous_status(sender, instance, raw=False, using=None, **kwargs):
+    """Work out the status the row had before this save, reading it at most once."""
+    instance._status_change = None
+    if raw or not instance.pk:
+        return  # ignore fixtures and brand new orders
+
+    previous_status = getattr(instance, '_loaded_status', None)
+    vendor_id = instance.merchant.user_id if Order.merchant.is_cached(instance) else None
+
+    # Only hit the database when the caller didn't load the row itself, or
+    # when the status changed and we still need the merchant owner to notify
+    if previous_status is None or (previous_status != instance.status and vendor_id is None):
+        row = (Order.objects.using(using)
+               .filter(pk=instance.pk)
+               .values_list('status', 'merchant__user_id')
+               .first())
+        if row is None:
             return
-        if previous.status != instance.status:
-        # Create a status history record
-            OrderStatusHistory.objects.create(
-            order=instance,
-            previous_status=previous.status,
-            new_status=instance.status,
-            changed_by=getattr(instance, '_updated_by', None)
-        )
\ No newline at end of file
+        previous_status, vendor_id = row
+
+    if previous_status != instance.status:
+        instance._status_change = (previous_status, vendor_id)
+
+
+@receiver(post_save, sender=Order)
+def record_order_status_change(sender, instance, created, raw=False, using=None, **kwargs):
+    """Log the status transition and notify everyone involved in one bulk insert."""
+    change = getattr(instance, '_status_change', None)
+    if created or raw or change is None:
+        return
+    previous_status, vendor_id = change
+
+    OrderStatusHistory.objects.using(using).create(
+        order=instance,
+        previous_status=previous_status,
+        new_status=instance.status,
+        changed_by=getattr(instance, '_updated_by', None)
+    )
+
+    # Recipients are resolved from FK ids so no related rows get loaded
+    notifications = [
+        Notification(
+            recipient_id=instance.customer_id,
+            message=f"Your order #{instance.id} status changed from '{previous_status}' to '{instance.status}'."
+        )
+    ]
+    if instance.courier_id:
+        notifications.append(Notification(
+            recipient_id=instance.courier_id,
+            message=f"Order #{instance.id} updated to '{instance.status}'."
+        ))
+    if vendor_id:
+        notifications.append(Notification(
+            recipient_id=vendor_id,
+            message=f"Order #{instance.id} status is now '{instance.status}'."
+        ))
+    Notification.objects.using(using).bulk_create(notifications)
+    notifications_created.send(sender=Notification, notifications=notifications, using=using)
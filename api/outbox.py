@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_LEASE_SECONDS = 600
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+
+
+def enqueue_email(subject, body, from_email, recipients):
+    """Queue an email; it is only sent once the surrounding transaction commits."""
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email,
+        to=','.join(recipients),
+    )
+
+
+def backoff(attempts):
+    """Exponential backoff: 30s, 1m, 2m, 4m... capped at an hour."""
+    return min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX)
+
+
+def claim(batch_size):
+    """
+    Lease up to `batch_size` due emails to this worker and return them.
+
+    Rows are picked with SELECT ... FOR UPDATE SKIP LOCKED where the database
+    supports it and pushed EMAIL_OUTBOX_LEASE_SECONDS into the future before
+    the transaction commits, so other workers skip them while they are sent
+    without any lock held. A worker that dies mid-batch leaves its rows to be
+    picked up again once the lease runs out.
+    """
+    lease = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+    with transaction.atomic():
+        batch = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if batch:
+            OutgoingEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt_at=timezone.now() + lease)
+    return batch
+
+
+def record_failure(email, exc, max_attempts):
+    email.last_error = f"{type(exc).__name__}: {exc}"
+    if email.attempts >= max_attempts:
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = timezone.now() + backoff(email.attempts)
+
+
+def drain_outbox(batch_size=100, max_attempts=None, connection=None):
+    """
+    Send one batch of due emails over a single mail connection.
+
+    The batch is claim()ed first, so several workers can drain the table side
+    by side and no row lock is held while SMTP is talked to. When the mail
+    connection can't be opened the whole batch counts an attempt and backs
+    off. Returns (sent, failed) counts for the batch.
+    """
+    max_attempts = max_attempts or getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    sent = failed = 0
+    batch = claim(batch_size)
+    if not batch:
+        return sent, failed
+
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        for email in batch:
+            email.attempts += 1
+            record_failure(email, exc, max_attempts)
+        failed = len(batch)
+    else:
+        try:
+            for email in batch:
+                message = EmailMessage(email.subject, email.body, email.from_email,
+                                       email.to.split(','), connection=connection)
+                email.attempts += 1
+                try:
+                    message.send()
+                except Exception as exc:
+                    failed += 1
+                    record_failure(email, exc, max_attempts)
+                else:
+                    sent += 1
+                    email.status = 'sent'
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+        finally:
+            connection.close()
+
+    OutgoingEmail.objects.bulk_update(
+        batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    return sent, failed
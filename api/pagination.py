@@ -0,0 +1,147 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over a (timestamp, id) pair, newest first.
+
+    Each page is a `WHERE (ts, id) < (?, ?) ORDER BY ts DESC, id DESC LIMIT n`
+    lookup, so page 5,000 costs the same as page 1 and no COUNT(*) is issued.
+    The view picks the timestamp with `cursor_ordering`, e.g. ('-created_at', '-id').
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, page_size=None):
+        self.page_size = page_size or api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.field = getattr(view, 'cursor_ordering', ('-created_at', '-id'))[0].lstrip('-')
+        page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        reverse = position is not None and position['d'] == 'p'
+        if reverse:
+            queryset = queryset.order_by(self.field, 'id')
+        else:
+            queryset = queryset.order_by(f'-{self.field}', '-id')
+
+        if position is not None:
+            ts, pk = position['ts'], position['id']
+            if reverse:
+                queryset = queryset.filter(Q(**{f'{self.field}__gt': ts}) | Q(**{self.field: ts, 'id__gt': pk}))
+            else:
+                queryset = queryset.filter(Q(**{f'{self.field}__lt': ts}) | Q(**{self.field: ts, 'id__lt': pk}))
+
+        # fetch one extra row to know if there is another page without counting
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.page = results
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            position['ts'] = parse_datetime(position['ts'])
+            position['id'] = int(position['id'])
+            if position['ts'] is None or position['d'] not in ('n', 'p'):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    @staticmethod
+    def encode_cursor(obj, field, direction='n'):
+        position = {'d': direction, 'ts': getattr(obj, field).isoformat(), 'id': obj.pk}
+        return base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(self.page[-1], self.field, 'n'))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(self.page[0], self.field, 'p'))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class FeedPagination(PageNumberPagination):
+    """
+    The project's usual page-number pagination, with keyset pagination as an opt-in.
+
+    Clients switch to keyset mode with `?pagination=cursor` (or by following a
+    `cursor` link); the response then has next/previous links but no count.
+    `?page_size=` applies in both modes.
+    """
+    mode_query_param = 'pagination'
+    page_size_query_param = KeysetPagination.page_size_query_param
+    max_page_size = KeysetPagination.max_page_size
+
+    def use_keyset(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or KeysetPagination.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = KeysetPagination(page_size=self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
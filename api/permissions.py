@@ -1,5 +1,37 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+
+def owner_id(obj, path):
+    """
+    Id of the user at the end of `path` ('user', 'merchant__user', ...) for `obj`.
+
+    Read without a query when possible: from an annotation named after the path
+    ('merchant_user_id'), from the FK id on the object itself ('user_id',
+    'customer_id'), or by following relations the queryset select_related.
+    Anything else costs one values_list() query, remembered on the object.
+    """
+    annotation = path.replace('__', '_') + '_id'
+    if annotation in obj.__dict__:
+        return obj.__dict__[annotation]
+
+    *relations, last = path.split('__')
+    current = obj
+    for name in relations:
+        field = current._meta.get_field(name)
+        if not field.is_cached(current):
+            current = None
+            break
+        current = field.get_cached_value(current)
+        if current is None:
+            return None
+    if current is not None:
+        return getattr(current, current._meta.get_field(last).attname)
+
+    value = type(obj)._base_manager.filter(pk=obj.pk).values_list(path, flat=True).first()
+    obj.__dict__[annotation] = value
+    return value
+
+
 class IsAdmin(BasePermission):
     """Allow only users with role='admin'."""
     def has_permission(self, request, view):
@@ -11,10 +43,17 @@ class IsVendor(BasePermission):
         return bool(request.user and request.user.role == 'vendor')
 
 class IsCourier(BasePermission):
-    """Allow only couriers."""
+    """Allow couriers, and only to change the orders assigned to them."""
     def has_permission(self, request, view):
         return bool(request.user and request.user.role == 'courier')
 
+    def has_object_permission(self, request, view, obj):
+        if request.user.role == 'admin':
+            return True
+        if getattr(obj, 'courier_id', None) == request.user.pk:
+            return True
+        return request.method in SAFE_METHODS #allow safe reads for testing
+
 class IsCustomer(BasePermission):
     """Allow only customers."""
     def has_permission(self, request, view):
@@ -26,37 +65,25 @@ class ReadOnly(BasePermission):
         return request.method in SAFE_METHODS
 
 class IsOwnerOrAdmin(BasePermission):
-    def has_object_permission(self, request, view, obj):
-        # Admins can always do anything
-        if request.user.role == 'admin':
-            return True
-
-        # Vendors: can only modify their own merchant or product
-        if hasattr(obj, 'user'):  # Merchant model
-            return obj.user == request.user
+    """
+    Admins, or the user who owns the object.
 
-        if hasattr(obj, 'merchant'):  # Category, Product
-            return obj.merchant.user == request.user 
+    Reads are left to the viewset's get_queryset, which already limits what
+    each role can see. Ownership is compared on user ids (see owner_id), so
+    viewsets that annotate or select_related the owner pay no query for it.
+    """
+    owner_paths = {
+        'merchant': ('user',),                          # vendors own their merchant
+        'category': ('merchant__user',),                # ... and what hangs off it
+        'product': ('category__merchant__user',),
+        'order': ('merchant__user', 'customer'),        # customers own their orders
+        'orderitem': ('order__merchant__user', 'order__customer'),
+    }
 
-        # Customers: can only view their own orders
-        if hasattr(obj, 'customer'):
-            return obj.customer == request.user
-
-        return False
-    
-class IsCourier(BasePermission):
-    #Allow couriers to access only their assigned orders.
-    def has_permission(self, request, view):
-        return bool(request.user and request.user.role == 'courier')
-    #Couriers can view and update orders assigned to them 
     def has_object_permission(self, request, view, obj):
-        if request.user.role == 'admim':
+        # Admins can always do anything
+        if request.user.role == 'admin' or request.method in SAFE_METHODS:
             return True
-        if hasattr(obj, 'courier') and obj.courier == request.user:
-            return True 
-        return request.method in SAFE_METHODS #allow safe reads for testing
-    
-class IsOwnerOrAdmin(BasePermission):
-    def has_object_permission(self, request, view, obj):
-        return request.user == obj.user or getattr(request.user, 'role', None) == 'admin'
-        
\ No newline at end of file
+
+        paths = self.owner_paths.get(obj._meta.model_name, ())
+        return any(owner_id(obj, path) == request.user.pk for path in paths)
@@ -0,0 +1,119 @@
+import math
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F, FloatField
+from django.db.models.functions import Ceil, Coalesce
+
+try:
+    import numpy as np
+except ImportError:  # the listing still works, one merchant at a time
+    np = None
+
+from .dispatch import EARTH_RADIUS_KM, distance_km
+
+QUOTE_ORDERINGS = {'distance': 'distance', 'delivery_fee': 'fee', 'eta': 'eta'}
+
+
+def pricing_settings():
+    return (
+        float(Decimal(str(getattr(settings, 'DELIVERY_FEE', '2.00')))),
+        float(Decimal(str(getattr(settings, 'DELIVERY_FEE_PER_KM', '0.50')))),
+        float(getattr(settings, 'DELIVERY_FEE_INCLUDED_KM', 2)),
+        float(getattr(settings, 'COURIER_SPEED_KMH', 25)),
+        float(getattr(settings, 'DELIVERY_PICKUP_MINUTES', 5)),
+    )
+
+
+def quote(latitude, longitude, latitudes, longitudes, prep_minutes):
+    """
+    Distance, delivery fee and ETA from every merchant to one customer.
+
+    The fee is DELIVERY_FEE plus DELIVERY_FEE_PER_KM for each kilometre past
+    DELIVERY_FEE_INCLUDED_KM; the ETA is the merchant's preparation time, a pickup
+    allowance and the ride at COURIER_SPEED_KMH. With NumPy the whole batch is
+    a handful of array operations; returns arrays (or lists without NumPy).
+    """
+    base_fee, per_km, included_km, speed, pickup = pricing_settings()
+    if np is None:
+        distances = [distance_km(latitude, longitude, lat, lon) for lat, lon in zip(latitudes, longitudes)]
+        fees = [round(base_fee + per_km * max(distance - included_km, 0), 2) for distance in distances]
+        etas = [math.ceil(prep + pickup + distance / speed * 60) for prep, distance in zip(prep_minutes, distances)]
+        return distances, fees, etas
+
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    fees = np.round(base_fee + per_km * np.maximum(distances - included_km, 0), 2)
+    etas = np.ceil(np.asarray(prep_minutes) + pickup + distances / speed * 60)
+    return distances, fees, etas
+
+
+class QuotedMerchants:
+    """
+    A merchant queryset priced for one customer, sorted and filtered on the quotes.
+
+    Only ids, coordinates and prep times are read up front (one query); the
+    merchant rows themselves are loaded a page at a time when the paginator
+    slices this sequence, with distance_km, delivery_fee and eta_minutes set
+    on each instance.
+    """
+
+    def __init__(self, queryset, latitude, longitude, ordering=None, max_fee=None, max_eta=None, max_distance=None):
+        self.queryset = queryset
+        # the learned preparation time once there is one, else the merchant's own estimate
+        prep = Coalesce(Ceil(F('stats__prep_seconds_ema') / 60), F('prep_time_avg'), output_field=FloatField())
+        rows = list(queryset
+                    .filter(latitude__isnull=False, longitude__isnull=False)
+                    .values_list('pk', 'latitude', 'longitude', prep))
+        if np is not None:
+            columns = np.array(rows, dtype=float).reshape(-1, 4).T
+            ids = columns[0].astype(np.int64)
+        else:
+            columns = list(zip(*rows)) or [(), (), (), ()]
+            ids = columns[0]
+        self.distances, self.fees, self.etas = quote(latitude, longitude, *columns[1:])
+        quotes = {'distance': self.distances, 'fee': self.fees, 'eta': self.etas}
+
+        limits = [(self.fees, max_fee), (self.etas, max_eta), (self.distances, max_distance)]
+        descending = bool(ordering) and ordering.startswith('-')
+        key = QUOTE_ORDERINGS.get((ordering or '').lstrip('-'))
+
+        if np is not None:
+            keep = np.ones(len(ids), dtype=bool)
+            for values, limit in limits:
+                if limit is not None:
+                    keep &= values <= limit
+            order = np.flatnonzero(keep)
+            if key is not None:
+                # stable, so ties keep the queryset's own order (search rank, ...)
+                values = quotes[key][order]
+                order = order[np.argsort(-values if descending else values, kind='stable')]
+        else:
+            order = [i for i in range(len(ids))
+                     if all(limit is None or values[i] <= limit for values, limit in limits)]
+            if key is not None:
+                order.sort(key=lambda i: quotes[key][i], reverse=descending)
+        self.ids = ids
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def count(self):
+        return len(self.order)
+
+    def __getitem__(self, index):
+        positions = self.order[index] if isinstance(index, slice) else [self.order[index]]
+        merchants = self.queryset.in_bulk([int(self.ids[i]) for i in positions])
+        page = []
+        for i in positions:
+            merchant = merchants.get(int(self.ids[i]))
+            if merchant is None:
+                continue  # deleted since the quotes were taken
+            merchant.distance_km = round(float(self.distances[i]), 2)
+            merchant.delivery_fee = Decimal(f'{float(self.fees[i]):.2f}')
+            merchant.eta_minutes = int(self.etas[i])
+            page.append(merchant)
+        return page if isinstance(index, slice) else page[0]
@@ -0,0 +1,220 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from . import metrics
+from .authentication import ClaimsJWTAuthentication
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_FLAG = 'profile'
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{12}-[0-9a-f]{8}$')
+STATS_LINES = 60  # of the cumulative-time listing kept in the report
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'var' / 'profiles'))
+
+
+def max_profiles():
+    return getattr(settings, 'PROFILING_MAX_FILES', 50)
+
+
+def report_path(profile_id):
+    """The JSON report of `profile_id`, or None for ids that aren't ours (so no path tricks)."""
+    if not PROFILE_ID.match(profile_id or ''):
+        return None
+    return profile_dir() / f'{profile_id}.json'
+
+
+def stats_path(profile_id):
+    path = report_path(profile_id)
+    return None if path is None else path.with_suffix('.prof')
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    profiles = []
+    for path in sorted(profile_dir().glob('*.json'), reverse=True):
+        try:
+            with open(path) as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue  # being written or pruned right now
+        profiles.append({key: report[key] for key in
+                         ('id', 'created_at', 'method', 'path', 'status', 'duration_ms', 'queries', 'query_ms')})
+    return profiles
+
+
+def prune(keep):
+    """Drop the oldest profiles beyond `keep`; ids sort by creation time."""
+    reports = sorted(profile_dir().glob('*.json'))
+    for path in reports[:max(len(reports) - keep, 0)]:
+        for stale in (path, path.with_suffix('.prof')):
+            try:
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# the query wrappers themselves are never where a query came from
+INSTRUMENTATION = {__file__, metrics.__file__}
+
+
+def is_project_file(filename):
+    return filename.startswith(str(settings.BASE_DIR)) and 'site-packages' not in filename and filename not in INSTRUMENTATION
+
+
+def query_origin(frame):
+    """
+    Where a query came from, read off the stack that ran it: the innermost
+    project frames, plus the serializer field, permission class and signal
+    receiver on the way there, when there is one.
+    """
+    origin = {'stack': []}
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename
+        if is_project_file(filename):
+            if len(origin['stack']) < 5:
+                origin['stack'].append(f'{os.path.relpath(filename, settings.BASE_DIR)}:{frame.f_lineno} in {code.co_name}')
+        elif 'rest_framework' in filename:
+            local = frame.f_locals
+            if 'serializer_field' not in origin and code.co_name == 'to_representation' and 'field' in local:
+                origin['serializer_field'] = f"{type(local.get('self')).__name__}.{getattr(local['field'], 'field_name', '?')}"
+            elif 'permission' not in origin and code.co_name.startswith('check_') and 'permission' in local:
+                origin['permission'] = type(local['permission']).__name__
+        elif 'receiver' not in origin and code.co_name == 'send' and filename.endswith(os.path.join('dispatch', 'dispatcher.py')):
+            receiver = frame.f_locals.get('receiver')
+            if receiver is not None:
+                origin['receiver'] = f'{receiver.__module__}.{receiver.__qualname__}'
+        frame = frame.f_back
+    return origin
+
+
+class QueryLog:
+    """execute_wrapper() callable keeping every query with its duration and origin."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+                'database': context['connection'].alias,
+                **query_origin(sys._getframe(1)),
+            })
+
+
+def wants_profile(request):
+    """The flag is set and the request carries an admin's token; costs two dict lookups when it isn't set."""
+    if request.META.get(HEADER) != '1' and request.GET.get(QUERY_FLAG) != '1':
+        return False
+    try:
+        authenticated = ClaimsJWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return authenticated is not None and authenticated[0].role == 'admin'
+
+
+class ProfilingMiddleware:
+    """
+    Profile one request when an admin asks for it with `X-Profile: 1` or `?profile=1`.
+
+    The request runs under cProfile with every SQL query logged, and the
+    result is written to PROFILING_DIR as `<id>.prof` (pstats, for snakeviz
+    and friends) and `<id>.json` (summary, SQL log, top of the stats). Only
+    the newest PROFILING_MAX_FILES are kept. The response carries the id in
+    `X-Profile-Id`; /api/v1/profiles/ lists and serves them to admins.
+
+    Under ASGI a profiled request is driven from a worker thread, which is
+    where its sync views and ORM calls run too; the coroutines of async
+    views run on the event loop, outside the profile, but their SQL is logged.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not wants_profile(request):
+            return self.get_response(request)
+        return self.profile(request, self.get_response)
+
+    async def __acall__(self, request):
+        # the flag is checked before anything costs a thread hop
+        if request.META.get(HEADER) != '1' and request.GET.get(QUERY_FLAG) != '1':
+            return await self.get_response(request)
+        if not await sync_to_async(wants_profile)(request):
+            return await self.get_response(request)
+        return await sync_to_async(self.profile)(request, async_to_sync(self.get_response))
+
+    def profile(self, request, get_response):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another request is being profiled right now (one profiler per process on 3.12+)
+            return get_response(request)
+        log = QueryLog()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(log))
+                response = get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+
+        profile_id = f'{timezone.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+        self.save(profile_id, request, response, duration, profiler, log)
+        response['X-Profile-Id'] = profile_id
+        return response
+
+    def save(self, profile_id, request, response, duration, profiler, log):
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(stats_path(profile_id))
+        listing = io.StringIO()
+        pstats.Stats(profiler, stream=listing).sort_stats('cumulative').print_stats(STATS_LINES)
+        report = {
+            'id': profile_id,
+            'created_at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'queries': len(log.queries),
+            'query_ms': round(sum(query['ms'] for query in log.queries), 3),
+            'sql': log.queries,
+            'stats': listing.getvalue(),
+        }
+        # written under a temporary name so list_profiles() never reads half a file
+        partial = directory / f'{profile_id}.json.partial'
+        with open(partial, 'w') as f:
+            json.dump(report, f, indent=1)
+        os.replace(partial, report_path(profile_id))
+        prune(max_profiles())
@@ -0,0 +1,166 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject
+from rest_framework.permissions import SAFE_METHODS
+
+# the RequestRouting of the request being handled, set by ReplicaRoutingMiddleware
+current = ContextVar('replica_routing', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+# backends whose entries only the process that wrote them can see
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+def check_shared_cache():
+    """
+    Refuse to run replicas over a per-process cache.
+
+    A user's pin to the primary is a cache key, so with a cache the other
+    workers can't see, the read right after a write can land on one of them
+    and read a replica that hasn't caught up.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if replicas() and backend in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured(
+            f'DATABASE_REPLICAS needs a cache shared by every worker for read-your-writes; {backend} is per process')
+
+
+def pin_key(user_id):
+    return f'replicas:pinned:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Keep `user_id`'s reads on the primary until the replicas have had time to catch up with their write."""
+    cache.set(pin_key(user_id), 1, sticky_seconds())
+
+
+def is_pinned(user_id):
+    return cache.get(pin_key(user_id)) is not None
+
+
+def authenticated_user(request):
+    """
+    The user the view authenticated, None before it has.
+
+    DRF stores the user on the Django request once it has authenticated
+    them (an AnonymousUser when nobody is); until then request.user is
+    AuthenticationMiddleware's lazy session lookup.
+    """
+    user = request.__dict__.get('user')
+    return None if isinstance(user, SimpleLazyObject) else user
+
+
+class RequestRouting:
+    """Where one request may read from; decided query by query, as the request learns who it is and what it did."""
+    __slots__ = ('request', 'replica', 'wrote', 'pinned')
+
+    def __init__(self, request):
+        self.request = request
+        aliases = replicas()
+        # one replica for the whole request, so its reads agree with each other
+        self.replica = random.choice(aliases) if aliases and request.method in SAFE_METHODS else None
+        self.wrote = False
+        self.pinned = None  # looked up once the user is known
+
+    def read_alias(self):
+        if self.replica is None or self.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if self.pinned is None:
+            user = authenticated_user(self.request)
+            if user is None:
+                return DEFAULT_DB_ALIAS  # not authenticated yet; the token checks read the primary
+            self.pinned = user.is_authenticated and is_pinned(user.pk)
+        return DEFAULT_DB_ALIAS if self.pinned else self.replica
+
+
+class PrimaryReplicaRouter:
+    """
+    Send the reads of safe requests to a read replica (settings.DATABASE_REPLICAS).
+
+    Writes, and reads made inside a transaction, during an unsafe request,
+    after the request has written, or outside any request (commands, the
+    outbox) stay on the primary. So do all reads of a user for
+    REPLICA_STICKY_SECONDS after they wrote, so they always read their
+    own writes however far the replicas lag. Reads that fill the shared
+    caches (menus, unread badges, token versions) name the primary
+    themselves, or a lagging replica's rows would outlive the lag in the
+    cache. Without replicas this routes nothing.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = current.get()
+        # explicit, so rows a request read from a replica don't draw their relations from it after a write
+        return None if routing is None else routing.read_alias()
+
+    def db_for_write(self, model, **hints):
+        routing = current.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Track each request for PrimaryReplicaRouter, and pin users who wrote to the primary.
+
+    The routing state is a context variable, so concurrent requests on
+    threads or in asyncio tasks each see their own. A streamed body is
+    read after the request has been handled, and so from the primary.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing = RequestRouting(request)
+        token = current.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.pin_writer(request, routing)
+        return response
+
+    async def __acall__(self, request):
+        # the ORM's worker threads get a copy of this context, and so the same RequestRouting
+        routing = RequestRouting(request)
+        token = current.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.pin_writer(request, routing)
+        return response
+
+    def pin_writer(self, request, routing):
+        user = authenticated_user(request)
+        if routing.wrote and user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
@@ -0,0 +1,100 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Notification
+from .unread import adjust_unread_by_user
+
+
+def chunk_size():
+    return getattr(settings, 'NOTIFICATION_DELETE_CHUNK_SIZE', 1000)
+
+
+def ttl(name):
+    seconds = getattr(settings, name, None)
+    return None if seconds is None else timedelta(seconds=seconds)
+
+
+def delete_in_chunks(queryset, size=None, pause=0.0, upper_pk=None):
+    """
+    Delete the notifications matched by `queryset` one primary key range at a time.
+
+    Each chunk finds the next `size` matching ids, then runs
+    `DELETE ... WHERE id > last AND id <= chunk_end AND <filter>` in its own
+    short transaction together with the unread counter adjustments, so no
+    lock is held for longer than one chunk. `pause` seconds are slept between
+    chunks to leave room for other writers. Rows at or above `upper_pk` are
+    left alone.
+    Returns {'deleted', 'chunks', 'seconds', 'rows_per_second', 'max_lock_seconds'}.
+    """
+    size = size or chunk_size()
+    if upper_pk is not None:
+        queryset = queryset.filter(pk__lt=upper_pk)
+    deleted = chunks = 0
+    max_lock = 0.0
+    last_pk = 0
+    started = time.perf_counter()
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:size])
+        if not ids:
+            break
+        if chunks and pause:
+            time.sleep(pause)
+
+        chunk = queryset.filter(pk__gt=last_pk, pk__lte=ids[-1])
+        lock_started = time.perf_counter()
+        with transaction.atomic():
+            unread = dict(chunk.filter(is_read=False).order_by()
+                          .values('recipient_id').annotate(n=Count('id'))
+                          .values_list('recipient_id', 'n'))
+            count, _ = chunk.delete()
+            adjust_unread_by_user({user_id: -n for user_id, n in unread.items()})
+        max_lock = max(max_lock, time.perf_counter() - lock_started)
+
+        deleted += count
+        chunks += 1
+        last_pk = ids[-1]
+
+    seconds = time.perf_counter() - started
+    return {
+        'deleted': deleted,
+        'chunks': chunks,
+        'seconds': seconds,
+        'rows_per_second': deleted / seconds if seconds else 0.0,
+        'max_lock_seconds': max_lock,
+    }
+
+
+def expired_notifications(now=None):
+    """
+    Notifications past NOTIFICATION_TTL_READ / NOTIFICATION_TTL_UNREAD.
+
+    Returns (queryset, upper_pk); the queryset is None when both are disabled.
+    """
+    now = now or timezone.now()
+    cutoffs = {is_read: now - limit
+               for is_read, limit in ((True, ttl('NOTIFICATION_TTL_READ')), (False, ttl('NOTIFICATION_TTL_UNREAD')))
+               if limit is not None}
+    if not cutoffs:
+        return None, None
+    expired = Q()
+    for is_read, cutoff in cutoffs.items():
+        expired |= Q(is_read=is_read, created_at__lt=cutoff)
+
+    # ids grow with created_at, so the first row younger than every cutoff
+    # bounds the scan and the chunks never walk the live part of the table
+    newest_cutoff = max(cutoffs.values())
+    upper_pk = (Notification.objects.filter(created_at__gte=newest_cutoff)
+                .order_by('pk').values_list('pk', flat=True).first())
+    return Notification.objects.filter(expired), upper_pk
+
+
+def purge_notifications(now=None, size=None, pause=0.0):
+    queryset, upper_pk = expired_notifications(now)
+    if queryset is None:
+        return delete_in_chunks(Notification.objects.none())
+    return delete_in_chunks(queryset, size=size, pause=pause, upper_pk=upper_pk)
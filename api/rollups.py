@@ -0,0 +1,123 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MerchantDailySales, Order, OrderItem, ProductDailySales
+
+FINISHED = ('delivered', 'cancelled')
+
+
+def add_to_rollup(model, lookup, deltas, using=None, defaults=None, create=True):
+    """`UPDATE ... SET col = col + delta` on one rollup row, creating the row if missing and `create`."""
+    rows = model.objects.using(using)
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if rows.filter(**lookup).update(**updates) or not create:
+        return
+    try:
+        with transaction.atomic(using=using):
+            rows.create(**lookup, **(defaults or {}), **deltas)
+    except IntegrityError:
+        rows.filter(**lookup).update(**updates)  # created concurrently
+
+
+def record_finished_order(order, status, sign=1, using=None):
+    """
+    Add (sign=1) or take back (sign=-1) one finished order's share of its day's rollups.
+
+    Costs one grouped query for the order's items plus one UPDATE per rollup row.
+    """
+    day = timezone.localdate(order.created_at)
+    create = sign > 0  # orders finished before the rollups existed have nothing to take back
+    items = (OrderItem.objects.using(using)
+             .filter(order_id=order.pk)
+             .order_by()
+             .values('product_id')
+             .annotate(quantity=Sum('quantity'), revenue=Sum('total_price')))
+    if status == 'delivered':
+        items = list(items)
+        add_to_rollup(MerchantDailySales, {'merchant_id': order.merchant_id, 'day': day}, {
+            'revenue': sign * Decimal(order.total),
+            'orders': sign,
+            'items': sign * sum(item['quantity'] for item in items),
+        }, using, create=create)
+        for item in items:
+            add_to_rollup(ProductDailySales, {'product_id': item['product_id'], 'day': day}, {
+                'revenue': sign * item['revenue'],
+                'orders': sign,
+                'quantity': sign * item['quantity'],
+            }, using, defaults={'merchant_id': order.merchant_id}, create=create)
+    else:
+        add_to_rollup(MerchantDailySales, {'merchant_id': order.merchant_id, 'day': day}, {'cancelled': sign}, using, create=create)
+        for item in items:
+            add_to_rollup(ProductDailySales, {'product_id': item['product_id'], 'day': day}, {'cancelled': sign},
+                          using, defaults={'merchant_id': order.merchant_id}, create=create)
+
+
+def rebuild(batch_size=2000):
+    """
+    Recompute every rollup row from Order and OrderItem with a few grouped queries.
+
+    For backfilling, or repairing rows after orders were changed behind the
+    signals' back. Returns (merchant rows, product rows) written.
+    """
+    delivered, cancelled = Q(status='delivered'), Q(status='cancelled')
+    merchant_rows = defaultdict(dict)
+    orders = (Order.objects
+              .filter(status__in=FINISHED)
+              .annotate(day=TruncDate('created_at'))
+              .order_by()
+              .values('merchant_id', 'day')
+              .annotate(revenue=Sum('total', filter=delivered),
+                        orders=Count('id', filter=delivered),
+                        cancelled=Count('id', filter=cancelled)))
+    for row in orders.iterator(chunk_size=batch_size):
+        merchant_rows[row['merchant_id'], row['day']].update(
+            revenue=row['revenue'] or 0, orders=row['orders'], cancelled=row['cancelled'])
+
+    delivered, cancelled = Q(order__status='delivered'), Q(order__status='cancelled')
+    items = (OrderItem.objects
+             .filter(order__status__in=FINISHED)
+             .annotate(day=TruncDate('order__created_at'))
+             .order_by()
+             .values('product_id', 'order__merchant_id', 'day')
+             .annotate(revenue=Sum('total_price', filter=delivered),
+                       orders=Count('order_id', distinct=True, filter=delivered),
+                       quantity=Sum('quantity', filter=delivered),
+                       cancelled=Count('order_id', distinct=True, filter=cancelled)))
+    product_rows = []
+    for row in items.iterator(chunk_size=batch_size):
+        product_rows.append(ProductDailySales(
+            product_id=row['product_id'], merchant_id=row['order__merchant_id'], day=row['day'],
+            revenue=row['revenue'] or 0, orders=row['orders'], quantity=row['quantity'] or 0,
+            cancelled=row['cancelled']))
+        merchant = merchant_rows[row['order__merchant_id'], row['day']]
+        merchant['items'] = merchant.get('items', 0) + (row['quantity'] or 0)
+
+    with transaction.atomic():
+        MerchantDailySales.objects.all().delete()
+        ProductDailySales.objects.all().delete()
+        MerchantDailySales.objects.bulk_create(
+            [MerchantDailySales(merchant_id=merchant_id, day=day, **totals)
+             for (merchant_id, day), totals in merchant_rows.items()],
+            batch_size=batch_size)
+        ProductDailySales.objects.bulk_create(product_rows, batch_size=batch_size)
+    return len(merchant_rows), len(product_rows)
+
+
+@receiver(post_save, sender=Order)
+def roll_up_finished_order(sender, instance, created, raw=False, using=None, **kwargs):
+    change = getattr(instance, '_status_change', None)
+    if created or raw or change is None:
+        return
+    previous_status = change[0]
+    # an order moved from one finished state to the other (or reopened) is taken back first
+    if previous_status in FINISHED:
+        record_finished_order(instance, previous_status, -1, using)
+    if instance.status in FINISHED:
+        record_finished_order(instance, instance.status, 1, using)
@@ -0,0 +1,144 @@
+import re
+from collections import Counter
+
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, When
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Merchant, Product, SearchIndexEntry
+
+# Indexed fields and their weight in the relevance score, per searchable model
+INDEXED_FIELDS = {
+    Product: ('product', {'name': 3, 'description': 1}),
+    Merchant: ('merchant', {'name': 3, 'city': 2, 'description': 1}),
+}
+MAX_QUERY_TOKENS = 8
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [token[:64] for token in TOKEN_RE.findall((text or '').lower()) if len(token) > 1]
+
+
+def index_entries(obj):
+    """Unsaved SearchIndexEntry rows for one object: weight = sum of field weights per occurrence."""
+    kind, fields = INDEXED_FIELDS[type(obj)]
+    weights = Counter()
+    for field, weight in fields.items():
+        for token in tokenize(getattr(obj, field)):
+            weights[token] += weight
+    return [SearchIndexEntry(kind=kind, object_id=obj.pk, token=token, weight=weight)
+            for token, weight in weights.items()]
+
+
+def reindex(obj):
+    kind, _ = INDEXED_FIELDS[type(obj)]
+    SearchIndexEntry.objects.filter(kind=kind, object_id=obj.pk).delete()
+    SearchIndexEntry.objects.bulk_create(index_entries(obj))
+
+
+def rebuild_index(model, chunk_size=2000):
+    """Rebuild the index of every row of `model`, streaming it in chunks. Returns rows indexed."""
+    kind, fields = INDEXED_FIELDS[model]
+    SearchIndexEntry.objects.filter(kind=kind).delete()
+    batch, count = [], 0
+    for obj in model.objects.only('pk', *fields).iterator(chunk_size=chunk_size):
+        batch.extend(index_entries(obj))
+        count += 1
+        if len(batch) >= chunk_size:
+            SearchIndexEntry.objects.bulk_create(batch)
+            batch = []
+    SearchIndexEntry.objects.bulk_create(batch)
+    return count
+
+
+def prefix_range(term):
+    """
+    Q for tokens starting with `term` as a range ("burg" <= token < "burh").
+
+    Unlike LIKE 'burg%' a range can always be served by the (kind, token) index.
+    """
+    return Q(token__gte=term, token__lt=term[:-1] + chr(ord(term[-1]) + 1))
+
+
+def matching_ids(kind, terms):
+    """
+    Subquery of the object ids having a token for every term.
+
+    Each term's postings are read with its own index range and intersected with
+    nested IN clauses; OR-ing the ranges together would defeat the index.
+    """
+    ids = None
+    for term in terms:
+        postings = SearchIndexEntry.objects.filter(prefix_range(term), kind=kind)
+        if ids is not None:
+            postings = postings.filter(object_id__in=ids)
+        ids = postings.values('object_id')
+    return ids
+
+
+def relevance(kind, terms):
+    """
+    Correlated subquery scoring the outer row: the weights of its matching tokens,
+    exact token matches counting double.
+
+    It only filters on (object_id, kind) so it is always an index lookup of the
+    handful of tokens of one object; the terms are matched inside the SUM.
+    """
+    any_term = Q()
+    for term in terms:
+        any_term |= prefix_range(term)
+    scores = (SearchIndexEntry.objects
+              .filter(object_id=OuterRef('pk'), kind=kind)
+              .values('object_id')
+              .annotate(score=Sum(Case(When(token__in=terms, then=F('weight') * 2),
+                                       When(any_term, then=F('weight')),
+                                       default=0, output_field=IntegerField())))
+              .values('score'))
+    return Subquery(scores[:1], output_field=IntegerField())
+
+
+class InvertedIndexSearchFilter(BaseFilterBackend):
+    """
+    Drop-in replacement for SearchFilter backed by SearchIndexEntry.
+
+    Uses the same `search` query parameter; results are limited to objects whose
+    tokens start with every search term and ordered by relevance unless the
+    client asks for an explicit ?ordering=.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = tokenize(request.query_params.get(self.search_param, ''))[:MAX_QUERY_TOKENS]
+        if not terms:
+            return queryset
+        kind, _ = INDEXED_FIELDS[queryset.model]
+        terms = list(dict.fromkeys(terms))
+        return (queryset
+                .filter(pk__in=matching_ids(kind, terms))
+                .annotate(search_rank=relevance(kind, terms))
+                .order_by('-search_rank', 'pk'))
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Relevance-ranked search terms',
+            'schema': {'type': 'string'},
+        }]
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Merchant)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        reindex(instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Merchant)
+def remove_from_search_index(sender, instance, **kwargs):
+    kind, _ = INDEXED_FIELDS[sender]
+    SearchIndexEntry.objects.filter(kind=kind, object_id=instance.pk).delete()
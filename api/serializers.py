@@ -1,10 +1,23 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from rest_framework import serializers
+from .authentication import add_claims
 from .models import User, Merchant, Category, Product, Order, OrderItem, OrderStatusHistory, Notification
+from .inventory import OutOfStock, reserve_order
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
     username_field = 'email'
 
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
+
     def validate(self, attrs):
         data = super().validate(attrs)
 
@@ -65,12 +78,89 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'customer', 'merchant', 'courier', 'status', 'subtotal', 'fee', 'total', 'created_at', 'items', 'courier_name', 'status_history']
 
+class CheckoutItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+    # optional: the unit price the customer saw, rejected if it has changed since
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """A whole cart, validated against Product in one query and saved as one Order."""
+    merchant = serializers.IntegerField(min_value=1)
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+    def validate(self, attrs):
+        # merge repeated lines for the same product
+        quantities, expected_prices = {}, {}
+        for line in attrs['items']:
+            quantities[line['product']] = quantities.get(line['product'], 0) + line['quantity']
+            if 'price' in line:
+                expected_prices[line['product']] = line['price']
+
+        products = {
+            product.pk: product
+            for product in Product.objects.filter(pk__in=quantities).annotate(
+                merchant_id=F('category__merchant_id'),
+                merchant_open=F('category__merchant__is_open'),
+            )
+        }
+
+        errors = {}
+        for product_id in quantities:
+            product = products.get(product_id)
+            if product is None or product.merchant_id != attrs['merchant']:
+                errors[product_id] = 'Product does not exist at this merchant.'
+            elif not product.is_available or not product.merchant_open:
+                errors[product_id] = 'Product is not available.'
+            elif product_id in expected_prices and expected_prices[product_id] != product.price:
+                errors[product_id] = f'Price changed to {product.price}.'
+        if errors:
+            raise serializers.ValidationError({'items': errors})
+
+        attrs['lines'] = [(products[product_id], quantity) for product_id, quantity in quantities.items()]
+        return attrs
+
+    def create(self, validated_data):
+        fee = Decimal(str(settings.DELIVERY_FEE))
+        items, subtotal = [], Decimal('0.00')
+        for product, quantity in validated_data['lines']:
+            total_price = product.price * quantity
+            subtotal += total_price
+            items.append(OrderItem(product=product, quantity=quantity, price=product.price, total_price=total_price))
+
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
+                    customer=validated_data['customer'],
+                    merchant_id=validated_data['merchant'],
+                    subtotal=subtotal,
+                    fee=fee,
+                    total=subtotal + fee,
+                )
+                for item in items:
+                    item.order = order
+                # bulk_create skips OrderItem.save(), total_price is already set above
+                OrderItem.objects.bulk_create(items)
+                # held until the order is confirmed; abandoned checkouts expire
+                reserve_order(order, [(product.pk, quantity) for product, quantity in validated_data['lines']])
+        except OutOfStock as exc:
+            raise serializers.ValidationError({'items': {exc.product_id: 'Not enough stock.'}})
+        return order
+
+
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = ['id', 'message', 'is_read', 'created_at']
 
 class MerchantSerializer(serializers.ModelSerializer):
+    rating = serializers.SerializerMethodField()
+    # only set when the list is priced for a customer location (api/pricing.py)
+    distance_km = serializers.SerializerMethodField()
+    delivery_fee = serializers.SerializerMethodField()
+    eta_minutes = serializers.SerializerMethodField()
+
     class Meta:
         model = Merchant
         fields = '__all__'
@@ -80,4 +170,96 @@ class MerchantSerializer(serializers.ModelSerializer):
         # assign the current user as the merchant owner
         user = self.context['request'].user
         validated_data['user'] = user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+    def get_rating(self, obj):
+        return getattr(obj, 'rating', None)
+
+    def get_distance_km(self, obj):
+        return getattr(obj, 'distance_km', None)
+
+    def get_delivery_fee(self, obj):
+        fee = getattr(obj, 'delivery_fee', None)
+        return None if fee is None else str(fee)
+
+    def get_eta_minutes(self, obj):
+        return getattr(obj, 'eta_minutes', None)
+
+
+class CourierLocationSerializer(serializers.Serializer):
+    """A courier's location ping; on_duty switches them on or off duty."""
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    on_duty = serializers.BooleanField(required=False)
+
+class OrderRatingSerializer(serializers.Serializer):
+    rating = serializers.IntegerField(min_value=1, max_value=5)
+
+class SalesRangeSerializer(serializers.Serializer):
+    """Query parameters of the sales dashboards; the range defaults to the last 30 days."""
+    MAX_DAYS = 366
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    merchant = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=100, default=10)
+    ordering = serializers.ChoiceField(choices=['revenue', 'quantity', 'orders'], required=False, default='revenue')
+
+    def validate(self, attrs):
+        end = attrs.setdefault('end', timezone.localdate())
+        start = attrs.setdefault('start', end - timedelta(days=29))
+        if start > end:
+            raise serializers.ValidationError('start must not be after end.')
+        if (end - start).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f'The range can span at most {self.MAX_DAYS} days.')
+        return attrs
+
+class SalesTotalsSerializer(serializers.Serializer):
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    orders = serializers.IntegerField()
+    items = serializers.IntegerField()
+    cancelled = serializers.IntegerField()
+
+class DailySalesSerializer(SalesTotalsSerializer):
+    day = serializers.DateField()
+
+class ProductSalesSerializer(serializers.Serializer):
+    product = serializers.IntegerField(source='product_id')
+    product_name = serializers.CharField(source='product__name')
+    merchant = serializers.IntegerField(source='merchant_id')
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    orders = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+    cancelled = serializers.IntegerField()
+
+class ExportParamsSerializer(serializers.Serializer):
+    """Query parameters of the order exports: created_at day range and a comma-separated status list."""
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.CharField(required=False)
+
+    def validate_status(self, value):
+        statuses = [status.strip() for status in value.split(',') if status.strip()]
+        unknown = set(statuses) - {choice for choice, _ in Order.STATUS_CHOICES}
+        if unknown:
+            raise serializers.ValidationError(f"Unknown status: {', '.join(sorted(unknown))}.")
+        return statuses
+
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError('start must not be after end.')
+        return attrs
+
+    def filters(self, prefix=''):
+        """Lookups for the validated range and statuses; `prefix` reaches the order from another model."""
+        data = self.validated_data
+        lookups = {}
+        # compare against the day boundaries, so the created_at indexes stay usable
+        if 'start' in data:
+            lookups[f'{prefix}created_at__gte'] = timezone.make_aware(datetime.combine(data['start'], time.min))
+        if 'end' in data:
+            lookups[f'{prefix}created_at__lt'] = timezone.make_aware(datetime.combine(data['end'] + timedelta(days=1), time.min))
+        if data.get('status'):
+            lookups[f'{prefix}status__in'] = data['status']
+        return lookups
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after Notification rows are written with bulk_create, which skips post_save.
+# Arguments: notifications (list of Notification), using (database alias).
+notifications_created = Signal()
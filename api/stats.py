@@ -0,0 +1,133 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Merchant, MerchantStats, Order, OrderStatusHistory
+
+
+def ema_alpha():
+    """Weight of the newest sample in prep_seconds_ema."""
+    return getattr(settings, 'MERCHANT_PREP_EMA_ALPHA', 0.2)
+
+
+def apply_to_stats(merchant_id, using=None, **updates):
+    """One `UPDATE ... SET col = <expression of col>` on a merchant's stats row, creating the row if missing."""
+    stats = MerchantStats.objects.using(using)
+    updates['updated_at'] = timezone.now()  # update() skips auto_now, and listings are validated on it
+    if stats.filter(pk=merchant_id).update(**updates):
+        return
+    try:
+        with transaction.atomic(using=using):
+            stats.create(merchant_id=merchant_id)
+    except IntegrityError:
+        pass  # created concurrently
+    stats.filter(pk=merchant_id).update(**updates)
+
+
+def record_preparation(merchant_id, seconds, using=None):
+    """Fold one confirmed -> out_for_delivery duration into the running count, sum and EMA."""
+    alpha = ema_alpha()
+    apply_to_stats(
+        merchant_id, using,
+        prep_count=F('prep_count') + 1,
+        prep_seconds_sum=F('prep_seconds_sum') + seconds,
+        # the first sample seeds the average
+        prep_seconds_ema=Coalesce(F('prep_seconds_ema'), Value(seconds)) * (1 - alpha) + alpha * seconds,
+    )
+
+
+def record_rating(merchant_id, rating, using=None):
+    apply_to_stats(
+        merchant_id, using,
+        rating_count=F('rating_count') + 1,
+        rating_sum=F('rating_sum') + rating,
+        # the right-hand side sees the row as it was before this UPDATE
+        rating=Cast(F('rating_sum') + rating, FloatField()) / (F('rating_count') + 1),
+    )
+
+
+def rebuild(batch_size=2000):
+    """
+    Recompute every merchant's stats from OrderStatusHistory and Order.rating.
+
+    History is streamed in changed_at order, batch_size rows per fetch,
+    remembering only when each in-flight order was last confirmed, so the
+    EMA sees the samples in the order they happened. Returns the number of
+    merchants written.
+    """
+    alpha = ema_alpha()
+    prep = defaultdict(lambda: [0, 0.0, None])  # merchant id -> [count, sum, ema]
+    confirmed_at = {}
+    history = (OrderStatusHistory.objects
+               .filter(new_status__in=['confirmed', 'out_for_delivery', 'delivered', 'cancelled'])
+               .order_by('changed_at', 'id')
+               .values_list('order_id', 'order__merchant_id', 'new_status', 'changed_at')
+               .iterator(chunk_size=batch_size))
+    for order_id, merchant_id, new_status, changed_at in history:
+        if new_status == 'confirmed':
+            confirmed_at[order_id] = changed_at
+            continue
+        started = confirmed_at.pop(order_id, None)
+        if new_status != 'out_for_delivery' or started is None:
+            continue
+        seconds = (changed_at - started).total_seconds()
+        totals = prep[merchant_id]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = seconds if totals[2] is None else totals[2] * (1 - alpha) + alpha * seconds
+
+    ratings = {merchant_id: (count, total) for merchant_id, count, total in (Order.objects
+               .filter(rating__isnull=False)
+               .order_by()
+               .values('merchant_id')
+               .annotate(count=Count('id'), total=Sum('rating'))
+               .values_list('merchant_id', 'count', 'total'))}
+
+    def build(merchant_id):
+        prep_count, prep_sum, prep_ema = prep.get(merchant_id, (0, 0.0, None))
+        rating_count, rating_sum = ratings.get(merchant_id, (0, 0))
+        return MerchantStats(
+            merchant_id=merchant_id,
+            prep_count=prep_count, prep_seconds_sum=prep_sum, prep_seconds_ema=prep_ema,
+            rating_count=rating_count, rating_sum=rating_sum,
+            rating=rating_sum / rating_count if rating_count else None,
+        )
+
+    written = 0
+    with transaction.atomic():
+        MerchantStats.objects.all().delete()
+        merchant_ids = Merchant.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+        batch = []
+        for merchant_id in merchant_ids:
+            batch.append(build(merchant_id))
+            if len(batch) == batch_size:
+                written += len(MerchantStats.objects.bulk_create(batch))
+                batch = []
+        written += len(MerchantStats.objects.bulk_create(batch))
+    return written
+
+
+@receiver(post_save, sender=Merchant)
+def create_merchant_stats(sender, instance, created, raw=False, using=None, **kwargs):
+    if created and not raw:
+        MerchantStats.objects.using(using).create(merchant=instance)
+
+
+@receiver(post_save, sender=OrderStatusHistory)
+def record_preparation_time(sender, instance, created, raw=False, using=None, **kwargs):
+    if not created or raw or instance.new_status != 'out_for_delivery':
+        return
+    confirmed_at = (OrderStatusHistory.objects.using(using)
+                    .filter(order_id=instance.order_id, new_status='confirmed', changed_at__lte=instance.changed_at)
+                    .order_by('-changed_at', '-id')
+                    .values_list('changed_at', flat=True)
+                    .first())
+    if confirmed_at is not None:
+        # the pipeline creates the row with the Order instance, so this is no query
+        record_preparation(instance.order.merchant_id, (instance.changed_at - confirmed_at).total_seconds(), using)
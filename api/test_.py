@@ -1,7 +1,57 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import pstats
+import random
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.conf import settings as django_settings
+from django.db import connection, connections
+from django.db.models import Count, F, Sum
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from rest_framework.test import APIClient
 from rest_framework import status
-from api.models import User, Merchant, Product, Order
+from api.models import User, Merchant, Category, Product, Order, OrderItem, OrderStatusHistory, Notification, OutgoingEmail, SearchIndexEntry, ProductStockShard, StockReservation, UnreadNotificationCounter, TokenUser, CourierLocation, MerchantStats, MerchantDailySales, ProductDailySales
+from api.outbox import drain_outbox
+from api.serializers import EmailTokenObtainPairSerializer
+from api.menu import menu_cache_stats
+from api import dispatch, events, inventory, metrics, outbox, pricing, replicas, retention, stats, unread
+from api.permissions import owner_id
+from api.urls import router
+from api.utils.query_budget import QueryBudgetMixin
+from api.views import MerchantViewSet, CategoryViewSet, ProductViewSet, OrderViewSet, OrderItemViewSet, OrderStatusHistoryViewSet, NotificationViewSet
+
+
+class MarketplaceTestCase(TestCase):
+    """
+    A vendor with a merchant, a customer and a courier, created once per class.
+
+    Subclasses change the merchant with `merchant_fields` and add the rest of
+    their fixtures in setUp.
+    """
+    merchant_fields = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user(email='vendor@test.com', name='Vendor', phone='1', role='vendor', password='vendor123')
+        cls.customer = User.objects.create_user(email='customer@test.com', name='Customer', phone='2', password='cust123')
+        cls.courier = User.objects.create_user(email='courier@test.com', name='Courier', phone='3', role='courier', password='cour123')
+        cls.merchant = Merchant.objects.create(**{'name': "Vendor's Shop", 'user': cls.vendor, 'city': 'Dubai', **cls.merchant_fields})
 
 class PermissionTests(TestCase):
     def setUp(self):
@@ -72,3 +122,1698 @@ class PermissionTests(TestCase):
         self.auth(other_courier)
         response = self.client.get(f'/api/v1/orders/{self.order.id}/')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OrderStatusPipelineTests(MarketplaceTestCase):
+    def setUp(self):
+        self.order = Order.objects.create(customer=self.customer, merchant=self.merchant, courier=self.courier, total=20.00, fee=2.00)
+
+    # ---------- TESTS ----------
+
+    def test_new_order_is_not_logged(self):
+        self.assertFalse(OrderStatusHistory.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+
+    def test_status_change_logs_and_notifies_everyone(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'confirmed'
+        order._updated_by = self.vendor
+        order.save()
+
+        history = OrderStatusHistory.objects.get(order=order)
+        self.assertEqual((history.previous_status, history.new_status), ('pending', 'confirmed'))
+        self.assertEqual(history.changed_by, self.vendor)
+        self.assertEqual(
+            set(Notification.objects.values_list('recipient_id', flat=True)),
+            {self.customer.pk, self.courier.pk, self.vendor.pk}
+        )
+
+    def test_status_change_with_known_previous_status_takes_four_queries(self):
+        order = Order.objects.select_related('merchant').get(pk=self.order.pk)
+        order.status = 'confirmed'
+        # UPDATE order, INSERT history, one bulk INSERT of notifications, one UPDATE of their unread counters
+        with self.assertNumQueries(4):
+            order.save()
+
+    def test_status_change_reads_previous_row_once(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'confirmed'
+        # the single read only fetches the merchant owner to notify
+        with self.assertNumQueries(5):
+            order.save()
+
+        order = Order(pk=self.order.pk, customer=self.customer, merchant_id=self.merchant.pk, status='preparing')
+        with self.assertNumQueries(5):
+            order.save(update_fields=['status'])
+        self.assertEqual(OrderStatusHistory.objects.filter(previous_status='confirmed', new_status='preparing').count(), 1)
+
+    def test_save_without_status_change_only_updates(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.fee = 3.00
+        with self.assertNumQueries(1):
+            order.save()
+        self.assertFalse(OrderStatusHistory.objects.exists())
+
+
+class ListQueryBudgetTests(QueryBudgetMixin, MarketplaceTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', phone='0', role='admin', password='admin123')
+        category = Category.objects.create(merchant=self.merchant, name='Mains')
+        self.products = [
+            Product.objects.create(category=category, name=f'Dish {i}', price=5, stock=10) for i in range(3)
+        ]
+        self.make_orders(1)
+        self.client = APIClient()
+
+    def make_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(customer=self.customer, merchant=self.merchant, courier=self.courier)
+            for product in self.products:
+                OrderItem.objects.create(order=order, product=product, quantity=2, price=product.price)
+            for new_status in ('confirmed', 'preparing'):
+                order.status = new_status
+                order._updated_by = self.vendor
+                order.save()
+
+    # ---------- TESTS ----------
+
+    def test_order_list_is_flat_for_every_role(self):
+        for user in (self.admin, self.vendor, self.customer, self.courier):
+            with self.subTest(role=user.role):
+                self.client.force_authenticate(user=user)
+                # page count + orders with courier + items with product + history with changed_by
+                self.assertFlatQueryCount('/api/v1/orders/', lambda: self.make_orders(4), max_queries=4)
+
+    def test_order_detail_budget(self):
+        self.client.force_authenticate(user=self.customer)
+        order = Order.objects.first()
+        response, count, _ = self.count_queries(lambda: self.client.get(f'/api/v1/orders/{order.pk}/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(count, 3)
+
+    def test_order_item_list_is_flat(self):
+        for user in (self.admin, self.vendor, self.customer):
+            with self.subTest(role=user.role):
+                self.client.force_authenticate(user=user)
+                self.assertFlatQueryCount('/api/v1/order-items/', lambda: self.make_orders(2), max_queries=2)
+
+    def test_status_history_list_is_flat(self):
+        self.client.force_authenticate(user=self.admin)
+        self.assertFlatQueryCount('/api/v1/status-history/', lambda: self.make_orders(3), max_queries=2)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='customer@test.com', name='Customer', phone='2', password='cust123')
+        # bulk_create can hand out identical timestamps, which the id tie-breaker must handle
+        Notification.objects.bulk_create(Notification(recipient=self.user, message=f'#{i}') for i in range(45))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    # ---------- TESTS ----------
+
+    def test_page_number_pagination_is_still_the_default(self):
+        response = self.client.get('/api/v1/notifications/')
+        self.assertEqual(response.data['count'], 45)
+
+    def test_cursor_walk_returns_every_row_once_newest_first(self):
+        seen = self.walk('/api/v1/notifications/?pagination=cursor')
+        expected = list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_previous_link_returns_the_same_page(self):
+        first = self.client.get('/api/v1/notifications/?pagination=cursor').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual([row['id'] for row in back['results']], [row['id'] for row in first['results']])
+
+    def test_page_size_applies_in_both_modes(self):
+        for mode in ('', '&pagination=cursor'):
+            self.assertEqual(len(self.client.get(f'/api/v1/notifications/?page_size=7{mode}').data['results']), 7)
+            self.assertEqual(len(self.client.get(f'/api/v1/notifications/?page_size=500{mode}').data['results']), 45)
+        self.assertEqual(len(self.walk('/api/v1/notifications/?pagination=cursor&page_size=7')), 45)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/v1/notifications/?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class QueryPlanTests(TestCase):
+    def test_viewset_querysets_use_indexes(self):
+        # raises CommandError when a list queryset scans or sorts outside an index
+        call_command('explain_querysets', stdout=StringIO())
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP is down')
+
+
+class UnreachableEmailBackend(BaseEmailBackend):
+    def open(self):
+        raise ConnectionRefusedError('SMTP is unreachable')
+
+
+class ClaimCheckingEmailBackend(BaseEmailBackend):
+    """Records what another worker would claim while this one sends."""
+    claimed_meanwhile = None
+
+    def send_messages(self, email_messages):
+        ClaimCheckingEmailBackend.claimed_meanwhile = outbox.claim(100)
+        return len(email_messages)
+
+
+class EmailOutboxTests(TestCase):
+    def signup(self):
+        return APIClient().post('/api/v1/users/', {'email': 'new@test.com', 'name': 'New', 'phone': '5'})
+
+    # ---------- TESTS ----------
+
+    def test_signup_queues_activation_email_without_sending(self):
+        response = self.signup()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutgoingEmail.objects.get()
+        self.assertEqual((queued.to, queued.status), ('new@test.com', 'pending'))
+        self.assertIn('/api/v1/activate/', queued.body)
+
+    def test_worker_sends_due_emails(self):
+        self.signup()
+        call_command('send_queued_email', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@test.com'])
+        self.assertEqual(OutgoingEmail.objects.get().status, 'sent')
+
+    @override_settings(EMAIL_BACKEND='api.test_.FailingEmailBackend')
+    def test_failures_back_off_and_give_up(self):
+        self.signup()
+        self.assertEqual(drain_outbox(max_attempts=2), (0, 1))
+        queued = OutgoingEmail.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ('pending', 1))
+        self.assertGreater(queued.next_attempt_at, timezone.now())
+        self.assertIn('SMTP is down', queued.last_error)
+
+        # not due yet, so nothing is retried
+        self.assertEqual(drain_outbox(max_attempts=2), (0, 0))
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        drain_outbox(max_attempts=2)
+        self.assertEqual(OutgoingEmail.objects.get().status, 'failed')
+
+    @override_settings(EMAIL_BACKEND='api.test_.UnreachableEmailBackend')
+    def test_an_unreachable_server_backs_off_the_whole_batch(self):
+        self.signup()
+        OutgoingEmail.objects.create(subject='Hi', body='', from_email='a@test.com', to='b@test.com')
+        self.assertEqual(drain_outbox(), (0, 2))
+        for queued in OutgoingEmail.objects.all():
+            self.assertEqual((queued.status, queued.attempts), ('pending', 1))
+            self.assertIn('SMTP is unreachable', queued.last_error)
+            self.assertGreater(queued.next_attempt_at, timezone.now())
+
+    @override_settings(EMAIL_BACKEND='api.test_.ClaimCheckingEmailBackend')
+    def test_claimed_emails_are_leased_while_they_are_sent(self):
+        self.signup()
+        self.assertEqual(drain_outbox(), (1, 0))
+        self.assertEqual(ClaimCheckingEmailBackend.claimed_meanwhile, [])
+        self.assertEqual(OutgoingEmail.objects.get().status, 'sent')
+
+        OutgoingEmail.objects.update(status='pending', next_attempt_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(len(outbox.claim(100)), 1)  # a crashed worker's lease ...
+        self.assertEqual(outbox.claim(100), [])
+        with mock.patch('api.outbox.timezone.now', return_value=timezone.now() + timedelta(hours=1)):
+            self.assertEqual(len(outbox.claim(100)), 1)  # ... runs out
+
+
+class MenuCacheTests(MarketplaceTestCase):
+    merchant_fields = {'status': 'approved'}
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(merchant=self.merchant, name='Mains')
+        self.product = Product.objects.create(category=self.category, name='Burger', price=5, stock=10)
+        Product.objects.create(category=self.category, name='Sold out', price=5, is_available=False)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+        self.url = f'/api/v1/merchants/{self.merchant.pk}/menu/'
+
+    # ---------- TESTS ----------
+
+    def test_menu_lists_available_products_by_category(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['merchant']['name'], "Vendor's Shop")
+        self.assertEqual([p['name'] for p in response.data['categories'][0]['products']], ['Burger'])
+
+    def test_warm_menu_read_needs_no_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(menu_cache_stats()['hit_ratio'], 0.5)
+
+    def test_product_changes_bump_the_version(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 7
+            self.product.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['categories'][0]['products'][0]['price'], '7.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertEqual(self.client.get(self.url).data['categories'], [])
+
+    def test_hidden_merchants_are_not_served_to_customers(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.merchant.is_open = False
+            self.merchant.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.vendor)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/v1/merchants/999/menu/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SearchIndexTests(MarketplaceTestCase):
+    merchant_fields = {'name': 'Burger Barn', 'description': 'Grills and shakes'}
+
+    def setUp(self):
+        category = Category.objects.create(merchant=self.merchant, name='Mains')
+        self.cheeseburger = Product.objects.create(category=category, name='Cheese Burger', description='Beef patty', price=8)
+        self.chicken = Product.objects.create(category=category, name='Chicken wrap', description='Goes well with a burger', price=6)
+        self.salad = Product.objects.create(category=category, name='Salad', description='Fresh greens', price=5)
+        self.hidden = Product.objects.create(category=category, name='Burger special', price=9, is_available=False)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def search(self, term):
+        response = self.client.get('/api/v1/products/', {'search': term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    # ---------- TESTS ----------
+
+    def test_results_are_ranked_by_relevance(self):
+        # a name match outranks a description match
+        self.assertEqual(self.search('burger'), [self.cheeseburger.pk, self.chicken.pk])
+
+    def test_every_term_must_match_and_prefixes_work(self):
+        self.assertEqual(self.search('burg chee'), [self.cheeseburger.pk])
+        self.assertEqual(self.search('burger sushi'), [])
+
+    def test_role_scoping_still_applies(self):
+        self.assertNotIn(self.hidden.pk, self.search('special'))
+
+    def test_index_follows_saves_and_deletes(self):
+        self.salad.name = 'Caesar salad'
+        self.salad.save()
+        self.assertEqual(self.search('caesar'), [self.salad.pk])
+
+        self.salad.delete()
+        self.assertEqual(self.search('caesar'), [])
+        self.assertFalse(SearchIndexEntry.objects.filter(kind='product', object_id=self.salad.pk).exists())
+
+    def test_merchant_search_covers_city(self):
+        Merchant.objects.update(status='approved')
+        response = self.client.get('/api/v1/merchants/', {'search': 'dubai'})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Burger Barn'])
+
+    def test_rebuild_restores_rows_loaded_without_signals(self):
+        SearchIndexEntry.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('salad'), [self.salad.pk])
+
+
+class CheckoutTests(MarketplaceTestCase):
+    def setUp(self):
+        category = Category.objects.create(merchant=self.merchant, name='Mains')
+        self.burger = Product.objects.create(category=category, name='Burger', price='8.50', stock=10)
+        self.fries = Product.objects.create(category=category, name='Fries', price='3.00', stock=10)
+        other = Merchant.objects.create(name='Other', user=self.vendor, city='Dubai')
+        self.elsewhere = Product.objects.create(category=Category.objects.create(merchant=other, name='x'), name='Soup', price=4)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def checkout(self, items):
+        return self.client.post('/api/v1/orders/checkout/', {'merchant': self.merchant.pk, 'items': items}, format='json')
+
+    # ---------- TESTS ----------
+
+    def test_checkout_creates_order_and_items_with_totals(self):
+        response = self.checkout([
+            {'product': self.burger.pk, 'quantity': 2, 'price': '8.50'},
+            {'product': self.fries.pk, 'quantity': 1},
+            {'product': self.fries.pk, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        order = Order.objects.get()
+        self.assertEqual((order.customer, order.merchant), (self.customer, self.merchant))
+        self.assertEqual((str(order.subtotal), str(order.fee), str(order.total)), ('23.00', '2.00', '25.00'))
+        self.assertEqual(
+            sorted(order.items.values_list('product__name', 'quantity', 'total_price')),
+            [('Burger', 2, Decimal('17.00')), ('Fries', 2, Decimal('6.00'))]
+        )
+        self.assertEqual(len(response.data['items']), 2)
+
+    def test_cart_is_priced_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.checkout([{'product': self.burger.pk, 'quantity': 1}, {'product': self.fries.pk, 'quantity': 1}])
+        product_reads = [q for q in queries.captured_queries if 'FROM "api_product"' in q['sql'] and 'INSERT' not in q['sql']]
+        self.assertEqual(len(product_reads), 1)
+
+    def test_invalid_carts_create_nothing(self):
+        for items in (
+            [{'product': self.burger.pk, 'quantity': 1, 'price': '7.00'}],   # stale price
+            [{'product': self.elsewhere.pk, 'quantity': 1}],                # other merchant
+            [{'product': 999, 'quantity': 1}],
+            [],
+        ):
+            with self.subTest(items=items):
+                self.assertEqual(self.checkout(items).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_only_customers_check_out(self):
+        self.client.force_authenticate(user=self.vendor)
+        self.assertEqual(self.checkout([{'product': self.burger.pk, 'quantity': 1}]).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class StockReservationTests(MarketplaceTestCase):
+    def setUp(self):
+        category = Category.objects.create(merchant=self.merchant, name='Mains')
+        self.product = Product.objects.create(category=category, name='Burger', price=8, stock=5)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def checkout(self, quantity):
+        return self.client.post('/api/v1/orders/checkout/', {
+            'merchant': self.merchant.pk, 'items': [{'product': self.product.pk, 'quantity': quantity}],
+        }, format='json')
+
+    def stock(self):
+        return inventory.available_stock(self.product.pk)
+
+    # ---------- TESTS ----------
+
+    def test_confirmed_orders_keep_their_stock(self):
+        self.assertEqual(self.checkout(3).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.stock(), 2)
+        order = Order.objects.get()
+        order.status = 'confirmed'
+        order.save()
+        self.assertEqual(inventory.release_expired(now=timezone.now() + timedelta(hours=1)), (0, 0))
+        self.assertEqual(StockReservation.objects.get().status, 'committed')
+        self.assertEqual(self.stock(), 2)
+
+    def test_cancelling_returns_stock(self):
+        self.checkout(3)
+        order = Order.objects.get()
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(self.stock(), 5)
+
+    def test_cannot_oversell(self):
+        self.assertEqual(self.checkout(4).status_code, status.HTTP_201_CREATED)
+        response = self.checkout(2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.stock(), 1)
+
+    def test_expired_checkouts_are_released_and_cancelled(self):
+        self.checkout(5)
+        self.assertEqual(inventory.release_expired(), (0, 0))
+        released = inventory.release_expired(now=timezone.now() + timedelta(hours=1))
+        self.assertEqual(released, (1, 1))
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(Order.objects.get().status, 'cancelled')
+
+    def test_orders_confirmed_while_expiring_keep_their_stock(self):
+        self.checkout(5)
+        cancel = inventory.cancel_abandoned
+
+        def vendor_first(order_id):  # the vendor confirms between the read and the cancellation
+            Order.objects.filter(pk=order_id).update(status='confirmed')
+            return cancel(order_id)
+
+        with mock.patch.object(inventory, 'cancel_abandoned', side_effect=vendor_first):
+            released = inventory.release_expired(now=timezone.now() + timedelta(hours=1))
+        self.assertEqual(released, (0, 0))
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(Order.objects.get().status, 'confirmed')
+        self.assertEqual(list(StockReservation.objects.values_list('status', flat=True)), ['committed'])
+
+    def test_sharded_stock(self):
+        inventory.shard_stock(self.product.pk, shards=3)
+        self.assertEqual(sorted(self.product.stock_shards.values_list('stock', flat=True)), [1, 2, 2])
+        for _ in range(5):
+            inventory.reserve(self.product.pk, 1)
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.reserve(self.product.pk, 1)
+        self.assertEqual(self.stock(), 0)
+
+        inventory.release(StockReservation.objects.all())
+        inventory.unshard_stock(self.product.pk)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_sharded_stock_is_taken_from_several_shards_when_no_one_has_enough(self):
+        inventory.shard_stock(self.product.pk, shards=3)  # 2, 2, 1
+        reservations = inventory.reserve(self.product.pk, 4)
+        self.assertEqual(sum(reservation.quantity for reservation in reservations), 4)
+        self.assertGreater(len({reservation.shard for reservation in reservations}), 1)
+        self.assertEqual(self.stock(), 1)
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.reserve(self.product.pk, 2)
+        self.assertEqual(self.stock(), 1)  # a failed split takes nothing
+
+        inventory.release(StockReservation.objects.all())
+        self.assertEqual(sorted(self.product.stock_shards.values_list('stock', flat=True)), [1, 2, 2])
+
+    def test_lost_races_are_retried(self):
+        inventory.shard_stock(self.product.pk, shards=2)  # 3, 2
+        take = inventory.take_from_shard
+
+        def rival_first(product_id, shard, quantity):
+            if not rival_first.done:  # another buyer takes one between the read and the split's first update
+                rival_first.done = True
+                ProductStockShard.objects.filter(product_id=product_id, shard=shard).update(stock=F('stock') - 1)
+            return take(product_id, shard, quantity)
+        rival_first.done = False
+        with mock.patch('api.inventory.take_from_shard', side_effect=rival_first) as taking:
+            taken = inventory.take_stock(self.product.pk, 4)
+        # the lost update, then the retry's two; the rival's write shared the rolled back savepoint here
+        self.assertEqual(taking.call_count, 3)
+        self.assertEqual(sum(piece for _, piece in taken), 4)
+        self.assertEqual(self.stock(), 1)
+
+    def test_stock_returned_to_a_folded_shard_goes_to_the_product(self):
+        inventory.shard_stock(self.product.pk, shards=2)
+        inventory.reserve(self.product.pk, 2)
+        inventory.unshard_stock(self.product.pk)
+        inventory.release(StockReservation.objects.all())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, event):
+        self.published.append((channel, event))
+
+
+class EventStreamTests(MarketplaceTestCase):
+    def setUp(self):
+        self.order = Order.objects.create(customer=self.customer, merchant=self.merchant, courier=self.courier)
+
+    # ---------- TESTS ----------
+
+    def test_status_change_is_pushed_to_everyone_after_commit(self):
+        broker = RecordingBroker()
+        with mock.patch.object(events, '_broker', broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.order.status = 'confirmed'
+                self.order.save()
+                self.assertEqual(broker.published, [])
+
+        status_events = [(channel, event) for channel, event in broker.published if event['type'] == 'order_status']
+        self.assertEqual(
+            {channel for channel, _ in status_events},
+            {f'user:{self.customer.pk}', f'user:{self.courier.pk}', f'user:{self.vendor.pk}'}
+        )
+        self.assertEqual(status_events[0][1]['status'], 'confirmed')
+        # the bulk-created notifications are pushed too
+        self.assertEqual(sum(event['type'] == 'notification' for _, event in broker.published), 3)
+
+    def test_stream_is_asgi_only(self):
+        response = self.client.get('/api/v1/events/')
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+    async def test_stream_rejects_bad_tokens(self):
+        response = await self.async_client.get('/api/v1/events/', {'token': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_stream_delivers_published_events(self):
+        token = str(AccessToken.for_user(self.customer))
+        response = await self.async_client.get('/api/v1/events/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        self.assertEqual(await anext(content), b': connected\n\n')
+
+        events.get_broker().publish(events.user_channel(self.customer.pk), {'type': 'order_status', 'order': 1, 'status': 'confirmed'})
+        frame = (await anext(content)).decode()
+        self.assertTrue(frame.startswith('event: order_status\ndata: '))
+        await content.aclose()
+
+    async def test_broker_drops_oldest_events_for_slow_subscribers(self):
+        broker = events.InProcessBroker()
+        async with broker.subscribe('user:1') as queue:
+            self.assertEqual(broker.subscriber_count(), 1)
+            for i in range(broker.max_queued + 5):
+                broker.publish('user:1', {'n': i})
+            await asyncio.sleep(0)  # let the threadsafe callbacks run
+            self.assertEqual(queue.qsize(), broker.max_queued)
+            self.assertEqual((await queue.get())['n'], 5)
+        self.assertEqual(broker.subscriber_count(), 0)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='customer@test.com', name='Customer', phone='2', password='cust123')
+        self.client.force_authenticate(user=self.user)
+        self.notifications = [Notification.objects.create(recipient=self.user, message=f'N{i}') for i in range(3)]
+
+    def counter(self):
+        return UnreadNotificationCounter.objects.get(user=self.user).unread
+
+    # ---------- TESTS ----------
+
+    def test_created_notifications_are_counted(self):
+        self.assertEqual(self.counter(), 3)
+        Notification.objects.create(recipient=self.user, message='read', is_read=True)
+        self.assertEqual(self.counter(), 3)
+
+    def test_bulk_created_status_notifications_are_counted(self):
+        vendor = User.objects.create_user(email='vendor@test.com', name='Vendor', phone='1', role='vendor', password='vendor123')
+        merchant = Merchant.objects.create(name="Vendor's Shop", user=vendor, city="Dubai")
+        order = Order.objects.create(customer=self.user, merchant=merchant)
+        order.status = 'confirmed'
+        order.save()
+        self.assertEqual(self.counter(), 4)
+        self.assertEqual(UnreadNotificationCounter.objects.get(user=vendor).unread, 1)
+
+    def test_deleting_counts_off_unread_notifications_only(self):
+        self.client.patch(f'/api/v1/notifications/{self.notifications[0].pk}/', {}, format='json')
+        for notification in self.notifications[:2]:
+            response = self.client.delete(f'/api/v1/notifications/{notification.pk}/')
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.counter(), 1)
+        self.assertEqual(self.client.get('/api/v1/notifications/unread_count/').data['unread_count'], 1)
+
+    def test_marking_read_counts_off_once(self):
+        url = f'/api/v1/notifications/{self.notifications[0].pk}/'
+        self.client.patch(url, {}, format='json')
+        self.client.patch(url, {}, format='json')
+        self.assertEqual(self.counter(), 2)
+
+    def test_mark_all_and_clear_all(self):
+        self.client.patch(f'/api/v1/notifications/{self.notifications[0].pk}/', {}, format='json')
+        response = self.client.post('/api/v1/notifications/mark_all_as_read/')
+        self.assertEqual(response.data['message'], '2 notifications marked as read.')
+        self.assertEqual(self.counter(), 0)
+
+        Notification.objects.create(recipient=self.user, message='new')
+        response = self.client.delete('/api/v1/notifications/clear_all/')
+        self.assertEqual(response.data['message'], '4 notifications deleted.')
+        self.assertEqual(self.counter(), 0)
+
+    def test_badge_is_cached_until_the_counter_changes(self):
+        self.assertEqual(self.client.get('/api/v1/notifications/unread_count/').data['unread_count'], 3)
+        with self.assertNumQueries(0):
+            self.client.get('/api/v1/notifications/unread_count/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(recipient=self.user, message='new')
+        self.assertEqual(self.client.get('/api/v1/notifications/unread_count/').data['unread_count'], 4)
+
+    def test_reconcile_repairs_drift_and_missing_counters(self):
+        other = User.objects.create_user(email='other@test.com', name='Other', phone='3', password='other123')
+        Notification.objects.create(recipient=other, message='hello')
+        UnreadNotificationCounter.objects.filter(user=self.user).update(unread=42)
+        UnreadNotificationCounter.objects.filter(user=other).delete()
+
+        out = StringIO()
+        call_command('reconcile_unread_counters', batch_size=1, stdout=out)
+        self.assertIn('Repaired 1 counters, created 1', out.getvalue())
+        self.assertEqual(self.counter(), 3)
+        self.assertEqual(UnreadNotificationCounter.objects.get(user=other).unread, 1)
+        self.assertEqual(unread.reconcile(), (0, 0))
+
+
+@override_settings(NOTIFICATION_TTL_READ=10 * 24 * 60 * 60, NOTIFICATION_TTL_UNREAD=30 * 24 * 60 * 60)
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='customer@test.com', name='Customer', phone='2', password='cust123')
+        now = timezone.now()
+        for days, is_read in [(40, False), (20, False), (20, True), (5, True), (0, False)]:
+            notification = Notification.objects.create(recipient=self.user, message=f'{days} days', is_read=is_read)
+            Notification.objects.filter(pk=notification.pk).update(created_at=now - timedelta(days=days))
+
+    # ---------- TESTS ----------
+
+    def test_purge_applies_separate_ttls_in_chunks(self):
+        out = StringIO()
+        call_command('purge_notifications', chunk_size=1, pause=0, stdout=out)
+        self.assertIn('Deleted 2 notifications in 2 chunks', out.getvalue())
+        self.assertEqual(
+            sorted(Notification.objects.values_list('message', flat=True)),
+            ['0 days', '20 days', '5 days']
+        )
+        # the expired unread one was counted off
+        self.assertEqual(UnreadNotificationCounter.objects.get(user=self.user).unread, 2)
+
+    @override_settings(NOTIFICATION_TTL_READ=None, NOTIFICATION_TTL_UNREAD=None)
+    def test_disabled_ttls_keep_everything(self):
+        self.assertEqual(retention.purge_notifications()['deleted'], 0)
+        self.assertEqual(Notification.objects.count(), 5)
+
+    @override_settings(NOTIFICATION_DELETE_CHUNK_SIZE=2)
+    def test_clear_all_deletes_in_chunks(self):
+        other = User.objects.create_user(email='other@test.com', name='Other', phone='3', password='other123')
+        Notification.objects.create(recipient=other, message='keep')
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.delete('/api/v1/notifications/clear_all/')
+        self.assertEqual(response.data['message'], '5 notifications deleted.')
+        self.assertEqual(sum(query['sql'].startswith('DELETE') for query in queries.captured_queries), 3)
+        self.assertEqual(list(Notification.objects.values_list('message', flat=True)), ['keep'])
+        self.assertEqual(UnreadNotificationCounter.objects.get(user=self.user).unread, 0)
+
+
+class TokenClaimsAuthenticationTests(MarketplaceTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/v1/token/', {'email': 'vendor@test.com', 'password': 'vendor123'}, format='json')
+        self.assertEqual(response.data['role'], 'vendor')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return AccessToken(response.data['access'])
+
+    # ---------- TESTS ----------
+
+    def test_login_signs_role_status_and_version(self):
+        token = self.login()
+        self.assertEqual((token['role'], token['status'], token['ver']), ('vendor', 'Pending', 0))
+
+    def test_requests_skip_the_user_lookup(self):
+        self.login()
+        self.client.get('/api/v1/notifications/unread_count/')  # caches the token version and the badge
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/notifications/unread_count/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_deferred_fields_load_the_row_once(self):
+        user = TokenUser.from_claims(self.vendor.pk, 'vendor', 'Pending', 0)
+        self.assertEqual(user, self.vendor)
+        with self.assertNumQueries(1):
+            self.assertEqual((user.email, user.name, user.phone), ('vendor@test.com', 'Vendor', '1'))
+        self.assertEqual(list(Merchant.objects.filter(user=user)), [self.merchant])
+
+    def test_the_password_hash_stays_out_of_the_cache(self):
+        user = TokenUser.from_claims(self.vendor.pk, 'vendor', 'Pending', 0)
+        self.assertEqual(user.name, 'Vendor')
+        cached = cache.get(f'auth:user-fields:{self.vendor.pk}:0')
+        self.assertEqual(cached['email'], 'vendor@test.com')
+        self.assertNotIn('password', cached)
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('vendor123'))
+
+    def test_role_change_and_deactivation_revoke_tokens(self):
+        self.login()
+        self.assertEqual(self.client.get('/api/v1/notifications/').status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor.role = 'customer'
+            self.vendor.save(update_fields=['role'])
+        self.assertEqual(self.client.get('/api/v1/notifications/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.login_as_customer = self.client.post('/api/v1/token/', {'email': 'vendor@test.com', 'password': 'vendor123'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login_as_customer.data['access']}")
+        self.assertEqual(self.client.get('/api/v1/notifications/').status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor.is_active = False
+            self.vendor.save()
+        self.assertEqual(self.client.get('/api/v1/notifications/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PermissionQueryTests(QueryBudgetMixin, MarketplaceTestCase):
+    merchant_fields = {'status': 'approved'}
+
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', phone='0', role='admin', password='admin123')
+        self.category = Category.objects.create(merchant=self.merchant, name='Mains')
+        self.product = Product.objects.create(category=self.category, name='Dish', price=5, stock=10)
+        self.order = Order.objects.create(customer=self.customer, merchant=self.merchant, courier=self.courier)
+        self.item = OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=5)
+        self.history = OrderStatusHistory.objects.create(order=self.order, previous_status='pending', new_status='confirmed')
+        self.notification = Notification.objects.create(recipient=self.customer, message='Hi')
+
+    # ---------- TESTS ----------
+
+    def test_every_viewset_permission_combination_is_query_free(self):
+        other_vendor = User.objects.create_user(email='other@test.com', name='Other', phone='4', role='vendor', password='other123')
+        other_merchant = Merchant.objects.create(name='Other Shop', user=other_vendor, city='Riyadh')
+        other_product = Product.objects.create(category=Category.objects.create(merchant=other_merchant, name='Sides'), name='Fries', price=2)
+
+        # (viewset, action, method, user, pk, allowed)
+        cases = [
+            (MerchantViewSet, 'partial_update', 'PATCH', self.vendor, self.merchant.pk, True),
+            (MerchantViewSet, 'destroy', 'DELETE', self.admin, self.merchant.pk, True),
+            (MerchantViewSet, 'retrieve', 'GET', self.vendor, self.merchant.pk, True),
+            (CategoryViewSet, 'partial_update', 'PATCH', self.vendor, self.category.pk, True),
+            (ProductViewSet, 'partial_update', 'PATCH', self.vendor, self.product.pk, True),
+            (ProductViewSet, 'partial_update', 'PATCH', self.admin, other_product.pk, True),
+            (ProductViewSet, 'retrieve', 'GET', self.customer, self.product.pk, True),
+            (ProductViewSet, 'partial_update', 'PATCH', self.customer, self.product.pk, False),
+            (OrderViewSet, 'partial_update', 'PATCH', self.vendor, self.order.pk, True),
+            (OrderViewSet, 'partial_update', 'PATCH', self.customer, self.order.pk, False),
+            (OrderViewSet, 'retrieve', 'GET', self.courier, self.order.pk, True),
+            (OrderItemViewSet, 'destroy', 'DELETE', self.vendor, self.item.pk, True),
+            (OrderStatusHistoryViewSet, 'retrieve', 'GET', self.customer, self.history.pk, True),
+            (NotificationViewSet, 'partial_update', 'PATCH', self.customer, self.notification.pk, True),
+        ]
+        for viewset, action, method, user, pk, allowed in cases:
+            with self.subTest(viewset=viewset.__name__, action=action, role=user.role):
+                self.assertEqual(self.assertPermissionQueries(viewset, action, method, user, pk), allowed)
+
+    def test_owner_is_read_from_loaded_ids(self):
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(1):  # nothing annotated or select_related: one values_list()
+            self.assertEqual(owner_id(product, 'category__merchant__user'), self.vendor.pk)
+        order = Order.objects.select_related('merchant').get(pk=self.order.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(owner_id(product, 'category__merchant__user'), self.vendor.pk)
+            self.assertEqual(owner_id(order, 'merchant__user'), self.vendor.pk)
+            self.assertEqual(owner_id(order, 'customer'), self.customer.pk)
+
+    def test_vendor_cannot_edit_another_vendors_merchant(self):
+        other_vendor = User.objects.create_user(email='other@test.com', name='Other', phone='4', role='vendor', password='other123')
+        client = APIClient()
+        client.force_authenticate(user=other_vendor)
+        self.assertEqual(client.patch(f'/api/v1/merchants/{self.merchant.pk}/', {'name': 'Mine'}, format='json').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        client.force_authenticate(user=self.vendor)
+        response = client.patch(f'/api/v1/products/{self.product.pk}/', {'price': '6.00'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CourierDispatchTests(MarketplaceTestCase):
+    merchant_fields = {'latitude': 25.2, 'longitude': 55.27}
+
+    def setUp(self):
+        grid = mock.patch.object(dispatch, '_grid', None)
+        grid.start()
+        self.addCleanup(grid.stop)
+        self.near, self.far = [
+            User.objects.create_user(email=f'courier{i}@test.com', name=f'Courier {i}', phone='3', role='courier', password='cour123')
+            for i in range(2)
+        ]
+        self.client = APIClient()
+
+    def ping(self, courier, latitude, longitude, **extra):
+        self.client.force_authenticate(user=courier)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/couriers/location/', dict(latitude=latitude, longitude=longitude, **extra), format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    # ---------- TESTS ----------
+
+    def test_grid_matches_brute_force(self):
+        rng = random.Random(7)
+        grid = dispatch.CourierGrid(cell_degrees=0.01)
+        points = {i: (25 + rng.random() * 0.3, 55 + rng.random() * 0.3) for i in range(500)}
+        for courier_id, (latitude, longitude) in points.items():
+            grid.update(courier_id, latitude, longitude)
+        for courier_id in range(0, 500, 5):  # some move, some go off duty
+            grid.update(courier_id, *points[courier_id + 1])
+            points[courier_id] = points[courier_id + 1]
+            grid.remove(courier_id + 2)
+            del points[courier_id + 2]
+
+        for _ in range(50):
+            latitude, longitude = 25 + rng.random() * 0.3, 55 + rng.random() * 0.3
+            expected = min(dispatch.distance_km(latitude, longitude, *point) for point in points.values())
+            self.assertAlmostEqual(grid.nearest(latitude, longitude, max_km=50)[0], expected)
+        self.assertIsNone(grid.nearest(40, 10, max_km=5))
+
+    def test_preparing_order_gets_the_nearest_courier(self):
+        self.ping(self.near, 25.21, 55.27)
+        self.ping(self.far, 25.3, 55.27)
+        order = Order.objects.create(customer=self.customer, merchant=self.merchant)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'preparing'
+            order.save()
+        order.refresh_from_db()
+        self.assertEqual(order.courier, self.near)
+        self.assertTrue(CourierLocation.objects.get(pk=self.near.pk).on_duty)
+        self.assertNotIn(self.near.pk, dispatch.get_grid())
+        self.assertTrue(Notification.objects.filter(recipient=self.near, message__contains=f'#{order.pk}').exists())
+
+        # a busy courier keeps moving without becoming assignable
+        self.ping(self.near, 25.2, 55.27)
+        self.assertNotIn(self.near.pk, dispatch.get_grid())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'delivered'
+            order.save()
+        self.assertIn(self.near.pk, dispatch.get_grid())
+
+    def test_stale_index_entries_are_skipped(self):
+        self.ping(self.near, 25.21, 55.27)
+        self.ping(self.far, 25.3, 55.27)
+        # claimed by another process: the database says no, the index doesn't know yet
+        Order.objects.create(customer=self.customer, merchant=self.merchant, courier=self.near, status='preparing')
+        order = Order.objects.create(customer=self.customer, merchant=self.merchant)
+        self.assertEqual(dispatch.assign_courier(order.pk, 25.2, 55.27), self.far.pk)
+        self.assertEqual(len(dispatch.get_grid()), 0)
+
+    def test_couriers_released_by_another_process_rejoin_with_their_next_ping(self):
+        self.ping(self.near, 25.21, 55.27)
+        order = Order.objects.create(customer=self.customer, merchant=self.merchant)
+        self.assertEqual(dispatch.assign_courier(order.pk, 25.2, 55.27), self.near.pk)
+        # delivered on another worker: the courier is free again, this process's index doesn't know
+        Order.objects.filter(pk=order.pk).update(status='delivered')
+        self.assertNotIn(self.near.pk, dispatch.get_grid())
+        self.ping(self.near, 25.22, 55.27)
+        self.assertIn(self.near.pk, dispatch.get_grid())
+
+    def test_releases_leave_duty_and_other_orders_alone(self):
+        self.ping(self.near, 25.21, 55.27)
+        first, second = [Order.objects.create(customer=self.customer, merchant=self.merchant) for _ in range(2)]
+        self.assertEqual(dispatch.assign_courier(first.pk, 25.2, 55.27), self.near.pk)
+        Order.objects.filter(pk=second.pk).update(courier=self.near)  # handed a second order by hand
+
+        for order in (first, second):
+            order.refresh_from_db()
+            with self.captureOnCommitCallbacks(execute=True):
+                order.status = 'delivered'
+                order.save()
+            # still carrying the second order after the first one
+            self.assertEqual(self.near.pk in dispatch.get_grid(), order == second)
+
+        # going off duty mid-delivery sticks once the order is over
+        third = Order.objects.create(customer=self.customer, merchant=self.merchant)
+        self.assertEqual(dispatch.assign_courier(third.pk, 25.2, 55.27), self.near.pk)
+        self.ping(self.near, 25.2, 55.27, on_duty=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            third.status = 'cancelled'
+            third.save()
+        self.assertNotIn(self.near.pk, dispatch.get_grid())
+        self.assertFalse(CourierLocation.objects.get(pk=self.near.pk).on_duty)
+
+    def test_off_duty_couriers_and_other_roles(self):
+        self.ping(self.near, 25.21, 55.27, on_duty=False)
+        self.assertNotIn(self.near.pk, dispatch.get_grid())
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.post('/api/v1/couriers/location/', {'latitude': 1, 'longitude': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class MerchantPricingTests(MarketplaceTestCase):
+    # customer at (25.2, 55.27); one degree of latitude is ~111 km
+    merchant_fields = {'name': 'Close', 'status': 'approved', 'latitude': 25.21, 'longitude': 55.27, 'prep_time_avg': 40}
+
+    def setUp(self):
+        self.close = self.merchant
+        self.middle = Merchant.objects.create(name='Middle', user=self.vendor, city='Dubai', status='approved',
+                                              latitude=25.25, longitude=55.27, prep_time_avg=10)
+        self.far = Merchant.objects.create(name='Far', user=self.vendor, city='Dubai', status='approved',
+                                           latitude=25.4, longitude=55.27, prep_time_avg=10)
+        Merchant.objects.create(name='Nowhere', user=self.vendor, city='Dubai', status='approved')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def names(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return [merchant['name'] for merchant in response.data['results']]
+
+    # ---------- TESTS ----------
+
+    def test_numpy_and_fallback_agree(self):
+        latitudes, longitudes, prep = [25.21, 25.25, 25.4], [55.27, 55.3, 55.27], [40, 10, 10]
+        vectorized = pricing.quote(25.2, 55.27, latitudes, longitudes, prep)
+        with mock.patch.object(pricing, 'np', None):
+            looped = pricing.quote(25.2, 55.27, latitudes, longitudes, prep)
+        for fast, slow in zip(vectorized, looped):
+            for a, b in zip(fast, slow):
+                self.assertAlmostEqual(float(a), float(b))
+        self.assertEqual(list(vectorized[1][:1]), [2.0])  # inside the included distance
+
+    @override_settings(DELIVERY_FEE='2.00', DELIVERY_FEE_PER_KM='0.50', DELIVERY_FEE_INCLUDED_KM=2,
+                       COURIER_SPEED_KMH=30, DELIVERY_PICKUP_MINUTES=5)
+    def test_listing_is_priced_sorted_and_filtered(self):
+        with self.assertNumQueries(3):  # the ETag fingerprint, candidate columns, then the page's rows
+            response = self.client.get('/api/v1/merchants/', {'lat': 25.2, 'lng': 55.27, 'ordering': 'eta'})
+        self.assertEqual(self.names(response), ['Middle', 'Close', 'Far'])
+        middle = response.data['results'][0]
+        self.assertAlmostEqual(middle['distance_km'], 5.56, places=2)
+        self.assertEqual(middle['delivery_fee'], '3.78')  # 2.00 + 0.50 * 3.56 km
+        self.assertEqual(middle['eta_minutes'], 27)  # 10 prep + 5 pickup + 11.1 min ride, rounded up
+        self.assertEqual(response.data['count'], 3)
+
+        response = self.client.get('/api/v1/merchants/', {'lat': 25.2, 'lng': 55.27, 'ordering': '-delivery_fee', 'max_distance': 10})
+        self.assertEqual(self.names(response), ['Middle', 'Close'])
+        response = self.client.get('/api/v1/merchants/', {'lat': 25.2, 'lng': 55.27, 'max_fee': 2})
+        self.assertEqual(self.names(response), ['Close'])
+
+    def test_listing_without_a_location_is_unpriced(self):
+        response = self.client.get('/api/v1/merchants/', {'ordering': 'prep_time_avg'})
+        self.assertEqual(self.names(response)[-1], 'Close')
+        self.assertIsNone(response.data['results'][0]['delivery_fee'])
+        self.assertEqual(self.client.get('/api/v1/merchants/', {'lat': 'north'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MerchantStatsTests(MarketplaceTestCase):
+    merchant_fields = {'status': 'approved', 'latitude': 25.2, 'longitude': 55.27}
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+        self.clock = timezone.now()
+
+    def deliver(self, prep_minutes):
+        order = Order.objects.create(customer=self.customer, merchant=self.merchant)
+        start = self.clock = self.clock + timedelta(hours=1)
+        for minutes, new_status in [(0, 'confirmed'), (prep_minutes, 'out_for_delivery'), (prep_minutes + 20, 'delivered')]:
+            with mock.patch('django.utils.timezone.now', return_value=start + timedelta(minutes=minutes)):
+                order.status = new_status
+                order.save()
+        return order
+
+    def stats(self):
+        return MerchantStats.objects.get(merchant=self.merchant)
+
+    # ---------- TESTS ----------
+
+    def test_preparation_time_is_folded_in_per_order(self):
+        self.deliver(10)
+        self.deliver(20)
+        stats = self.stats()
+        self.assertEqual((stats.prep_count, stats.prep_seconds_sum, stats.prep_seconds_mean), (2, 1800, 900))
+        self.assertAlmostEqual(stats.prep_seconds_ema, 600 * 0.8 + 1200 * 0.2)
+
+        # the listing ETA switches from prep_time_avg (20) to the learned 12 minutes
+        response = self.client.get('/api/v1/merchants/', {'lat': 25.2, 'lng': 55.27})
+        self.assertEqual(response.data['results'][0]['eta_minutes'], 17)
+
+    def test_customers_rate_delivered_orders_once(self):
+        first, second = self.deliver(10), self.deliver(10)
+        pending = Order.objects.create(customer=self.customer, merchant=self.merchant)
+        self.assertEqual(self.client.post(f'/api/v1/orders/{first.pk}/rate/', {'rating': 4}).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(f'/api/v1/orders/{first.pk}/rate/', {'rating': 1}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(f'/api/v1/orders/{pending.pk}/rate/', {'rating': 1}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(f'/api/v1/orders/{second.pk}/rate/', {'rating': 9}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.post(f'/api/v1/orders/{second.pk}/rate/', {'rating': 1})
+
+        self.assertEqual((self.stats().rating_count, self.stats().rating), (2, 2.5))
+        other = Merchant.objects.create(name='Other', user=self.vendor, city='Dubai', status='approved')
+        MerchantStats.objects.filter(merchant=other).update(rating=4.5)
+        response = self.client.get('/api/v1/merchants/', {'ordering': '-rating'})
+        self.assertEqual([(m['name'], m['rating']) for m in response.data['results']], [('Other', 4.5), ("Vendor's Shop", 2.5)])
+
+    def test_rebuild_matches_the_running_aggregates(self):
+        for minutes in (10, 25, 5):
+            self.deliver(minutes)
+        Order.objects.filter(merchant=self.merchant).update(rating=5)
+        Order.objects.filter(pk=Order.objects.first().pk).update(rating=2)
+        before = self.stats()
+        MerchantStats.objects.all().delete()
+        empty = Merchant.objects.create(name='Empty', user=self.vendor, city='Dubai')
+        MerchantStats.objects.filter(merchant=empty).delete()
+
+        call_command('rebuild_merchant_stats', batch_size=2, stdout=StringIO())
+        after = self.stats()
+        self.assertEqual((after.prep_count, after.prep_seconds_sum), (before.prep_count, before.prep_seconds_sum))
+        self.assertAlmostEqual(after.prep_seconds_ema, before.prep_seconds_ema)
+        self.assertEqual((after.rating_count, after.rating), (3, 4.0))
+        self.assertEqual(MerchantStats.objects.get(merchant=empty).prep_count, 0)
+
+
+class SalesRollupTests(MarketplaceTestCase):
+    def setUp(self):
+        category = Category.objects.create(merchant=self.merchant, name='Mains')
+        self.burger = Product.objects.create(category=category, name='Burger', price='8.50', stock=100)
+        self.fries = Product.objects.create(category=category, name='Fries', price='3.00', stock=100)
+        self.client = APIClient()
+
+    def order(self, final_status, burgers=0, fries=0):
+        self.client.force_authenticate(user=self.customer)
+        items = [{'product': product.pk, 'quantity': quantity}
+                 for product, quantity in ((self.burger, burgers), (self.fries, fries)) if quantity]
+        response = self.client.post('/api/v1/orders/checkout/', {'merchant': self.merchant.pk, 'items': items}, format='json')
+        order = Order.objects.get(pk=response.data['id'])
+        order.status = final_status
+        order.save()
+        return order
+
+    def dashboard(self, path, user=None, **params):
+        self.client.force_authenticate(user=user or self.vendor)
+        return self.client.get(f'/api/v1/dashboard/{path}/', params)
+
+    # ---------- TESTS ----------
+
+    def test_finished_orders_are_rolled_up_per_day(self):
+        self.order('delivered', burgers=2, fries=1)   # 17.00 + 3.00 + 2.00 fee
+        self.order('delivered', burgers=1)            # 8.50 + 2.00
+        cancelled = self.order('cancelled', fries=3)
+        self.order('preparing', burgers=1)
+
+        day = MerchantDailySales.objects.get()
+        self.assertEqual((day.day, day.revenue, day.orders, day.items, day.cancelled),
+                         (timezone.localdate(), Decimal('32.50'), 2, 4, 1))
+        burger = ProductDailySales.objects.get(product=self.burger)
+        self.assertEqual((burger.merchant_id, burger.revenue, burger.orders, burger.quantity, burger.cancelled),
+                         (self.merchant.pk, Decimal('25.50'), 2, 3, 0))
+
+        # moving a finished order to the other finished state takes its old share back
+        cancelled.status = 'delivered'
+        cancelled.save()
+        day.refresh_from_db()
+        self.assertEqual((day.revenue, day.orders, day.items, day.cancelled), (Decimal('43.50'), 3, 7, 0))
+        self.assertEqual(ProductDailySales.objects.get(product=self.fries).quantity, 4)
+
+    def test_dashboards_read_only_the_rollups(self):
+        self.order('delivered', burgers=2, fries=1)
+        self.order('delivered', fries=5)
+        self.order('cancelled', burgers=1)
+        with CaptureQueriesContext(connection) as queries:
+            sales = self.dashboard('sales')
+            top = self.dashboard('top-products', ordering='quantity')
+        self.assertFalse([q for q in queries.captured_queries if '"api_order' in q['sql']])
+
+        self.assertEqual(sales.status_code, status.HTTP_200_OK)
+        self.assertEqual(sales.data['totals'], {'revenue': '39.00', 'orders': 2, 'items': 8, 'cancelled': 1})
+        self.assertEqual([(str(d['day']), d['orders']) for d in sales.data['days']], [(str(timezone.localdate()), 2)])
+        self.assertEqual([(p['product_name'], p['quantity']) for p in top.data['products']], [('Fries', 6), ('Burger', 2)])
+        self.assertEqual(self.dashboard('top-products', limit=1).data['products'][0]['product_name'], 'Fries')
+
+        yesterday = timezone.localdate() - timedelta(days=1)
+        self.assertEqual(self.dashboard('sales', end=yesterday).data['totals']['orders'], 0)
+        self.assertEqual(self.dashboard('sales', start=timezone.localdate(), end=yesterday).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.dashboard('sales', user=self.customer).status_code, status.HTTP_403_FORBIDDEN)
+        other = User.objects.create_user(email='other@test.com', name='Other', phone='3', role='vendor', password='x')
+        self.assertEqual(self.dashboard('sales', user=other).data['totals']['orders'], 0)
+        admin = User.objects.create_user(email='admin@test.com', name='Admin', phone='4', role='admin', password='x')
+        self.assertEqual(self.dashboard('sales', user=admin, merchant=self.merchant.pk).data['totals']['orders'], 2)
+
+    def test_backfill_matches_the_incremental_rollups(self):
+        self.order('delivered', burgers=2, fries=1)
+        self.order('cancelled', burgers=1, fries=1)
+        self.order('delivered', fries=2)
+        fields = ('merchant_id', 'day', 'revenue', 'orders', 'items', 'cancelled')
+        merchants = list(MerchantDailySales.objects.values_list(*fields))
+        products = sorted(ProductDailySales.objects.values_list('product_id', 'merchant_id', 'day', 'revenue', 'orders', 'quantity', 'cancelled'))
+        MerchantDailySales.objects.all().delete()
+        ProductDailySales.objects.filter(product=self.fries).update(quantity=0)
+
+        call_command('rebuild_sales_rollups', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(MerchantDailySales.objects.values_list(*fields)), merchants)
+        self.assertEqual(sorted(ProductDailySales.objects.values_list('product_id', 'merchant_id', 'day', 'revenue', 'orders', 'quantity', 'cancelled')), products)
+
+
+class OrderExportTests(MarketplaceTestCase):
+    def setUp(self):
+        product = Product.objects.create(category=Category.objects.create(merchant=self.merchant, name='Mains'), name='Burger, large', price='8.50')
+        self.orders = []
+        for days_ago, order_status in [(3, 'delivered'), (2, 'cancelled'), (1, 'delivered'), (0, 'pending'), (0, 'delivered')]:
+            order = Order.objects.create(customer=self.customer, merchant=self.merchant, status=order_status, total='10.50')
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+            OrderItem.objects.create(order=order, product=product, quantity=days_ago + 1, price=Decimal('8.50'))
+            self.orders.append(order)
+        other_vendor = User.objects.create_user(email='other@test.com', name='Other', phone='3', role='vendor', password='x')
+        Order.objects.create(customer=self.customer, merchant=Merchant.objects.create(name='Other', user=other_vendor, city='Dubai'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.vendor)
+
+    def export(self, path='orders', **params):
+        response = self.client.get(f'/api/v1/{path}/export/', params)
+        if response.status_code != status.HTTP_200_OK:
+            return response, None
+        return response, b''.join(response.streaming_content).decode()
+
+    # ---------- TESTS ----------
+
+    def test_csv_export_streams_the_users_orders(self):
+        response, body = self.export()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(body)))
+        self.assertEqual(rows[0][:3], ['id', 'created_at', 'status'])
+        # oldest first, and nothing from the other vendor's merchant
+        self.assertEqual([int(row[0]) for row in rows[1:]], [order.pk for order in self.orders])
+        self.assertEqual(rows[1][rows[0].index('total')], '10.50')
+
+    def test_ndjson_export_filters_on_day_and_status(self):
+        today = timezone.localdate()
+        _, body = self.export(output='ndjson', start=today - timedelta(days=2), end=today, status='delivered,pending')
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([record['id'] for record in records], [order.pk for order in self.orders[2:]])
+        self.assertEqual((records[0]['merchant_name'], records[0]['total']), ("Vendor's Shop", '10.50'))
+
+        _, body = self.export('order-items', status='cancelled')
+        rows = list(csv.reader(StringIO(body)))
+        self.assertEqual(rows[1][rows[0].index('product_name')], 'Burger, large')
+        self.assertEqual([(row[1], row[rows[0].index('quantity')]) for row in rows[1:]], [(str(self.orders[1].pk), '3')])
+
+    def test_rows_are_fetched_and_sent_in_chunks(self):
+        with override_settings(EXPORT_CHUNK_SIZE=2):
+            response = self.client.get('/api/v1/orders/export/')
+            with CaptureQueriesContext(connection) as queries:
+                chunks = list(response.streaming_content)
+        self.assertTrue(queries.captured_queries)  # nothing was read before the body was consumed
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [1, 2, 2, 1])
+
+    def test_batches_continue_past_rows_sharing_a_timestamp(self):
+        Order.objects.filter(pk__in=[order.pk for order in self.orders]).update(created_at=timezone.now())
+        with override_settings(EXPORT_CHUNK_SIZE=2), CaptureQueriesContext(connection) as queries:
+            _, body = self.export()
+        rows = list(csv.reader(StringIO(body)))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [order.pk for order in self.orders])
+        self.assertTrue(all('LIMIT 2' in query['sql'] for query in queries.captured_queries if 'api_order' in query['sql']))
+
+    async def test_asgi_exports_stream_asynchronously(self):
+        token = EmailTokenObtainPairSerializer.get_token(self.vendor).access_token
+        with override_settings(EXPORT_CHUNK_SIZE=2):
+            response = await self.async_client.get('/api/v1/orders/export/', {'output': 'ndjson'},
+                                                   headers={'Authorization': f'Bearer {token}'})
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [2, 2, 1])
+        self.assertEqual([json.loads(line)['id'] for line in b''.join(chunks).splitlines()], [order.pk for order in self.orders])
+
+    def test_export_rejects_bad_parameters_and_other_roles(self):
+        self.assertEqual(self.export(status='lost')[0].status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.export(output='xml')[0].status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.export(start='2024-02-02', end='2024-02-01')[0].status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.export()[0].status_code, status.HTTP_403_FORBIDDEN)
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def seed(self, **options):
+        defaults = dict(orders=25, customers=4, vendors=2, couriers=2, admins=1, merchants_per_vendor=1,
+                        categories_per_merchant=2, products_per_category=3, batch_size=10, stdout=StringIO())
+        call_command('seed_data', **dict(defaults, **options))
+
+    # ---------- TESTS ----------
+
+    def test_seeder_loads_every_table_and_the_derived_ones(self):
+        self.seed()
+        self.assertEqual(dict(User.objects.values_list('role').annotate(n=Count('id'))),
+                         {'admin': 1, 'vendor': 2, 'courier': 2, 'customer': 4})
+        self.assertEqual((Merchant.objects.count(), Product.objects.count(), Order.objects.count()), (2, 12, 25))
+        self.assertFalse(OrderItem.objects.exclude(product__category__merchant=F('order__merchant')).exists())
+        # every order has one history row per transition, and a notification for each
+        for order in Order.objects.prefetch_related('status_history'):
+            steps = [history.new_status for history in order.status_history.all()]
+            self.assertEqual(steps[-1:] or ['pending'], [order.status])
+        self.assertEqual(Notification.objects.count(), OrderStatusHistory.objects.count())
+        # orders are spread over the past --days, oldest ids first
+        dates = list(Order.objects.order_by('id').values_list('created_at', flat=True))
+        self.assertEqual(dates, sorted(dates))
+        self.assertLess(dates[0], timezone.now() - timedelta(days=30))
+
+        self.assertEqual(MerchantStats.objects.count(), 2)
+        self.assertEqual(UnreadNotificationCounter.objects.count(), User.objects.count())
+        self.assertEqual(MerchantDailySales.objects.aggregate(n=Sum('orders'))['n'], Order.objects.filter(status='delivered').count())
+        self.assertTrue(SearchIndexEntry.objects.filter(kind='product').exists())
+
+        self.seed(orders=5)  # seeding again adds to what is there
+        self.assertEqual(Order.objects.count(), 30)
+
+    def test_benchmark_covers_every_router_endpoint_and_writes_json(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.json')
+            call_command('bench_endpoints', repeat=2, roles='admin,customer', output=path, stdout=StringIO())
+            out = StringIO()
+            call_command('bench_endpoints', repeat=2, roles='admin', endpoint=['order list'], compare=path, stdout=out)
+            with open(path) as f:
+                run = json.load(f)
+
+        results = {(result['endpoint'], result['role']): result for result in run['results']}
+        for prefix, viewset, basename in router.registry:
+            self.assertEqual(results[f'{basename} list', 'admin']['status'], 200, basename)
+        self.assertIn(('order detail', 'customer'), results)
+        self.assertEqual(results['dashboard sales', 'customer']['status'], 403)
+        admin_orders = results['order list', 'admin']
+        self.assertGreater(admin_orders['queries'], 0)
+        self.assertLessEqual(admin_orders['p50_ms'], admin_orders['p99_ms'])
+        self.assertGreater(admin_orders['peak_alloc_kib'], 0)
+        self.assertEqual(run['meta']['rows']['order'], 25)
+        # --compare appends the change against the earlier run
+        self.assertIn('p50', out.getvalue().splitlines()[0].split('KiB')[1])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', phone='1', role='admin', password='x')
+        self.customer = User.objects.create_user(email='customer@test.com', name='Customer', phone='2', password='x')
+        merchant = Merchant.objects.create(name='Shop', user=self.admin, city='Dubai')
+        for _ in range(3):
+            Order.objects.create(customer=self.customer, merchant=merchant)
+        metrics.get_registry().reset()
+        self.client = APIClient()
+
+    def scrape(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    # ---------- TESTS ----------
+
+    def test_requests_are_aggregated_per_route_method_and_role(self):
+        self.client.force_authenticate(user=self.customer)
+        for _ in range(2):
+            listed = self.client.get('/api/v1/orders/')
+        self.client.get('/api/v1/no-such-page/')
+
+        samples = self.scrape()
+        labels = 'route="order-list",method="GET",role="customer"'
+        self.assertEqual(samples[f'api_request_duration_seconds_count{{{labels}}}'], 2)
+        self.assertEqual(samples[f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], 2)
+        self.assertGreater(samples[f'api_request_duration_seconds_sum{{{labels}}}'], 0)
+        self.assertGreater(samples[f'api_db_queries_total{{{labels}}}'], 0)
+        self.assertGreater(samples[f'api_db_query_duration_seconds_total{{{labels}}}'], 0)
+        self.assertEqual(samples[f'api_response_bytes_total{{{labels}}}'], 2 * len(listed.content))
+        self.assertEqual(samples['api_request_duration_seconds_count{route="unmatched",method="GET",role="anonymous"}'], 1)
+
+    def test_streamed_bodies_are_counted_once_sent(self):
+        self.client.force_authenticate(user=self.admin)
+        body = b''.join(self.client.get('/api/v1/orders/export/').streaming_content)
+        samples = self.scrape()
+        self.assertEqual(samples['api_response_bytes_total{route="order-export",method="GET",role="admin"}'], len(body))
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = metrics.MetricsRegistry(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 0.7, 3):
+            registry.observe(('a"b', 'GET', 'admin'), seconds, queries=2)
+        text = registry.render()
+        labels = 'route="a\\"b",method="GET",role="admin"'
+        for bound, count in (('0.1', 1), ('1.0', 3), ('+Inf', 4)):
+            self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}\n', text)
+        self.assertIn(f'api_db_queries_total{{{labels}}} 8\n', text)
+
+    def test_only_admins_read_metrics(self):
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', phone='1', role='admin', password='x')
+        self.customer = User.objects.create_user(email='customer@test.com', name='Customer', phone='2', password='x')
+        self.order = Order.objects.create(customer=self.customer, merchant=Merchant.objects.create(name='Shop', user=self.admin, city='Dubai'))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(PROFILING_DIR=os.path.join(self.directory, 'profiles'), PROFILING_MAX_FILES=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {EmailTokenObtainPairSerializer.get_token(user).access_token}')
+
+    # ---------- TESTS ----------
+
+    def test_flagged_admin_requests_are_profiled_with_their_sql(self):
+        self.login(self.admin)
+        response = self.client.patch(f'/api/v1/orders/{self.order.pk}/', {'status': 'confirmed'}, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profile_id = response['X-Profile-Id']
+
+        listed = self.client.get('/api/v1/profiles/').data
+        self.assertEqual([(p['id'], p['method'], p['status']) for p in listed], [(profile_id, 'PATCH', 200)])
+        report = json.loads(b''.join(self.client.get(f'/api/v1/profiles/{profile_id}/').streaming_content))
+        self.assertEqual(report['queries'], len(report['sql']))
+        history = next(q for q in report['sql'] if q['sql'].startswith('INSERT INTO "api_orderstatushistory"'))
+        self.assertEqual(history['receiver'], 'api.models.record_order_status_change')
+        self.assertTrue(history['stack'][0].startswith('api/models.py:'))
+        self.assertIn('cumulative', report['stats'])
+
+        download = self.client.get(f'/api/v1/profiles/{profile_id}/download/')
+        path = os.path.join(self.directory, 'downloaded.prof')
+        with open(path, 'wb') as f:
+            f.write(b''.join(download.streaming_content))
+        self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+    def test_only_flagged_admin_requests_are_profiled(self):
+        self.login(self.admin)
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/v1/orders/'))
+        self.assertIn('X-Profile-Id', self.client.get('/api/v1/orders/', {'profile': '1'}))
+        self.login(self.customer)
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/v1/orders/', HTTP_X_PROFILE='1'))
+        self.assertEqual(self.client.get('/api/v1/profiles/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_only_the_newest_profiles_are_kept(self):
+        self.login(self.admin)
+        ids = [self.client.get('/api/v1/orders/', HTTP_X_PROFILE='1')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual([p['id'] for p in self.client.get('/api/v1/profiles/').data], ids[:0:-1])
+        self.assertEqual(self.client.get(f'/api/v1/profiles/{ids[0]}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/v1/profiles/..%2Fsettings/download/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', phone='1', role='admin', password='x')
+        self.vendor = User.objects.create_user(email='vendor@test.com', name='Vendor', phone='2', role='vendor', password='x')
+        self.merchant = Merchant.objects.create(name='Shop', user=self.vendor, city='Dubai', latitude=25.2, longitude=55.27)
+        self.category = Category.objects.create(merchant=self.merchant, name='Mains')
+        self.products = [Product.objects.create(category=self.category, name=f'Dish {i}', price='5.00', stock=10)
+                         for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    # ---------- TESTS ----------
+
+    def test_unchanged_lists_and_objects_are_not_modified(self):
+        for url in ['/api/v1/merchants/', f'/api/v1/merchants/{self.merchant.pk}/', '/api/v1/categories/',
+                    f'/api/v1/categories/{self.category.pk}/', '/api/v1/products/', f'/api/v1/products/{self.products[0].pk}/']:
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, status.HTTP_200_OK, url)
+            self.assertIn('no-cache', first['Cache-Control'])
+            self.assertIn('Last-Modified', first)
+            again = self.revalidate(url, first)
+            self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED, url)
+            self.assertEqual((again.content, again['ETag']), (b'', first['ETag']))
+
+    def test_not_modified_lists_skip_the_page_and_the_serializer(self):
+        first = self.client.get('/api/v1/products/')
+        with mock.patch('api.serializers.ProductSerializer.to_representation') as serialize, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.revalidate('/api/v1/products/', first)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        serialize.assert_not_called()
+        self.assertEqual(len(queries), 1)  # the fingerprint
+
+    def test_edits_additions_and_deletions_change_the_etag(self):
+        url = '/api/v1/products/'
+        changes = [
+            lambda: self.products[0].save(),
+            lambda: inventory.take_stock(self.products[1].pk, 1),  # an F() update
+            lambda: Product.objects.create(category=self.category, name='New', price='1.00'),
+            lambda: self.products[2].delete(),
+        ]
+        response = self.client.get(url)
+        for change in changes:
+            change()
+            again = self.revalidate(url, response)
+            self.assertEqual(again.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(again['ETag'], response['ETag'])
+            response = again
+
+    def test_merchant_stats_and_query_parameters_are_part_of_the_etag(self):
+        for params in ({}, {'lat': 25.2, 'lng': 55.27}):
+            first = self.client.get('/api/v1/merchants/', params)
+            stats.record_rating(self.merchant.pk, 5)
+            again = self.revalidate('/api/v1/merchants/', first, **params)
+            self.assertEqual(again.status_code, status.HTTP_200_OK, params)
+            self.assertEqual(again.data['results'][0]['rating'], 5.0)
+        reordered = self.revalidate('/api/v1/products/', self.client.get('/api/v1/products/'), ordering='-price')
+        self.assertEqual(reordered.status_code, status.HTTP_200_OK)
+
+    def test_etags_are_per_user(self):
+        response = self.client.get('/api/v1/products/')
+        self.assertIn('Authorization', response['Vary'])
+        self.client.force_authenticate(user=self.vendor)
+        self.assertEqual(self.revalidate('/api/v1/products/', response).status_code, status.HTTP_200_OK)
+
+    def test_objects_answer_if_modified_since_but_lists_do_not(self):
+        detail = self.client.get(f'/api/v1/products/{self.products[0].pk}/')
+        since = {'HTTP_IF_MODIFIED_SINCE': detail['Last-Modified']}
+        self.assertEqual(self.client.get(f'/api/v1/products/{self.products[0].pk}/', **since).status_code, status.HTTP_304_NOT_MODIFIED)
+        listing = self.client.get('/api/v1/products/')
+        self.assertEqual(self.client.get('/api/v1/products/', HTTP_IF_MODIFIED_SINCE=listing['Last-Modified']).status_code,
+                         status.HTTP_200_OK)
+
+    def test_polling_benchmark_reports_savings(self):
+        out = StringIO()
+        call_command('bench_conditional', repeat=3, change_every=2, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(any(line.startswith('product list') and '304s 2/3' in line for line in lines), lines)
+        self.assertIn('of the bytes', lines[-1])
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        settings = override_settings(DATABASE_REPLICAS=['replica-a', 'replica-b'], REPLICA_STICKY_SECONDS=5)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        self.router = replicas.PrimaryReplicaRouter()
+        self.user = User(pk=7, role='customer')
+
+    def handling(self, request):
+        token = replicas.current.set(replicas.RequestRouting(request))
+        self.addCleanup(replicas.current.reset, token)
+
+    def authenticated(self, method='get'):
+        request = getattr(RequestFactory(), method)('/api/v1/products/')
+        request.user = self.user
+        self.handling(request)
+        return request
+
+    # ---------- TESTS ----------
+
+    def test_safe_requests_read_one_replica_once_authenticated(self):
+        self.assertIsNone(self.router.db_for_read(Product))  # no request: commands, workers
+        request = RequestFactory().get('/api/v1/products/')
+        request.user = SimpleLazyObject(lambda: self.user)  # not yet authenticated by the view
+        self.handling(request)
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        request.user = self.user
+        replica = self.router.db_for_read(Product)
+        self.assertIn(replica, ['replica-a', 'replica-b'])
+        self.assertEqual({self.router.db_for_read(model) for model in (Product, Merchant, Order)}, {replica})
+
+    def test_writes_transactions_and_unsafe_requests_use_the_primary(self):
+        self.authenticated(method='post')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.authenticated()
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')  # the rest of a request that wrote
+
+    def test_writers_are_pinned_to_the_primary(self):
+        request = RequestFactory().post('/api/v1/products/')
+
+        def view(request):
+            request.user = self.user  # as DRF does
+            self.router.db_for_write(Product)
+            return HttpResponse(status=201)
+        replicas.ReplicaRoutingMiddleware(view)(request)
+        self.assertTrue(replicas.is_pinned(self.user.pk))
+        self.authenticated()
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+        cache.delete(replicas.pin_key(self.user.pk))  # the window has passed
+        self.authenticated()
+        self.assertNotEqual(self.router.db_for_read(Product), 'default')
+
+    def test_replicas_refuse_a_per_process_cache(self):
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with override_settings(DATABASE_REPLICAS=['replica'], CACHES=local):
+            with self.assertRaises(ImproperlyConfigured):
+                replicas.check_shared_cache()
+        with override_settings(DATABASE_REPLICAS=['replica'], CACHES=shared):
+            replicas.check_shared_cache()
+        with override_settings(DATABASE_REPLICAS=[], CACHES=local):
+            replicas.check_shared_cache()
+
+
+# replicas with a test database of their own, which only catch up when told to
+LAGGING_REPLICAS = [alias for alias in getattr(django_settings, 'DATABASE_REPLICAS', [])
+                    if not django_settings.DATABASES[alias].get('TEST', {}).get('MIRROR')]
+
+
+@skipUnless(LAGGING_REPLICAS, 'needs a DATABASE_REPLICAS alias with its own test database, without TEST MIRROR')
+class ReplicaLagTests(TransactionTestCase):
+    """
+    Replication lag against a real second database: the replica only sees
+    what replicate() copies over. Run with settings that add one, e.g.
+    DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+    and DATABASE_REPLICAS = ['replica'] (two MySQL schemas work the same way),
+    over a shared cache such as FileBasedCache.
+    """
+    databases = {'default', *LAGGING_REPLICAS[:1]}
+
+    def setUp(self):
+        self.replica = LAGGING_REPLICAS[0]
+        settings = override_settings(DATABASE_REPLICAS=[self.replica])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        self.vendor = User.objects.create_user(email='vendor@test.com', name='Vendor', phone='1', role='vendor', password='x')
+        self.customer = User.objects.create_user(email='customer@test.com', name='Customer', phone='2', password='x')
+        merchant = Merchant.objects.create(name='Shop', user=self.vendor, city='Dubai', status='approved')
+        self.category = Category.objects.create(merchant=merchant, name='Mains')
+        Product.objects.create(category=self.category, name='Old', price='5.00')
+        self.replicate()
+        self.client = APIClient()
+
+    def replicate(self):
+        """The replica catches up with every row added on the primary."""
+        for model in (User, UnreadNotificationCounter, Merchant, MerchantStats, Category, Product):
+            model.objects.using(self.replica).bulk_create(model.objects.using('default').all(), ignore_conflicts=True)
+
+    def names(self, user):
+        self.client.force_authenticate(user=user)
+        return [product['name'] for product in self.client.get('/api/v1/products/').data['results']]
+
+    # ---------- TESTS ----------
+
+    def test_browsing_reads_the_replica(self):
+        Product.objects.create(category=self.category, name='New', price='6.00')
+        self.assertEqual(self.names(self.customer), ['Old'])  # not replicated yet
+        self.replicate()
+        self.assertEqual(self.names(self.customer), ['Old', 'New'])
+
+    def test_caches_are_filled_from_the_primary(self):
+        self.client.force_authenticate(user=self.customer)
+        url = f'/api/v1/merchants/{self.category.merchant_id}/menu/'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        Product.objects.create(category=self.category, name='New', price='6.00')  # bumps the menu version
+        Notification.objects.create(recipient=self.customer, message='Hi')
+
+        menu = self.client.get(url).data
+        self.assertEqual([product['name'] for product in menu['categories'][0]['products']], ['New', 'Old'])
+        self.assertEqual(self.client.get('/api/v1/notifications/unread_count/').data['unread_count'], 1)
+        self.assertFalse(Product.objects.using(self.replica).filter(name='New').exists())  # still lagging
+
+    def test_writers_read_their_own_writes_through_the_lag(self):
+        self.client.force_authenticate(user=self.vendor)
+        response = self.client.post('/api/v1/products/', {'category': self.category.pk, 'name': 'Fresh', 'price': '7.00'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(Product.objects.using(self.replica).filter(name='Fresh').exists())
+        url = f"/api/v1/products/{response.data['id']}/"
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)  # pinned to the primary
+        self.assertEqual(self.client.patch(url, {'price': '8.00'}).status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        cache.delete(replicas.pin_key(self.vendor.pk))  # the window has passed
+        self.assertEqual(self.names(self.vendor), ['Old'])
+        self.replicate()
+        self.assertEqual(self.names(self.vendor), ['Old', 'Fresh'])
+
+
+class AsyncReadPathTests(MarketplaceTestCase):
+    merchant_fields = {'name': 'Shop', 'status': 'approved'}
+
+    def setUp(self):
+        cache.clear()
+        metrics.get_registry().reset()
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', phone='0', role='admin', password='x')
+        self.other = User.objects.create_user(email='other@test.com', name='Other', phone='4', password='x')
+        Merchant.objects.create(name='Closed', user=self.admin, city='Dubai', status='pending')
+        category = Category.objects.create(merchant=self.merchant, name='Mains')
+        products = [Product.objects.create(category=category, name=f'Dish {i}', price='5.00', stock=10) for i in range(22)]
+        self.order = Order.objects.create(customer=self.customer, merchant=self.merchant)
+        OrderItem.objects.create(order=self.order, product=products[0], quantity=2, price=Decimal('5.00'))
+        Notification.objects.create(recipient=self.customer, message='Hi')
+        self.client = APIClient()
+
+    def sync_get(self, url, params=None, **headers):
+        """The same request, answered by the router's viewset view."""
+        with override_settings(ASYNC_READ_VIEWS=False):
+            return self.client.get(url, params, **headers)
+
+    def bearer(self, user):
+        return {'Authorization': f'Bearer {EmailTokenObtainPairSerializer.get_token(user).access_token}'}
+
+    # ---------- TESTS ----------
+
+    def test_native_reads_answer_what_the_viewsets_answer(self):
+        urls = ['/api/v1/merchants/', '/api/v1/products/', '/api/v1/products/?page=2', '/api/v1/products/?page=last',
+                '/api/v1/products/?page=3', '/api/v1/products/?page=x', f'/api/v1/orders/{self.order.pk}/',
+                '/api/v1/orders/999/', '/api/v1/notifications/unread_count/']
+        for user in (self.admin, self.vendor, self.customer, self.other, self.courier, None):
+            self.client.force_authenticate(user=user)
+            for url in urls:
+                with self.subTest(role=getattr(user, 'role', None), url=url):
+                    native, viewset = self.client.get(url), self.sync_get(url)
+                    self.assertEqual((native.status_code, native.data), (viewset.status_code, viewset.data))
+                    for header in ('ETag', 'Last-Modified', 'Vary', 'Allow', 'WWW-Authenticate'):
+                        self.assertEqual(native.get(header), viewset.get(header), header)
+
+    def test_filter_backend_defaults_apply_to_native_reads(self):
+        self.client.force_authenticate(user=self.vendor)
+        with mock.patch.object(ProductViewSet, 'ordering', ['-id'], create=True):
+            native, viewset = self.client.get('/api/v1/products/'), self.sync_get('/api/v1/products/')
+        self.assertEqual(native.data, viewset.data)
+        self.assertEqual(native['ETag'], viewset['ETag'])
+        names = [product['name'] for product in native.data['results']]
+        self.assertEqual(names[:2], ['Dish 21', 'Dish 20'])
+
+    def test_native_reads_skip_the_viewset(self):
+        self.client.force_authenticate(user=self.customer)
+        with mock.patch.object(ProductViewSet, 'list') as listed, mock.patch.object(OrderViewSet, 'retrieve') as retrieved:
+            self.assertEqual(self.client.get('/api/v1/products/').status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.get(f'/api/v1/orders/{self.order.pk}/').status_code, status.HTTP_200_OK)
+        listed.assert_not_called()
+        retrieved.assert_not_called()
+
+    def test_everything_else_goes_to_the_viewset(self):
+        self.client.force_authenticate(user=self.vendor)
+        with mock.patch.object(ProductViewSet, 'list', return_value=HttpResponse('viewset')) as listed:
+            self.client.get('/api/v1/products/', {'search': 'dish'})
+            self.client.get('/api/v1/products/', HTTP_ACCEPT='text/html')
+        self.assertEqual(listed.call_count, 2)
+        response = self.client.patch(f'/api/v1/orders/{self.order.pk}/', {'status': 'confirmed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(user=self.customer)
+        checkout = self.client.post('/api/v1/orders/checkout/', {'items': []}, format='json')
+        self.assertEqual(checkout.status_code, status.HTTP_400_BAD_REQUEST)  # the list action, not order "checkout"
+
+    async def test_tokens_roles_and_revalidation_under_asgi(self):
+        url = f'/api/v1/orders/{self.order.pk}/'
+        response = await self.async_client.get(url, headers=self.bearer(self.customer))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['id'], self.order.pk)
+        for user in (self.other, self.courier):
+            response = await self.async_client.get(url, headers=self.bearer(user))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.get(url, headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+        listed = await self.async_client.get('/api/v1/merchants/', headers=self.bearer(self.customer))
+        self.assertEqual([merchant['name'] for merchant in json.loads(listed.content)['results']], ['Shop'])
+        again = await self.async_client.get('/api/v1/merchants/', headers={**self.bearer(self.customer),
+                                                                           'If-None-Match': listed['ETag']})
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        badge = await self.async_client.get('/api/v1/notifications/unread_count/', headers=self.bearer(self.customer))
+        self.assertEqual(json.loads(badge.content), {'unread_count': 1})
+
+    async def test_native_reads_are_measured(self):
+        await self.async_client.get('/api/v1/products/', headers=self.bearer(self.customer))
+        samples = metrics.get_registry().render()
+        labels = 'route="product-list",method="GET",role="customer"'
+        self.assertIn(f'api_request_duration_seconds_count{{{labels}}} 1\n', samples)
+        queries = next(line for line in samples.splitlines() if line.startswith(f'api_db_queries_total{{{labels}}}'))
+        self.assertGreaterEqual(float(queries.rsplit(' ', 1)[1]), 2)  # the fingerprint and the page
@@ -0,0 +1,145 @@
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import User, Notification, UnreadNotificationCounter
+from .signals import notifications_created
+
+# Bounds how long a count cached by a reader racing a commit can stay stale
+UNREAD_CACHE_TIMEOUT = getattr(settings, 'UNREAD_CACHE_TIMEOUT', 60 * 5)
+
+
+def cache_key(user_id):
+    return f'unread:{user_id}'
+
+
+def adjust_unread(user_ids, delta, using='default'):
+    """
+    Add `delta` to the counters of `user_ids` in one `UPDATE ... SET unread = unread + delta`.
+
+    Call it inside the transaction that created, read or deleted the
+    notifications so the counter commits (or rolls back) with them. The
+    cached counts are dropped once that transaction commits.
+    """
+    user_ids = list(user_ids)
+    if not user_ids or not delta:
+        return
+    UnreadNotificationCounter.objects.using(using).filter(user_id__in=user_ids).update(unread=F('unread') + delta)
+    transaction.on_commit(lambda: cache.delete_many([cache_key(user_id) for user_id in user_ids]), using=using)
+
+
+def adjust_unread_by_user(deltas, using='default'):
+    """Apply a {user_id: delta} mapping with one UPDATE per distinct delta rather than one per user."""
+    users_by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        users_by_delta[delta].append(user_id)
+    for delta, user_ids in users_by_delta.items():
+        adjust_unread(user_ids, delta, using)
+
+
+def count_unread(user_id):
+    """The slow path the counter replaces."""
+    return Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+
+
+def unread_count(user_id):
+    """
+    A user's unread badge: from the cache, else the counter row, seeded with COUNT(*) if missing.
+
+    The counter is read from the primary, as a lagging replica's count would be cached.
+    """
+    key = cache_key(user_id)
+    count = cache.get(key)
+    if count is not None:
+        return count
+
+    counters = UnreadNotificationCounter.objects.using(DEFAULT_DB_ALIAS)
+    count = counters.filter(user_id=user_id).values_list('unread', flat=True).first()
+    if count is None:
+        try:
+            with transaction.atomic():
+                count = UnreadNotificationCounter.objects.create(user_id=user_id, unread=count_unread(user_id)).unread
+        except IntegrityError:
+            count = counters.values_list('unread', flat=True).get(user_id=user_id)
+    cache.set(key, count, UNREAD_CACHE_TIMEOUT)
+    return count
+
+
+async def aunread_count(user_id):
+    """unread_count() for async views: a cache hit, else one counter read; seeding a counter goes through the sync path."""
+    count = cache.get(cache_key(user_id))  # sync, see acurrent_token_version() in api/authentication.py
+    if count is not None:
+        return count
+    count = await (UnreadNotificationCounter.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id)
+                   .values_list('unread', flat=True).afirst())
+    if count is None:
+        return await sync_to_async(unread_count)(user_id)
+    cache.set(cache_key(user_id), count, UNREAD_CACHE_TIMEOUT)
+    return count
+
+
+def reconcile(batch_size=1000):
+    """
+    Repair counters that drifted from the notifications table.
+
+    Users are walked in primary key order a batch at a time. Each batch costs
+    one grouped COUNT to find the drifted counters, one UPDATE that resets
+    them from a correlated COUNT (so increments committed meanwhile aren't
+    lost) and one INSERT for users without a counter.
+    Returns (repaired, created).
+    """
+    repaired = created = 0
+    last_id = 0
+    while True:
+        rows = list(User.objects
+                    .filter(pk__gt=last_id)
+                    .order_by('pk')
+                    .annotate(actual=Count('notifications', filter=Q(notifications__is_read=False)))
+                    .values_list('pk', 'actual', 'unread_counter__unread')[:batch_size])
+        if not rows:
+            return repaired, created
+        last_id = rows[-1][0]
+
+        drifted = [user_id for user_id, actual, stored in rows if stored is not None and stored != actual]
+        missing = [UnreadNotificationCounter(user_id=user_id, unread=actual)
+                   for user_id, actual, stored in rows if stored is None]
+        with transaction.atomic():
+            if drifted:
+                actual = (Notification.objects
+                          .filter(recipient_id=OuterRef('user_id'), is_read=False)
+                          .order_by()
+                          .values('recipient_id')
+                          .annotate(total=Count('id'))
+                          .values('total'))
+                repaired += (UnreadNotificationCounter.objects
+                             .filter(user_id__in=drifted)
+                             .update(unread=Coalesce(Subquery(actual, output_field=IntegerField()), 0)))
+            if missing:
+                created += len(UnreadNotificationCounter.objects.bulk_create(missing, ignore_conflicts=True))
+            keys = [cache_key(user_id) for user_id in drifted + [counter.user_id for counter in missing]]
+            if keys:
+                transaction.on_commit(lambda keys=keys: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=User)
+def create_unread_counter(sender, instance, created, raw=False, using=None, **kwargs):
+    if created and not raw:
+        UnreadNotificationCounter.objects.using(using).create(user=instance)
+
+
+@receiver(post_save, sender=Notification)
+def count_created_notification(sender, instance, created, raw=False, using=None, **kwargs):
+    if created and not raw and not instance.is_read:
+        adjust_unread([instance.recipient_id], 1, using)
+
+
+@receiver(notifications_created)
+def count_created_notifications(sender, notifications, using, **kwargs):
+    adjust_unread_by_user(Counter(n.recipient_id for n in notifications if not n.is_read), using)
@@ -0,0 +1,76 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for catching N+1 regressions on list endpoints.
+
+    assertFlatQueryCount() hits an endpoint, grows the data behind it and hits it
+    again; the number of queries must not change, and must stay within max_queries
+    when one is given. assertPermissionQueries() counts the queries a viewset's
+    permission checks make on their own.
+    """
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            response = func()
+        return response, len(context.captured_queries), context.captured_queries
+
+    def assertFlatQueryCount(self, url, grow, max_queries=None, client=None):
+        client = client or self.client
+
+        response, before, _ = self.count_queries(lambda: client.get(url))
+        self.assertEqual(response.status_code, 200, response.content)
+        size_before = len(self._results(response))
+
+        grow()
+
+        response, after, queries = self.count_queries(lambda: client.get(url))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertGreater(len(self._results(response)), size_before,
+                           f"{url} returned no extra rows, the budget check proves nothing")
+
+        sql = '\n'.join(query['sql'] for query in queries)
+        self.assertEqual(before, after,
+                         f"{url} went from {before} to {after} queries as the page grew:\n{sql}")
+        if max_queries is not None:
+            self.assertLessEqual(after, max_queries,
+                                 f"{url} took {after} queries, budget is {max_queries}:\n{sql}")
+
+    def assertPermissionQueries(self, viewset, action, method, user, pk, max_queries=0):
+        """
+        Run `viewset`'s permission checks for `method` on object `pk`, as `user`.
+
+        The object is loaded through the viewset's own get_queryset() first, the
+        way get_object() does; only the has_permission / has_object_permission
+        calls are counted. Returns whether the request was allowed.
+        """
+        request = getattr(APIRequestFactory(), method.lower())('/', HTTP_HOST='localhost')
+        force_authenticate(request, user=user)
+        view = viewset()
+        view.action_map = {method.lower(): action}
+        view.setup(request, pk=pk)
+        view.format_kwarg = None
+        view.request = view.initialize_request(request)
+        obj = view.get_queryset().get(pk=pk)
+
+        def check():
+            try:
+                view.check_permissions(view.request)
+                view.check_object_permissions(view.request, obj)
+            except PermissionDenied:
+                return False
+            return True
+
+        allowed, count, queries = self.count_queries(check)
+        sql = '\n'.join(query['sql'] for query in queries)
+        self.assertLessEqual(count, max_queries,
+                             f"{viewset.__name__}.{action} as {user.role}: permission checks took {count} queries:\n{sql}")
+        return allowed
+
+    def _results(self, response):
+        data = response.data
+        return data['results'] if isinstance(data, dict) and 'results' in data else data
@@ -1,21 +1,44 @@
 from rest_framework import viewsets, status, filters, views, permissions
-from .models import User, Merchant, Category, Product, Order, OrderItem, OrderStatusHistory, Notification
+from .models import User, Merchant, Category, Product, Order, OrderItem, OrderStatusHistory, Notification, MerchantDailySales, ProductDailySales
 from .serializers import UserSerializer, MerchantSerializer, CategorySerializer, ProductSerializer, OrderSerializer, OrderItemSerializer, OrderStatusHistorySerializer, NotificationSerializer, MerchantSerializer 
-from .permissions import IsVendor, IsAdmin, ReadOnly, IsOwnerOrAdmin
+from .permissions import IsVendor, IsAdmin, IsCourier, IsCustomer, ReadOnly, IsOwnerOrAdmin
+from .pagination import FeedPagination
+from .outbox import enqueue_email
+from .menu import get_menu
+from .search import InvertedIndexSearchFilter
+from .events import format_sse, get_broker, user_channel
+from .unread import adjust_unread, unread_count
+from .retention import delete_in_chunks
+from .dispatch import record_ping
+from .pricing import QuotedMerchants
+from .stats import record_rating
+from .export import export_response
+from .conditional import ConditionalGetMixin
+from .metrics import get_registry
+from .profiling import list_profiles, report_path, stats_path
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action 
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response 
 from django_filters.rest_framework import DjangoFilterBackend
-from django.core.mail import send_mail
 from django.urls import reverse
 from django.contrib.sites.shortcuts import get_current_site
 from api.utils.tokens import account_activation_token
 from django.shortcuts import get_object_or_404
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+import asyncio
+from django.db import transaction
+from django.db.models import F, Prefetch, Sum
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.conf import settings 
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .serializers import EmailTokenObtainPairSerializer
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .serializers import EmailTokenObtainPairSerializer, CheckoutSerializer, CourierLocationSerializer, OrderRatingSerializer
+from .serializers import ExportParamsSerializer, SalesRangeSerializer, SalesTotalsSerializer, DailySalesSerializer, ProductSalesSerializer
 
 
 class EmailTokenObtainPairView(TokenObtainPairView):
@@ -36,13 +59,8 @@ def send_activation_email(request, user):
     If you didn’t create this account, just ignore this email.
     """
 
-    send_mail(
-        subject,
-        message,
-        'no-reply@fooddelivery.com',
-        [user.email],
-        fail_silently=False,
-    )
+    # queued in the caller's transaction; the send_queued_email worker delivers it
+    enqueue_email(subject, message, 'no-reply@fooddelivery.com', [user.email])
 
 def get_permissions(self):
     if self.action == 'create':
@@ -55,8 +73,10 @@ class UserViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
 
     def perform_create(self, serializer):
-        user = serializer.save(is_active=False)
-        send_activation_email(self.request, user)
+        # the user row and its activation email commit (or roll back) together
+        with transaction.atomic():
+            user = serializer.save(is_active=False)
+            send_activation_email(self.request, user)
 
 class ActivateAccountView(views.APIView):
     def get(self, request, uidb64, token):
@@ -72,14 +92,154 @@ class ActivateAccountView(views.APIView):
             return Response({'message': 'Account activated successfully!'}, status=status.HTTP_200_OK)
         return Response({'error': 'Invalid or expired activation link'}, status=status.HTTP_400_BAD_REQUEST)
 
-class MerchantViewSet(viewsets.ModelViewSet):
+class CourierLocationView(views.APIView):
+    """Couriers post their position here every few seconds; see api/dispatch.py."""
+    permission_classes = [IsAuthenticated, IsCourier]
+
+    def post(self, request):
+        serializer = CourierLocationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        record_ping(request.user.pk, data['latitude'], data['longitude'], data.get('on_duty'))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class MetricsView(views.APIView):
+    """Per-route request metrics of this process (api/metrics.py) for Prometheus to scrape."""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return HttpResponse(get_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class ProfileListView(views.APIView):
+    """Profiles taken with `X-Profile: 1` or `?profile=1` (api/profiling.py), newest first."""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response(list_profiles())
+
+class ProfileDetailView(views.APIView):
+    """One profile's report: timings, the SQL log with where each query came from, and the top of the stats."""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request, profile_id):
+        path = report_path(profile_id)
+        try:
+            return FileResponse(open(path, 'rb'), content_type='application/json')
+        except (TypeError, FileNotFoundError):
+            raise Http404
+
+class ProfileDownloadView(views.APIView):
+    """The raw pstats file, for snakeviz, pstats or any other profile viewer."""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request, profile_id):
+        path = stats_path(profile_id)
+        try:
+            return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{profile_id}.prof')
+        except (TypeError, FileNotFoundError):
+            raise Http404
+
+class SalesDashboardMixin:
+    """
+    Range and merchant scoping shared by the dashboards, which read only the
+    daily rollups (api/rollups.py): a request costs the same whatever the order history.
+    """
+    permission_classes = [IsAuthenticated, IsVendor | IsAdmin]
+
+    def get_params(self, request):
+        serializer = SalesRangeSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def scope(self, queryset, request, params):
+        queryset = queryset.filter(day__range=(params['start'], params['end']))
+        if request.user.role != 'admin':
+            queryset = queryset.filter(merchant__user=request.user)
+        if 'merchant' in params:
+            queryset = queryset.filter(merchant_id=params['merchant'])
+        return queryset.order_by()
+
+class SalesDashboardView(SalesDashboardMixin, views.APIView):
+    """Revenue, orders, items and cancellations per day, and over the range."""
+
+    def get(self, request):
+        params = self.get_params(request)
+        rollups = self.scope(MerchantDailySales.objects.all(), request, params)
+        sums = {field: Sum(field) for field in ('revenue', 'orders', 'items', 'cancelled')}
+        days = rollups.values('day').annotate(**sums).order_by('day')
+        totals = {field: value or 0 for field, value in rollups.aggregate(**sums).items()}
+        return Response({
+            'start': params['start'],
+            'end': params['end'],
+            'totals': SalesTotalsSerializer(totals).data,
+            'days': DailySalesSerializer(days, many=True).data,
+        })
+
+class TopProductsView(SalesDashboardMixin, views.APIView):
+    """The best-selling products over the range, by revenue, quantity or orders."""
+
+    def get(self, request):
+        params = self.get_params(request)
+        products = (self.scope(ProductDailySales.objects.all(), request, params)
+                    .values('product_id', 'product__name', 'merchant_id')
+                    .annotate(revenue=Sum('revenue'), orders=Sum('orders'), quantity=Sum('quantity'), cancelled=Sum('cancelled'))
+                    .order_by(f"-{params['ordering']}", 'product_id')[:params['limit']])
+        return Response({
+            'start': params['start'],
+            'end': params['end'],
+            'products': ProductSalesSerializer(products, many=True).data,
+        })
+
+async def event_stream(request):
+    """
+    Server-Sent Events feed of the user's order status changes and new notifications.
+
+    Authenticate with the usual `Authorization: Bearer <access>` header, or
+    `?token=<access>` since browsers' EventSource can't set headers. Needs the
+    ASGI entry point: under WSGI an endless response would tie up a worker.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'The event stream is only served over ASGI'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    header = request.headers.get('Authorization', '')
+    raw_token = header[7:] if header.startswith('Bearer ') else request.GET.get('token', '')
+    try:
+        user_id = AccessToken(raw_token)[jwt_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return JsonResponse({'error': 'Invalid or expired token'}, status=status.HTTP_401_UNAUTHORIZED)
+    if not await User.objects.filter(pk=user_id, is_active=True).aexists():
+        return JsonResponse({'error': 'Invalid or expired token'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    heartbeat = getattr(settings, 'EVENT_STREAM_HEARTBEAT', 15)
+
+    async def stream():
+        async with get_broker().subscribe(user_channel(user_id)) as queue:
+            yield ': connected\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'  # keeps proxies from closing an idle stream
+                    continue
+                yield format_sse(event)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class MerchantViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Merchant.objects.all()
     serializer_class = MerchantSerializer
     permission_classes = [IsAuthenticated, IsVendor | IsAdmin | ReadOnly, IsOwnerOrAdmin]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]  
+    filter_backends = [DjangoFilterBackend, InvertedIndexSearchFilter, filters.OrderingFilter]
     filterset_fields = ['merchant_type', 'city', 'status']
-    search_fields = ['name', 'description', 'city']
-    ordering_fields = ['rating', 'delivery_fee', 'prep_time_avg']
+    # ?search= ranks name, city and description matches (weights in api/search.py)
+    # ?lat=&lng= prices every merchant for that customer, which adds ?ordering=distance,
+    # delivery_fee or eta and ?max_fee=, max_eta=, max_distance= (see api/pricing.py)
+    ordering_fields = ['rating', 'prep_time_avg']
+    # ratings and prep times (and so quotes) live on MerchantStats
+    conditional_fields = ('updated_at', 'stats_updated_at')
 
     def get_queryset(self):
         user = self.request.user
@@ -92,15 +252,60 @@ class MerchantViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user) 
 
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if 'lat' not in params and 'lng' not in params:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_list(request, lambda: self.priced_list(request))
+
+    def priced_list(self, request):
+        params = request.query_params
+        try:
+            latitude, longitude = float(params['lat']), float(params['lng'])
+            limits = {name: float(params[name]) if params.get(name) else None
+                      for name in ('max_fee', 'max_eta', 'max_distance')}
+        except (KeyError, ValueError):
+            raise ValidationError({'detail': 'lat and lng must both be numbers, as must max_fee, max_eta and max_distance.'})
+        merchants = QuotedMerchants(self.filter_queryset(self.get_queryset()), latitude, longitude,
+                                    ordering=params.get('ordering'), **limits)
+        page = self.paginate_queryset(merchants)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(merchants[:], many=True).data)
+
     def get_queryset(self):
         user = self.request.user
         # Admins can see all merchants; vendors only see their own
         if user.is_authenticated and user.role in ['vendor', 'admin']:
-            return Merchant.objects.filter(user=user) if user.role == 'vendor' else Merchant.objects.all()
-        # Customers see only open & approved merchants
-        return Merchant.objects.filter(is_open=True, status='approved')
+            queryset = Merchant.objects.filter(user=user) if user.role == 'vendor' else Merchant.objects.all()
+        else:
+            # Customers see only open & approved merchants
+            queryset = Merchant.objects.filter(is_open=True, status='approved')
+        # the running rating lives in MerchantStats (api/stats.py)
+        return queryset.annotate(rating=F('stats__rating'), stats_updated_at=F('stats__updated_at'))
 
-class CategoryViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def menu(self, request, pk=None):
+        """Categories and available products of one merchant, served from the menu cache."""
+        try:
+            menu = get_menu(int(pk))
+        except (TypeError, ValueError):
+            raise Http404
+        # same visibility rules as get_queryset, checked against the cached document
+        # so a warm read never touches the database
+        if menu is None or not self.menu_visible(request.user, menu['merchant']):
+            raise Http404
+        return Response(menu)
+
+    @staticmethod
+    def menu_visible(user, merchant):
+        if user.role == 'admin':
+            return True
+        if user.role == 'vendor':
+            return merchant['user'] == user.pk
+        return merchant['is_open'] and merchant['status'] == 'approved'
+
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated, IsVendor | IsAdmin | ReadOnly]
@@ -113,55 +318,125 @@ class CategoryViewSet(viewsets.ModelViewSet):
             return Category.objects.filter(merchant__user=user)
         return Category.objects.none()
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated, IsVendor | IsAdmin | ReadOnly, IsOwnerOrAdmin]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, InvertedIndexSearchFilter, filters.OrderingFilter]
     filterset_fields = ['is_available', 'category__merchant__city']
-    search_fields = ['name', 'description']
+    # ?search= ranks name and description matches (weights in api/search.py)
     ordering_fields = ['price', 'stock']
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'admin':
-            return Product.objects.all()
+            queryset = Product.objects.all()
         elif user.role == 'vendor':
-            return Product.objects.filter(category__merchant__user=user)
-        return Product.objects.filter(is_available=True)
+            queryset = Product.objects.filter(category__merchant__user=user)
+        else:
+            queryset = Product.objects.filter(is_available=True)
+        if self.request.method not in permissions.SAFE_METHODS:
+            # IsOwnerOrAdmin reads the owner off this annotation instead of walking category -> merchant
+            queryset = queryset.annotate(category_merchant_user_id=F('category__merchant__user_id'))
+        return queryset
 
     
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer 
     permission_classes = [IsAuthenticated, IsVendor | IsAdmin | ReadOnly]
+    pagination_class = FeedPagination
+    cursor_ordering = ('-created_at', '-id')
 
-    def update(self, request, *args, **kwargs):
-        user = request.user
-        instance = self.get_object()
-        instance._updated_by = user
+    # exported columns -> values_list() paths; no nested serializers, one row per order
+    export_columns = {
+        'id': 'id', 'created_at': 'created_at', 'status': 'status',
+        'merchant': 'merchant_id', 'merchant_name': 'merchant__name',
+        'customer': 'customer_id', 'courier': 'courier_id',
+        'subtotal': 'subtotal', 'fee': 'fee', 'total': 'total', 'rating': 'rating',
+    }
 
-    def get_queryset(self):
+    def scoped_queryset(self):
+        """The orders the user may see, before anything the serializer or pipeline needs."""
         user = self.request.user
         if user.role == 'admin':
             return Order.objects.all()
         elif user.role == 'vendor':
-            return Order.objects.filter(merchant__user = user)
+            return Order.objects.filter(merchant__user=user)
         elif user.role == 'customer':
             return Order.objects.filter(customer=user)
         elif user.role == 'courier':
             return Order.objects.filter(courier=user)
         return Order.objects.none()
-        
+
+    def get_queryset(self):
+        queryset = self.scoped_queryset()
+
+        # Load the whole OrderSerializer tree up front: courier_name, items -> product_name
+        # and status_history -> changed_by_name, so a page costs a fixed number of queries
+        queryset = queryset.select_related('courier').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product')),
+            Prefetch('status_history', queryset=OrderStatusHistory.objects.select_related('changed_by').order_by('changed_at', 'id')),
+        )
+        if self.request.method not in permissions.SAFE_METHODS:
+            # the status pipeline needs the merchant owner to notify the vendor
+            queryset = queryset.select_related('merchant')
+        return queryset.order_by('-created_at', '-id')
+
     def perform_create(self, serializer):
         serializer.save(customer=self.request.user)
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsCustomer])
+    def checkout(self, request):
+        """Place an order for a whole cart: one query to price it, one transaction to save it."""
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save(customer=request.user)
+        order = self.get_queryset().get(pk=order.pk)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin | IsVendor])
+    def export(self, request):
+        """Stream every matching order as CSV or NDJSON (?output=), filtered by ?start=, ?end= and ?status=."""
+        params = ExportParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        queryset = self.scoped_queryset().filter(**params.filters())
+        return export_response(request, queryset, self.export_columns, ('created_at', 'id'),
+                               params.validated_data['output'], 'orders')
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsCustomer])
+    def rate(self, request, pk=None):
+        """Rate a delivered order 1-5, once; folds into the merchant's running rating."""
+        serializer = OrderRatingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rating = serializer.validated_data['rating']
+        with transaction.atomic():
+            rated = (Order.objects
+                     .filter(pk=pk, customer=request.user, status='delivered', rating__isnull=True)
+                     .update(rating=rating))
+            if not rated:
+                return Response({'error': 'Only your delivered orders can be rated, once.'}, status=status.HTTP_400_BAD_REQUEST)
+            record_rating(Order.objects.values_list('merchant_id', flat=True).get(pk=pk), rating)
+        return Response({'rating': rating})
+
+    def perform_update(self, serializer):
+        # the instance came from get_object(), so the status pipeline already
+        # knows the previous status; it only needs to know who changed it
+        serializer.instance._updated_by = self.request.user
+        serializer.save()
+
 class OrderItemViewSet(viewsets.ModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer 
     permission_classes = [IsAuthenticated, IsVendor | IsAdmin | ReadOnly]
 
-    def get_queryset(self):
+    export_columns = {
+        'id': 'id', 'order': 'order_id', 'order_created_at': 'order__created_at', 'order_status': 'order__status',
+        'merchant': 'order__merchant_id', 'product': 'product_id', 'product_name': 'product__name',
+        'quantity': 'quantity', 'price': 'price', 'total_price': 'total_price',
+    }
+
+    def scoped_queryset(self):
         user = self.request.user
         if user.role == 'admin':
             return OrderItem.objects.all()
@@ -170,29 +445,63 @@ class OrderItemViewSet(viewsets.ModelViewSet):
         elif user.role == 'vendor':
             return OrderItem.objects.filter(order__merchant__user=user)
         return OrderItem.objects.none()
+
+    def get_queryset(self):
+        # product_name is read for every row
+        return self.scoped_queryset().select_related('product').order_by('id')
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin | IsVendor])
+    def export(self, request):
+        """Stream the items of every matching order; same parameters as /orders/export/."""
+        params = ExportParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        queryset = self.scoped_queryset().filter(**params.filters(prefix='order__'))
+        return export_response(request, queryset, self.export_columns, ('order_id', 'id'),
+                               params.validated_data['output'], 'order-items')
     
 class OrderStatusHistoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = OrderStatusHistory.objects.all().select_related('order', 'changed_by')
+    # changed_by_name is the only relation the serializer reads
+    queryset = OrderStatusHistory.objects.all().select_related('changed_by').order_by('-changed_at', '-id')
     serializer_class = OrderStatusHistorySerializer
     permission_classes = [IsAuthenticated, IsAdmin | ReadOnly]
+    pagination_class = FeedPagination
+    cursor_ordering = ('-changed_at', '-id')
 
 class NotificationViewSet(viewsets.ModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['is_read']  # allow filtering by read/unread
+    pagination_class = FeedPagination
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         # Only show notifications for the logged-in user
-        return Notification.objects.filter(recipient=self.request.user).order_by('-created_at')
+        return Notification.objects.filter(recipient=self.request.user).order_by('-created_at', '-id')
 
     def perform_update(self, serializer):
-        # mark notifications as read
-        serializer.save(is_read=True)
+        # mark notifications as read, counting it off only if this request flipped it
+        with transaction.atomic():
+            flipped = Notification.objects.filter(pk=serializer.instance.pk, is_read=False).update(is_read=True)
+            serializer.save(is_read=True)
+            adjust_unread([serializer.instance.recipient_id], -flipped)
 
+    def perform_destroy(self, instance):
+        # count it off only if this request deleted it while it was still unread
+        with transaction.atomic():
+            unread, _ = Notification.objects.filter(pk=instance.pk, is_read=False).delete()
+            if not unread:
+                instance.delete()
+            adjust_unread([instance.recipient_id], -unread)
+
+    @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
         """Mark all notifications as read for the logged-in user."""
         user = request.user
-        updated_count = Notification.objects.filter(recipient=user, is_read=False).update(is_read=True)
+        with transaction.atomic():
+            updated_count = Notification.objects.filter(recipient=user, is_read=False).update(is_read=True)
+            adjust_unread([user.pk], -updated_count)
         return Response(
             {"message": f"{updated_count} notifications marked as read."},
             status=status.HTTP_200_OK
@@ -202,7 +511,8 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def clear_all(self, request):
         """Delete all notifications for the logged-in user."""
         user = request.user
-        deleted_count, _ = Notification.objects.filter(recipient=user).delete()
+        # bounded chunks, so a heavy user doesn't lock the table with one huge DELETE
+        deleted_count = delete_in_chunks(Notification.objects.filter(recipient=user))['deleted']
         return Response(
             {"message": f"{deleted_count} notifications deleted."},
             status=status.HTTP_200_OK
@@ -210,15 +520,4 @@ class NotificationViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-        return Response({"unread_count": count})
-    
-class NotificationViewSet(viewsets.ModelViewSet):
-    queryset = Notification.objects.all()
-    serializer_class = NotificationSerializer
-    permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['is_read']  # allow filtering by read/unread
-
-    def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user).order_by('-created_at')    
+        return Response({"unread_count": unread_count(request.user.pk)})
@@ -51,6 +51,12 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # first, so its latency covers every other middleware too
+    'api.metrics.MetricsMiddleware',
+    # admins profile a single request with `X-Profile: 1`; see api/profiling.py
+    'api.profiling.ProfilingMiddleware',
+    # sends the reads of safe requests to DATABASE_REPLICAS; see api/replicas.py
+    'api.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -95,6 +101,16 @@ DATABASES = {
     }
 }
 
+# Read replicas: DB_REPLICA_HOSTS=host1,host2 adds a 'replica1', 'replica2', ...
+# alias per host with the primary's schema and credentials. Safe requests read
+# from one of them; see api/replicas.py
+DATABASE_REPLICAS = []
+for number, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['api.replicas.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 5  # a user's reads stay on the primary this long after they write
+
 
 
 # Password validation
@@ -140,7 +156,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES':(
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # builds request.user from token claims; see api/authentication.py
+        'api.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -150,7 +167,73 @@ REST_FRAMEWORK = {
                                 'rest_framework.filters.OrderingFilter',],
 }
 
+# Cache
+# LocMemCache is per process: menu version bumps only reach the process that
+# made the change. Point this at Redis or Memcached when running several workers,
+# e.g. with REDIS_URL=redis://host:6379/0; with read replicas a shared cache is
+# required, since the read-your-writes pins live in it (see api/replicas.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['REDIS_URL']}
+
+MENU_CACHE_TIMEOUT = 60 * 60 * 24  # seconds a menu version is kept
+UNREAD_CACHE_TIMEOUT = 60 * 5  # seconds an unread badge count is kept
+AUTH_VERSION_CACHE_TIMEOUT = 60  # seconds a user's token version is trusted without a query
+AUTH_USER_CACHE_TIMEOUT = 30  # seconds the row behind a token-built user is kept, password hash aside
+
+# Flat delivery fee added to every checkout
+DELIVERY_FEE = '2.00'
+# Distance pricing and ETAs on merchant listings (api/pricing.py): the flat fee
+# covers DELIVERY_FEE_INCLUDED_KM, every further kilometre adds DELIVERY_FEE_PER_KM
+DELIVERY_FEE_PER_KM = '0.50'
+DELIVERY_FEE_INCLUDED_KM = 2
+COURIER_SPEED_KMH = 25
+DELIVERY_PICKUP_MINUTES = 5
+# Weight of the newest order in a merchant's moving average preparation time (api/stats.py)
+MERCHANT_PREP_EMA_ALPHA = 0.2
+
+# Server-Sent Events: broker class and seconds between keepalive comments
+EVENT_BROKER = 'api.events.InProcessBroker'
+EVENT_STREAM_HEARTBEAT = 15
+
+# Seconds a checkout holds its stock before the order must be confirmed
+STOCK_RESERVATION_TTL = 15 * 60
+# Times taking sharded stock re-reads the shards after losing a race for them
+STOCK_TAKE_ATTEMPTS = 3
+
+# Seconds notifications are kept before purge_notifications deletes them (None keeps them)
+NOTIFICATION_TTL_READ = 30 * 24 * 60 * 60
+NOTIFICATION_TTL_UNREAD = 180 * 24 * 60 * 60
+NOTIFICATION_DELETE_CHUNK_SIZE = 1000  # rows per DELETE when purging or clearing
+
+# Courier dispatch: grid cell size of the in-memory index (0.01 deg is ~1.1 km)
+# and how far from the merchant a courier may be to get an order
+DISPATCH_CELL_DEGREES = 0.01
+DISPATCH_MAX_DISTANCE_KM = 15
+
+# Upper bounds (seconds) of the request latency histogram served at /metrics
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Where profiled requests are written, and how many are kept before the oldest go
+PROFILING_DIR = BASE_DIR / 'var' / 'profiles'
+PROFILING_MAX_FILES = 50
+
+# Serve the hottest GETs natively under ASGI (api/async_views.py); False sends them to the viewsets
+ASYNC_READ_VIEWS = True
+
+# Rows fetched per database round trip, and rendered per response chunk, by the order exports
+EXPORT_CHUNK_SIZE = 2000
+
 #Email Testing
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Outbox (api/outbox.py): sends tried before an email is marked failed, and how long
+# a worker's claim on a batch lasts before another worker may pick it up
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_LEASE_SECONDS = 600
+
 SITE_URL = "http://127.0.0.1:8000"
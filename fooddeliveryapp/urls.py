@@ -2,10 +2,10 @@ from django.contrib import admin
 from django.conf import settings 
 from django.urls import path, include
 from django.http import JsonResponse 
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework.permissions import AllowAny, IsAdminUser
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
-from api.views import ActivateAccountView
+from api.views import ActivateAccountView, EmailTokenObtainPairView, MetricsView
 
 def home(request):
     return JsonResponse({
@@ -33,9 +33,10 @@ urlpatterns = [
     path('', home),
     path('admin/', admin.site.urls),
     path('api/v1/', include('api.urls')),
-    path('api/v1/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/v1/token/', EmailTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/v1/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('api/v1/activate/<uidb64>/<token>', ActivateAccountView.as_view(), name='activate')
+    path('api/v1/activate/<uidb64>/<token>', ActivateAccountView.as_view(), name='activate'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 
 ]
 